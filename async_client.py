@@ -0,0 +1,354 @@
+import asyncio
+import http.client
+import io
+import json
+import time
+import weakref
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlsplit
+import chess
+from chess import Board, Color, Position
+import client
+from client import CachedGame, EventParser, DELTA_LIMIT, RETRY_STATUSES
+
+# errors that mean a kept alive connection was closed by the server while it sat idle
+STALE_ERRORS = (asyncio.IncompleteReadError, ConnectionResetError, BrokenPipeError, http.client.RemoteDisconnected)
+
+
+async def _read_head(reader):
+    """the http version, status and headers of a response, the headers as an http.client.HTTPMessage"""
+    status_line = await reader.readline()
+    if not status_line:
+        raise http.client.RemoteDisconnected("connection closed before a response")
+    version, status, _ = status_line.decode("latin-1").split(" ", 2)
+    lines = []
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        lines.append(line)
+    headers = http.client.parse_headers(io.BytesIO(b"".join(lines) + b"\r\n"))
+    return version, int(status), headers
+
+async def _read_body(reader, status, headers):
+    """yields the body of a response piece by piece, undoing chunked encoding"""
+    if status in (204, 304) or 100 <= status < 200:
+        return
+    if headers.get("Transfer-Encoding", "").lower() == "chunked":
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            if size == 0:
+                await reader.readline()
+                return
+            yield await reader.readexactly(size)
+            await reader.readexactly(2)
+    elif headers.get("Content-Length") is not None:
+        yield await reader.readexactly(int(headers["Content-Length"]))
+    else:
+        # the body runs until the server closes the connection
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                return
+            yield data
+
+def _request_bytes(method, host, path, body, headers):
+    lines = [method + " " + path + " HTTP/1.1", "Host: " + host]
+    headers = dict(headers)
+    if body is not None:
+        headers["Content-Length"] = str(len(body))
+    lines += [key + ": " + value for key, value in headers.items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + (body or b"")
+
+
+class AsyncConnectionPool:
+    """The asyncio counterpart of client.ConnectionPool: keep-alive HTTP/1.1 connections to one
+    server shared by every game talking to it. At most size requests are in flight at once,
+    the rest wait their turn rather than opening ever more connections."""
+
+    def __init__(self, url, size=16, timeout=10.0, retries=3, backoff_seconds=0.1):
+        parts = urlsplit(url)
+        self.ssl = parts.scheme == "https"
+        self.host = parts.hostname
+        self.port = parts.port or (443 if self.ssl else 80)
+        self.netloc = parts.netloc
+        self.size = size
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+        self.idle = []
+        self.slots = asyncio.Semaphore(size)
+        self.stats = {"requests": 0, "retries": 0, "connections": 0, "seconds": 0.0, "max_seconds": 0.0}
+
+    @classmethod
+    def for_url(constructor, url):
+        """the pool shared by everything talking to url's server from the running event loop"""
+        pools = _pools.setdefault(asyncio.get_running_loop(), {})
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        if key not in pools:
+            pools[key] = constructor(url)
+        return pools[key]
+
+    async def open(self):
+        self.stats["connections"] += 1
+        return await asyncio.open_connection(self.host, self.port, ssl=self.ssl or None)
+
+    async def request(self, method, path, body=None, headers={}, idempotent=False):
+        """returns the status, headers and body of the response. connection failures raise URLError"""
+        start = time.monotonic()
+        attempt = 0
+        async with self.slots:
+            while True:
+                reused = bool(self.idle)
+                try:
+                    connection = self.idle.pop() if reused else await asyncio.wait_for(self.open(), self.timeout)
+                    status, response_headers, data, keep = await asyncio.wait_for(
+                        self._exchange(connection, method, path, body, headers), self.timeout)
+                except (http.client.HTTPException, OSError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+                    stale = reused and isinstance(e, STALE_ERRORS)
+                    if not stale and (not idempotent or attempt >= self.retries):
+                        self._record(start)
+                        raise URLError(e)
+                    self.stats["retries"] += 1
+                    if not stale:
+                        await asyncio.sleep(self.backoff_seconds * 2 ** attempt)
+                        attempt += 1
+                    continue
+                if keep and len(self.idle) < self.size:
+                    self.idle.append(connection)
+                else:
+                    connection[1].close()
+                if idempotent and status in RETRY_STATUSES and attempt < self.retries:
+                    self.stats["retries"] += 1
+                    await asyncio.sleep(self.backoff_seconds * 2 ** attempt)
+                    attempt += 1
+                    continue
+                self._record(start)
+                return status, response_headers, data
+
+    async def _exchange(self, connection, method, path, body, headers):
+        reader, writer = connection
+        try:
+            writer.write(_request_bytes(method, self.netloc, path, body, headers))
+            await writer.drain()
+            version, status, response_headers = await _read_head(reader)
+            data = b"".join([piece async for piece in _read_body(reader, status, response_headers)])
+        except BaseException:
+            writer.close()
+            raise
+        keep = (version == "HTTP/1.1" and response_headers.get("Connection", "").lower() != "close"
+                and (response_headers.get("Content-Length") is not None
+                     or response_headers.get("Transfer-Encoding", "").lower() == "chunked"
+                     or status in (204, 304)))
+        return status, response_headers, data, keep
+
+    def _record(self, start):
+        elapsed = time.monotonic() - start
+        self.stats["requests"] += 1
+        self.stats["seconds"] += elapsed
+        self.stats["max_seconds"] = max(self.stats["max_seconds"], elapsed)
+
+    def close(self):
+        idle, self.idle = self.idle, []
+        for reader, writer in idle:
+            writer.close()
+
+# the shared pools handed out by AsyncConnectionPool.for_url, by event loop and then scheme and host
+_pools = weakref.WeakKeyDictionary()
+
+
+class AsyncGameConnection(CachedGame):
+    """GameConnection for asyncio, so one process can play many games at once without a thread
+    apiece. Every game on a server shares one AsyncConnectionPool, and wait_for_turn listens
+    to the server's /events stream rather than polling. Make them with connect or new_game."""
+
+    def __init__(self, base_url, wire_format="packed", pool=None):
+        CachedGame.__init__(self, base_url, wire_format)
+        self.pool = pool
+
+    @classmethod
+    async def connect(constructor, base_url, wire_format="packed", pool=None):
+        conn = constructor(base_url, wire_format, pool or AsyncConnectionPool.for_url(base_url))
+        await conn._validate() # does the first load
+        return conn
+
+    @classmethod
+    async def new_game(constructor, server_url, pool=None):
+        """creates a fresh game on the server and connects to it"""
+        pool = pool or AsyncConnectionPool.for_url(server_url)
+        resp = await _post(pool, server_url + "/games", {})
+        return await constructor.connect(server_url + "/games/" + resp["id"], pool=pool)
+
+    async def _get(self, path, conditional=False, idempotent=True, etag=None, **kwargs):
+        url = self._url(path, **kwargs)
+        status, headers, body = await self.pool.request("GET", url,
+                                                        headers=self._request_headers(url, conditional, etag),
+                                                        idempotent=idempotent)
+        return self._response(url, conditional, status, headers, body, etag)
+
+    def stats(self):
+        """request counts and latency for this connection's server, see AsyncConnectionPool"""
+        return dict(self.pool.stats)
+
+    async def _validate(self):
+        if self.invalidated:
+            try:
+                resp = await self._get("/changes", etag=self._version, since=self._version or "", limit=DELTA_LIMIT)
+            except HTTPError:
+                # an older server without /changes
+                self._load_from_response(await self._get("/board"))
+                self.invalidated = False
+                return
+            if resp is None:
+                self._load_unchanged()
+            else:
+                self._load_changes(resp)
+
+    async def board(self):
+        await self._validate()
+        return self._cached_board
+
+    async def turn(self):
+        return await self._get("/turn", conditional=True)
+
+    async def moves(self, square=None):
+        if square is None:
+            return await self._get("/moves", conditional=True)
+        return await self._get("/moves", conditional=True, **{"from": square})
+
+    async def history(self, since=0, limit=None):
+        if limit is None:
+            return await self._get("/history", since=since)
+        return await self._get("/history", since=since, limit=limit)
+
+    async def move(self, begin, end, promotion=None):
+        resp = await self._get("/move", idempotent=False, **self._move_args(begin, end, promotion))
+        return self._load_move(begin, end, resp, promotion)
+
+    async def move_many(self, moves, atomic=False):
+        entries = [client._batch_entry(move) for move in moves]
+        resp = await _post(self.pool, self.base_url + "/batch", {"moves": entries, "atomic": atomic})
+        own = [result["game"] for entry, result in zip(entries, resp["results"]) if "game" not in entry]
+        if own:
+            self._load_from_response(resp["games"][own[0]])
+        else:
+            self.refresh()
+        return resp["results"]
+
+    async def reset(self):
+        resp = await self._get("/reset", idempotent=False)
+        return self._load_from_response(resp)
+
+    async def events(self, since=None):
+        """yields the game state pushed by the server every time a move or reset happens. the
+        stream has a connection of its own, since it holds on to it for as long as it's open"""
+        reader, writer = await self.pool.open()
+        try:
+            url = self._url("/events", **({"since": since} if since is not None else {}))
+            writer.write(_request_bytes("GET", self.pool.netloc, url, None, {"Accept": "text/event-stream"}))
+            await writer.drain()
+            version, status, headers = await _read_head(reader)
+            client._check(self.base_url + "/events", status, headers)
+            parser = EventParser()
+            pending = b""
+            async for piece in _read_body(reader, status, headers):
+                pending += piece
+                *lines, pending = pending.split(b"\n")
+                for line in lines:
+                    state = parser.feed(line + b"\n")
+                    if state is not None:
+                        yield state
+        finally:
+            writer.close()
+
+    async def wait_for_turn(self, color, poll_seconds=5):
+        """waits until it is color's turn, listening for pushed changes if the server supports them"""
+        color = str(color)
+        try:
+            async for state in self.events():
+                if state["current_player"] == color:
+                    self.refresh()
+                    return state
+        except (HTTPError, URLError, OSError, asyncio.IncompleteReadError):
+            pass
+        while (await self.turn())["current_player"] != color:
+            await asyncio.sleep(poll_seconds)
+        self.refresh()
+        return await self.turn()
+
+
+async def _post(pool, url, body):
+    status, headers, data = await pool.request("POST", urlsplit(url).path, body=json.dumps(body).encode('utf8'),
+                                               headers={"Content-Type": "application/json"})
+    client._check(url, status, headers)
+    return json.loads(data.decode('utf8'))
+
+async def move_many(server_url, moves, atomic=False, pool=None):
+    """plays moves across any number of games on one server in a single round trip,
+    moves are dicts with "game", "begin", "end" and optionally "promotion" """
+    pool = pool or AsyncConnectionPool.for_url(server_url)
+    return await _post(pool, server_url + "/batch",
+                       {"moves": [client._batch_entry(move) for move in moves], "atomic": atomic})
+
+
+class AsyncMockGameConnection:
+    """an in process game with the same surface as AsyncGameConnection, for tests and offline play"""
+
+    def __init__(self):
+        self.changed = asyncio.Condition()
+        self._reset()
+
+    def _reset(self):
+        self._board = Board.from_notation(chess.STARTING_NOTATION)
+        self.turn_count = 1
+        self.cur_player = Color.white
+        self._history = chess.MoveLog()
+
+    def _next_turn(self):
+        if self.cur_player == Color.white:
+            self.cur_player = Color.black
+        else:
+            self.turn_count += 1
+            self.cur_player = Color.white
+
+    def refresh(self):
+        # no op because it's all local
+        pass
+
+    async def board(self):
+        return self._board
+
+    async def turn(self):
+        return {"turn": self.turn_count, "current_player": self.cur_player}
+
+    async def moves(self, square=None):
+        square = Position.from_notation(str(square)) if square is not None else None
+        to_move = self._board.to_move
+        return {"moves": [move.to_notation() for move in self._board.legal_moves(to_move)
+                          if square is None or move.begin is square],
+                "current_player": str(to_move), "status": self._board.status(to_move)}
+
+    async def history(self, since=0, limit=None):
+        return self._history.page(since, limit)
+
+    async def move(self, begin, end, promotion=None):
+        move = client._legal_move(self._board, begin, end, promotion)
+        piece = self._board.at(move.begin).NOTATION
+        self._board.make(move)
+        self._history.append(move, piece)
+        self._next_turn()
+        async with self.changed:
+            self.changed.notify_all()
+        return await self.turn()
+
+    async def reset(self):
+        self._reset()
+        async with self.changed:
+            self.changed.notify_all()
+        return await self.turn()
+
+    async def wait_for_turn(self, color, poll_seconds=5):
+        async with self.changed:
+            await self.changed.wait_for(lambda: str(self.cur_player) == str(color))
+        return await self.turn()
@@ -0,0 +1,402 @@
+import time
+import chess
+from chess import Board, Color, Move, Position, Piece, Pawn, Rook, Knight, Bishop, Queen, King, PROMOTIONS
+
+# squares are indexed as row * 8 + col, so A1 is bit 0, H1 is bit 7 and H8 is bit 63
+SQUARES = chess.POSITIONS
+
+def index_of(position):
+    row, col = position
+    return row * 8 + col
+
+def bit(position):
+    return 1 << index_of(position)
+
+def positions_of(bitboard):
+    positions = []
+    while bitboard:
+        lowest = bitboard & -bitboard
+        positions.append(SQUARES[lowest.bit_length() - 1])
+        bitboard ^= lowest
+    return positions
+
+
+def _leaper_table(offsets):
+    table = []
+    for square in SQUARES:
+        mask = 0
+        for offset in offsets:
+            target = square + offset
+            if target.in_bounds:
+                mask |= bit(target)
+        table.append(mask)
+    return table
+
+def _ray_table(delta):
+    table = []
+    for square in SQUARES:
+        mask = 0
+        target = square + delta
+        while target.in_bounds:
+            mask |= bit(target)
+            target = target + delta
+        table.append(mask)
+    return table
+
+KNIGHT_ATTACKS = _leaper_table(Knight.MOVE_OFFSETS)
+KING_ATTACKS = _leaper_table(King.MOVE_OFFSETS)
+PAWN_ATTACKS = {color: _leaper_table(Pawn.ATTACK_OFFSETS[color]) for color in Color}
+
+# rays in the "positive" directions walk towards H8, so their nearest blocker is the lowest set bit.
+# rays in the "negative" directions walk towards A1, so their nearest blocker is the highest set bit.
+POSITIVE_DIRECTIONS = [(1, 0), (0, 1), (1, 1), (1, -1)]
+NEGATIVE_DIRECTIONS = [(-1, 0), (0, -1), (-1, -1), (-1, 1)]
+RAYS = {delta: _ray_table(delta) for delta in POSITIVE_DIRECTIONS + NEGATIVE_DIRECTIONS}
+
+ROOK_DIRECTIONS = [(1, 0), (0, 1), (-1, 0), (0, -1)]
+BISHOP_DIRECTIONS = [(1, 1), (1, -1), (-1, -1), (-1, 1)]
+
+
+# each direction's ray table and whether it's a positive one, to save looking both up per ray
+ROOK_RAYS = [(RAYS[delta], delta in POSITIVE_DIRECTIONS) for delta in ROOK_DIRECTIONS]
+BISHOP_RAYS = [(RAYS[delta], delta in POSITIVE_DIRECTIONS) for delta in BISHOP_DIRECTIONS]
+
+def _nearest(blockers, positive):
+    return (blockers & -blockers).bit_length() - 1 if positive else blockers.bit_length() - 1
+
+def _slide(index, occupied, rays):
+    attacks = 0
+    for table, positive in rays:
+        ray = table[index]
+        blockers = ray & occupied
+        if blockers:
+            # everything past the nearest blocker is hidden behind it
+            ray ^= table[_nearest(blockers, positive)]
+        attacks |= ray
+    return attacks
+
+def _between_table():
+    # the squares strictly between two squares on a line, empty if they don't share one
+    table = [[0] * 64 for square in SQUARES]
+    for delta, rays in RAYS.items():
+        for begin in range(64):
+            ray = rays[begin]
+            while ray:
+                end = (ray & -ray).bit_length() - 1
+                ray ^= 1 << end
+                table[begin][end] = rays[begin] & ~rays[end] & ~(1 << end)
+    return table
+
+BETWEEN = _between_table()
+
+ALL_SQUARES = (1 << 64) - 1
+# the rows pawns promote on, and the rows they double move from
+LAST_ROWS = 0xff | 0xff << 56
+PAWN_STEPS = {Color.white: 8, Color.black: -8}
+DOUBLE_MOVE_ROWS = {Color.white: 0xff << 8, Color.black: 0xff << 48}
+
+def _attacked_by(index, occupancy, attack_sets):
+    """the squares of the pieces in attack_sets, see BitBoard._attack_sets, that attack index"""
+    knights, kings, pawns, pawn_attacks, rook_sliders, bishop_sliders = attack_sets
+    attackers = (KNIGHT_ATTACKS[index] & knights) | (KING_ATTACKS[index] & kings) | (pawn_attacks[index] & pawns)
+    if rook_sliders:
+        attackers |= _slide(index, occupancy, ROOK_RAYS) & rook_sliders
+    if bishop_sliders:
+        attackers |= _slide(index, occupancy, BISHOP_RAYS) & bishop_sliders
+    return attackers
+
+
+class BitBoard(Board):
+    """Drop in replacement for chess.Board that also keeps a 64 bit occupancy bitboard
+    per color and per (color, piece type). The 8x8 rows are kept alongside as a mailbox
+    so that at() and board[row][col] still return the piece objects. Legal moves, checks
+    and pins are worked out from the bitboards rather than the pieces."""
+
+    def __init__(self):
+        Board.__init__(self)
+        self.occupancy = 0
+        self.occupied = {color: 0 for color in Color}
+        self.bitboards = {(color, piece_type.NOTATION): 0 for color in Color for piece_type in BIT_PIECE_TYPES}
+
+    def add(self, color, piece_type, position):
+        return Board.add(self, color, BIT_PIECE_TYPES.get(piece_type, piece_type), position)
+
+    def place(self, piece, position):
+        Board.place(self, piece, position)
+        mask = 1 << position.index
+        self.occupancy |= mask
+        self.occupied[piece.color] |= mask
+        self.bitboards[piece.color, piece.NOTATION] |= mask
+
+    def remove(self, position):
+        piece = Board.remove(self, position)
+        mask = ~(1 << position.index)
+        self.occupancy &= mask
+        self.occupied[piece.color] &= mask
+        self.bitboards[piece.color, piece.NOTATION] &= mask
+        return piece
+
+    def empty(self, position):
+        return not (self.occupancy >> index_of(position)) & 1
+
+    def _attack_sets(self, color):
+        """color's knights, king, pawns, pawn attack table and sliders, looked up once so that
+        _attacked_by can be asked about many squares"""
+        bitboards = self.bitboards
+        queens = bitboards[color, "Q"]
+        return (bitboards[color, "N"], bitboards[color, "K"], bitboards[color, "P"], PAWN_ATTACKS[color.opponent],
+                bitboards[color, "R"] | queens, bitboards[color, "B"] | queens)
+
+    def is_attacked(self, position, color, ignore=None):
+        occupancy = self.occupancy
+        if ignore is not None:
+            occupancy &= ~(1 << ignore.position.index)
+        return bool(_attacked_by(position.index, occupancy, self._attack_sets(color)))
+
+    def _pins(self, king, own, attack_sets):
+        """each pinned piece's square to the squares it can still move to, along the pin. own is
+        the king's side's pieces and attack_sets the other side's, from _attack_sets"""
+        occupancy = self.occupancy
+        pins = {}
+        for rays, sliders in ((ROOK_RAYS, attack_sets[4]), (BISHOP_RAYS, attack_sets[5])):
+            if not sliders:
+                continue
+            for table, positive in rays:
+                if not table[king] & sliders:
+                    continue
+                blockers = table[king] & occupancy
+                shield = _nearest(blockers, positive)
+                if not (own >> shield) & 1:
+                    continue
+                behind = table[shield] & occupancy
+                if behind:
+                    pinner = _nearest(behind, positive)
+                    if (sliders >> pinner) & 1:
+                        pins[shield] = BETWEEN[king][pinner] | 1 << pinner
+        return pins
+
+    def legal_moves(self, color=None):
+        """the same moves as Board.legal_moves, worked out with masks: checks, pins and every
+        piece's targets are each a few and, or and shift operations on the bitboards"""
+        color = color or self.to_move
+        bitboards = self.bitboards
+        king_mask = bitboards[color, "K"]
+        if not king_mask:
+            return Board.legal_moves(self, color)
+        enemy = color.opponent
+        occupancy = self.occupancy
+        own = self.occupied[color]
+        theirs = occupancy & ~own
+        king = king_mask.bit_length() - 1
+        king_position = SQUARES[king]
+        moves = []
+
+        attack_sets = self._attack_sets(enemy)
+        # the king can't step back along the line of a slider checking it, so it's lifted off first
+        lifted = occupancy & ~king_mask
+        targets = KING_ATTACKS[king] & ~own
+        while targets:
+            low = targets & -targets
+            targets ^= low
+            target = low.bit_length() - 1
+            if not _attacked_by(target, lifted, attack_sets):
+                moves.append(Move(king_position, SQUARES[target]))
+        checkers = _attacked_by(king, occupancy, attack_sets)
+        if not checkers:
+            for castle in self.at(king_position)._castles():
+                if not any(_attacked_by(square.index, occupancy, attack_sets) for square in castle.king_path):
+                    moves.append(Move(king_position, castle.king_end))
+            allowed = ALL_SQUARES
+        elif checkers & (checkers - 1):
+            # only the king can get out of a double check
+            return moves
+        else:
+            # capture the checker, or block it if it's a slider
+            checker = checkers.bit_length() - 1
+            allowed = checkers | BETWEEN[king][checker]
+        pins = self._pins(king, own, attack_sets)
+
+        for notation, rays in (("N", None), ("B", BISHOP_RAYS), ("R", ROOK_RAYS), ("Q", None)):
+            pieces = bitboards[color, notation]
+            while pieces:
+                low = pieces & -pieces
+                pieces ^= low
+                begin = low.bit_length() - 1
+                if notation == "N":
+                    targets = KNIGHT_ATTACKS[begin]
+                elif rays is not None:
+                    targets = _slide(begin, occupancy, rays)
+                else:
+                    targets = _slide(begin, occupancy, ROOK_RAYS) | _slide(begin, occupancy, BISHOP_RAYS)
+                targets &= ~own & allowed & pins.get(begin, ALL_SQUARES)
+                begin_position = SQUARES[begin]
+                while targets:
+                    low = targets & -targets
+                    targets ^= low
+                    moves.append(Move(begin_position, SQUARES[low.bit_length() - 1]))
+
+        step = PAWN_STEPS[color]
+        pawn_attacks = PAWN_ATTACKS[color]
+        double_move_row = DOUBLE_MOVE_ROWS[color]
+        en_passant = self.en_passant
+        pawns = bitboards[color, "P"]
+        while pawns:
+            low = pawns & -pawns
+            pawns ^= low
+            begin = low.bit_length() - 1
+            begin_position = SQUARES[begin]
+            targets = pawn_attacks[begin] & theirs
+            push = begin + step
+            if not (occupancy >> push) & 1:
+                targets |= 1 << push
+                if low & double_move_row and not (occupancy >> (push + step)) & 1:
+                    targets |= 1 << (push + step)
+            targets &= allowed & pins.get(begin, ALL_SQUARES)
+            while targets:
+                low = targets & -targets
+                targets ^= low
+                end_position = SQUARES[low.bit_length() - 1]
+                if low & LAST_ROWS:
+                    moves.extend(Move(begin_position, end_position, promotion) for promotion in PROMOTIONS)
+                else:
+                    moves.append(Move(begin_position, end_position))
+            if en_passant is not None and (pawn_attacks[begin] >> en_passant.index) & 1:
+                move = self._legal_en_passant(begin_position, color)
+                if move is not None:
+                    moves.append(move)
+        return moves
+
+
+class BitPiece:
+    """Mixin for pieces living on a BitBoard, generates moves with mask arithmetic
+    instead of walking the squares one at a time."""
+
+    @property
+    def _index(self):
+        return self.position.index
+
+    @property
+    def _enemies(self):
+        return self.board.occupied[Color.black if self.is_white else Color.white]
+
+    @property
+    def possible_moves(self):
+        return positions_of(self._targets() & ~self.board.occupancy)
+
+    @property
+    def possible_attacks(self):
+        return positions_of(self._targets() & self._enemies)
+
+
+class BitPawn(BitPiece, Pawn):
+
+    @property
+    def possible_moves(self):
+        step = 8 if self.is_white else -8
+        target = self._index + step
+        moves = 0
+        if 0 <= target < 64 and not (self.board.occupancy >> target) & 1:
+            moves |= 1 << target
+            target += step
+            if self._can_double_move() and not (self.board.occupancy >> target) & 1:
+                moves |= 1 << target
+        return positions_of(moves)
+
+    @property
+    def possible_attacks(self):
+        targets = PAWN_ATTACKS[self.color][self._index]
+        return positions_of(targets & self._enemies) + self._en_passant_attacks(positions_of(targets))
+
+
+class BitRook(BitPiece, Rook):
+
+    def _targets(self):
+        return _slide(self.position.index, self.board.occupancy, ROOK_RAYS)
+
+
+class BitBishop(BitPiece, Bishop):
+
+    def _targets(self):
+        return _slide(self.position.index, self.board.occupancy, BISHOP_RAYS)
+
+
+class BitQueen(BitPiece, Queen):
+
+    def _targets(self):
+        return _slide(self.position.index, self.board.occupancy, ROOK_RAYS + BISHOP_RAYS)
+
+
+class BitKing(BitPiece, King):
+
+    def _targets(self):
+        return KING_ATTACKS[self._index]
+
+    @property
+    def _moves(self):
+        return positions_of(self._targets())
+
+    @property
+    def possible_moves(self):
+        return BitPiece.possible_moves.fget(self) + [castle.king_end for castle in self._castles()]
+
+
+class BitKnight(BitPiece, Knight):
+
+    def _targets(self):
+        return KNIGHT_ATTACKS[self._index]
+
+
+BIT_PIECE_TYPES = {Pawn: BitPawn, Rook: BitRook, Bishop: BitBishop, Queen: BitQueen, King: BitKing, Knight: BitKnight}
+
+
+# a handful of opening, middlegame and endgame positions for the benchmark
+BENCHMARK_NOTATIONS = [
+    chess.STARTING_NOTATION,
+    [["WR",   "",   "",   "", "WK",   "",   "", "WR"],
+     ["WP", "WP", "WP", "WB", "WB", "WP", "WP", "WP"],
+     [  "",   "", "WN",   "",   "", "WQ",   "", "BP"],
+     [  "", "BP",   "",   "", "WP",   "",   "",   ""],
+     [  "",   "",   "", "WP", "WN",   "",   "",   ""],
+     ["BB", "BN",   "",   "", "BP", "BN", "BP",   ""],
+     ["BP",   "", "BP", "BP", "BQ", "BP", "BB",   ""],
+     ["BR",   "",   "",   "", "BK",   "",   "", "BR"]],
+    [[  "",   "",   "",   "",   "",   "",   "",   ""],
+     [  "",   "",   "",   "", "WP",   "", "WP",   ""],
+     [  "",   "",   "",   "",   "",   "",   "",   ""],
+     [  "", "WR",   "",   "",   "",   "", "BK",   ""],
+     ["WK", "WP",   "",   "",   "",   "",   "", "BR"],
+     [  "",   "",   "", "BP",   "",   "",   "",   ""],
+     [  "",   "", "BP",   "",   "",   "",   "",   ""],
+     [  "",   "",   "",   "",   "",   "",   "",   ""]],
+    [["WR",   "", "WB", "WQ", "WK",   "",   "", "WR"],
+     ["WP", "WP",   "", "BN", "WB", "WP", "WP", "WP"],
+     [  "",   "", "WP",   "",   "",   "",   "",   ""],
+     [  "",   "",   "",   "",   "",   "",   "",   ""],
+     [  "",   "", "WB",   "",   "",   "",   "",   ""],
+     [  "",   "",   "",   "",   "",   "",   "",   ""],
+     ["BP", "BP",   "", "WP", "BB", "BP", "BP", "BP"],
+     ["BR", "BN", "BB", "BQ",   "", "BK",   "", "BR"]],
+]
+
+def _generate_all(board):
+    return len(board.legal_moves(Color.white)) + len(board.legal_moves(Color.black))
+
+def benchmark(board_type, notations=BENCHMARK_NOTATIONS, seconds=1.0):
+    """returns the number of positions per second that board_type can parse from notation
+    and generate both sides' legal moves for"""
+    positions = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < seconds:
+        for notation in notations:
+            _generate_all(board_type.from_notation(notation))
+        positions += len(notations)
+        elapsed = time.perf_counter() - start
+    return positions / elapsed
+
+
+if __name__ == "__main__":
+    baseline = benchmark(Board)
+    print("Board:    {:10.1f} positions/sec".format(baseline))
+    bitboard = benchmark(BitBoard)
+    print("BitBoard: {:10.1f} positions/sec ({:.2f}x)".format(bitboard, bitboard / baseline))
@@ -1,5 +1,8 @@
+from datetime import datetime, timezone
 from enum import Enum, unique
-import itertools
+import random
+import struct
+import time
 
 STARTING_NOTATION = [["WR", "WN", "WB", "WQ", "WK", "WB", "WN", "WR"],
                      ["WP", "WP", "WP", "WP", "WP", "WP", "WP", "WP"], 
@@ -9,6 +12,12 @@ STARTING_NOTATION = [["WR", "WN", "WB", "WQ", "WK", "WB", "WN", "WR"],
                      [  "",   "",   "",   "",   "",   "",   "",   ""],
                      ["BP", "BP", "BP", "BP", "BP", "BP", "BP", "BP"], 
                      ["BR", "BN", "BB", "BQ", "BK", "BB", "BN", "BR"]]
+STARTING_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+# statuses that end a game, from Board.status or the draw rules that need the game's history
+GAME_OVER = ["checkmate", "stalemate", "insufficient material", "threefold repetition", "fifty move rule"]
+DRAWS = [status for status in GAME_OVER if status != "checkmate"]
+
 @unique
 class Color(Enum):
     white = 1
@@ -35,43 +44,76 @@ class Color(Enum):
         else:
             return "B"
 
+    @property
+    def opponent(self):
+        return Color.black if self is Color.white else Color.white
+
+
 
+# directions as (row, col) deltas, "up" is towards the 8th row
+UP, DOWN, RIGHT, LEFT = (1, 0), (-1, 0), (0, 1), (0, -1)
+UPRIGHT, UPLEFT, DOWNRIGHT, DOWNLEFT = (1, 1), (1, -1), (-1, 1), (-1, -1)
 
 ROWS = ["1", "2", "3", "4", "5", "6", "7", "8"]
 COLS = ["A", "B", "C", "D", "E", "F", "G", "H"]
 
 class Position:
+    """Immutable board coordinate. There are exactly 64 on-board Position instances plus the
+    OFF_BOARD sentinel, so Position(row, col) is a table lookup rather than an allocation
+    and positions can be compared by identity."""
+
+    __slots__ = ("row", "col", "index")
 
-    def __init__(self, row, col):
-        self.row = row
-        self.col = col
+    def __new__(constructor, row, col):
+        if 0 <= row < 8 and 0 <= col < 8:
+            return POSITIONS[row * 8 + col]
+        return OFF_BOARD
+
+    @classmethod
+    def _create(constructor, row, col, index):
+        position = object.__new__(constructor)
+        object.__setattr__(position, "row", row)
+        object.__setattr__(position, "col", col)
+        object.__setattr__(position, "index", index)
+        return position
 
     @classmethod
     def from_notation(constructor, notation):
-        col_name, row_name = notation
-        row = ROWS.index(row_name)
-        col = COLS.index(col_name)
-        return constructor(row, col)
+        try:
+            return POSITIONS_BY_NOTATION[notation.upper()]
+        except (KeyError, AttributeError):
+            raise ValueError("Couldn't find position for notation: \"" + str(notation) + "\"")
+
+    def __setattr__(self, name, value):
+        raise AttributeError("chess.Position is immutable")
+
+    def __reduce__(self):
+        # unpickle to the canonical instance rather than a copy
+        return (Position, (self.row, self.col)) if self.in_bounds else "OFF_BOARD"
 
     def __str__(self):
-        return COLS[self.col] + ROWS[self.row]
+        return COLS[self.col] + ROWS[self.row] if self.in_bounds else "OFF_BOARD"
 
     def __repr__(self):
         return "chess.Position(row=" + str(self.row) + ", col=" + str(self.col) + ")"
 
-    def __eq__(self, other):
-        return self.row == other.row and self.col == other.col
-
+    # positions are interned, so identity equality from object is exact
     def __hash__(self):
-        return hash(self.row) ^ hash(self.col)
+        return self.index
 
     def __iter__(self):
         yield self.row
         yield self.col
 
     def __add__(self, delta):
+        if self.index == 64:
+            return OFF_BOARD
         drow, dcol = delta
-        return Position(self.row + drow, self.col + dcol)
+        row = self.row + drow
+        col = self.col + dcol
+        if 0 <= row < 8 and 0 <= col < 8:
+            return POSITIONS[row * 8 + col]
+        return OFF_BOARD
 
     def __sub__(self, other):
         row, col = other
@@ -79,37 +121,147 @@ class Position:
 
     @property
     def in_bounds(self):
-        return 0 <= self.row < 8 and 0 <= self.col < 8
+        return self.index < 64
+
+    def _ray(self, direction):
+        return iter(RAYS[self.row][self.col][direction] if self.in_bounds else ())
 
     def iterator_up(self):
-        return (Position(row, self.col) for row in range(self.row + 1, 8))
+        return self._ray(UP)
 
     def iterator_down(self):
-        return (Position(row, self.col) for row in range(self.row - 1, -1, -1))
+        return self._ray(DOWN)
 
     def iterator_right(self):
-        return (Position(self.row, col) for col in range(self.col + 1, 8))
+        return self._ray(RIGHT)
 
     def iterator_left(self):
-        return (Position(self.row, col) for col in range(self.col - 1, -1, -1))
+        return self._ray(LEFT)
 
     def iterator_upright(self):
-        return (Position(row, col) for row, col in zip(range(self.row + 1, 8), range(self.col + 1, 8)))
+        return self._ray(UPRIGHT)
 
     def iterator_upleft(self):
-        return (Position(row, col) for row, col in zip(range(self.row + 1, 8), range(self.col - 1, -1, -1)))
+        return self._ray(UPLEFT)
 
     def iterator_downright(self):
-        return (Position(row, col) for row, col in zip(range(self.row - 1, -1, -1), range(self.col + 1, 8)))
+        return self._ray(DOWNRIGHT)
 
     def iterator_downleft(self):
-        return (Position(row, col) for row, col in zip(range(self.row - 1, -1, -1), range(self.col - 1, -1, -1)))
+        return self._ray(DOWNLEFT)
+
+
+# the canonical positions, indexed by row * 8 + col
+POSITIONS = [Position._create(index // 8, index % 8, index) for index in range(64)]
+POSITIONS_BY_NOTATION = {str(position): position for position in POSITIONS}
+# no coordinates, so that using it to index the board fails rather than wrapping around to H8
+OFF_BOARD = Position._create(None, None, 64)
+
+
+class Move:
+
+    __slots__ = ("begin", "end", "promotion")
+
+    def __init__(self, begin, end, promotion=None):
+        self.begin = begin
+        self.end = end
+        self.promotion = promotion
+
+    @classmethod
+    def from_notation(constructor, notation):
+        """parses coordinate notation like "E2E4" or "E7E8Q" """
+        begin = Position.from_notation(notation[0:2])
+        end = Position.from_notation(notation[2:4])
+        promotion = Piece.from_notation(notation[4]) if len(notation) > 4 else None
+        return constructor(begin, end, promotion)
+
+    def to_notation(self):
+        return str(self.begin) + str(self.end) + (self.promotion.NOTATION if self.promotion else "")
+
+    @classmethod
+    def from_code(constructor, code):
+        """the inverse of to_code"""
+        promotion = code >> 12
+        return constructor(POSITIONS[code & 63], POSITIONS[code >> 6 & 63], PROMOTIONS[promotion - 1] if promotion else None)
+
+    def to_code(self):
+        """packs the move into 15 bits, begin and end square indexes and then the promotion, if any"""
+        promotion = PROMOTIONS.index(self.promotion) + 1 if self.promotion else 0
+        return self.begin.index | self.end.index << 6 | promotion << 12
+
+    def __str__(self):
+        return self.to_notation()
+
+    def __repr__(self):
+        promotion = ", promotion=chess." + self.promotion.NAME if self.promotion else ""
+        return "chess.Move(" + repr(self.begin) + ", " + repr(self.end) + promotion + ")"
+
+    def __eq__(self, other):
+        return (isinstance(other, Move) and self.begin is other.begin and self.end is other.end
+                and self.promotion is other.promotion)
+
+    def __hash__(self):
+        return self.begin.index * 64 + self.end.index
+
+
+class MoveLog:
+    """Append only record of the moves played in a game. Each move is a fixed size record in a
+    single bytearray, so reading from a cursor is a slice and costs nothing for the moves skipped."""
+
+    # timestamp, Move.to_code, and the notation of the piece that moved
+    RECORD = struct.Struct("<dHc")
+
+    def __init__(self, records=b""):
+        self.records = bytearray(records)
+
+    def __len__(self):
+        return len(self.records) // self.RECORD.size
+
+    def append(self, move, piece_notation, timestamp=None):
+        timestamp = time.time() if timestamp is None else timestamp
+        self.records += self.RECORD.pack(timestamp, move.to_code(), piece_notation.encode("ascii"))
+
+    def pop(self):
+        del self.records[-self.RECORD.size:]
+
+    def read(self, since=0, limit=None):
+        """(ply, timestamp, move, piece notation) for limit moves starting at ply since"""
+        size = self.RECORD.size
+        end = len(self.records) if limit is None else (since + limit) * size
+        records = memoryview(self.records)[since * size:end]
+        try:
+            return [(ply, timestamp, Move.from_code(code), piece.decode("ascii"))
+                    for ply, (timestamp, code, piece) in enumerate(self.RECORD.iter_unpack(records), since)]
+        finally:
+            records.release()
+
+    def page(self, since=0, limit=None):
+        """the /history json for limit moves starting at ply since, as a dict"""
+        moves = [{"ply": ply, "timestamp": datetime.fromtimestamp(timestamp, timezone.utc).isoformat(timespec="seconds"),
+                  "player": "white" if ply % 2 == 0 else "black", "piece": Piece.from_notation(piece).NAME.lower(),
+                  "start": str(move.begin), "end": str(move.end), "move": move.to_notation()}
+                 for ply, timestamp, move, piece in self.read(since, limit)]
+        return {"moves": moves, "next": since + len(moves), "total": len(self)}
 
 
 class Board:
 
     def __init__(self):
         self.rows = [[None] * 8 for x in range(8)]
+        self.to_move = Color.white
+        # remaining castling rights in FEN order, "K" and "Q" for white, "k" and "q" for black
+        self.castling = ""
+        # the square a pawn skipped over with a double move on the previous turn, if any
+        self.en_passant = None
+        # moves since the last capture or pawn move, and the move number as counted in FEN
+        self.halfmove_clock = 0
+        self.fullmove = 1
+        # zobrist hash of just the pieces, kept up to date by place and remove
+        self.piece_key = 0
+        # the pieces on the board by color, and by color and type, also kept up to date by place
+        # and remove. dicts rather than sets so that iterating them goes in a repeatable order
+        self.piece_lists = {color: {} for color in Color}
+        self.piece_types = {(color, notation): {} for color in Color for notation in "KQRBNP"}
 
     @classmethod
     def from_notation(constructor, board_notation):
@@ -121,37 +273,174 @@ class Board:
                     color = Color.from_notation(color_notation)
                     piece_type = Piece.from_notation(piece_notation)
                     board.add(color, piece_type, Position(row, col))
+        # the notation doesn't record castling rights, so assume any unmoved king and rook can castle
+        board.castling = "".join(right for right, castle in CASTLES.items() if board._can_castle(castle))
         return board
 
     def to_notation(self):
         return [[piece.to_notation() if piece else "" for piece in row] for row in self.rows]
 
+    @classmethod
+    def from_fen(constructor, fen):
+        board = constructor()
+        try:
+            fields = fen.split()
+            placement, side, castling, en_passant = fields[:4]
+            ranks = placement.split("/")
+            if len(ranks) != 8:
+                raise ValueError("a FEN has 8 ranks")
+            for index, rank in enumerate(ranks):
+                col = 0
+                for char in rank:
+                    if char in "12345678":
+                        col += int(char)
+                        continue
+                    # past the edge Position would be OFF_BOARD, which has no square to add the piece on
+                    if col >= 8:
+                        raise ValueError("a FEN rank is 8 squares wide")
+                    color = Color.white if char.isupper() else Color.black
+                    board.add(color, Piece.from_notation(char), Position(7 - index, col))
+                    col += 1
+                if col != 8:
+                    raise ValueError("a FEN rank is 8 squares wide")
+            if side not in ("w", "b"):
+                raise ValueError("a FEN's side to move is w or b")
+            board.to_move = Color.from_notation(side)
+            # the rights that are left, in KQkq order, or - for none
+            if castling != "-" and "".join(right for right in "KQkq" if right in castling) != castling:
+                raise ValueError("a FEN's castling rights are - or some of KQkq")
+            board.castling = "" if castling == "-" else castling
+            board.en_passant = None if en_passant == "-" else Position.from_notation(en_passant)
+            board.halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+            board.fullmove = int(fields[5]) if len(fields) > 5 else 1
+        except (ValueError, KeyError, AttributeError):
+            raise ValueError("Couldn't parse FEN: \"" + str(fen) + "\"")
+        return board
+
+    def to_fen(self):
+        ranks = []
+        for row in reversed(self.rows):
+            rank = ""
+            gap = 0
+            for piece in row:
+                if piece is None:
+                    gap += 1
+                    continue
+                if gap:
+                    rank += str(gap)
+                    gap = 0
+                rank += piece.NOTATION if piece.is_white else piece.NOTATION.lower()
+            ranks.append(rank + (str(gap) if gap else ""))
+        en_passant = str(self.en_passant).lower() if self.en_passant else "-"
+        return " ".join(["/".join(ranks), self.to_move.to_notation().lower(), self.castling or "-",
+                         en_passant, str(self.halfmove_clock), str(self.fullmove)])
+
+    @classmethod
+    def from_packed(constructor, data):
+        """the inverse of to_packed"""
+        board = constructor()
+        try:
+            squares, flags, en_passant, board.halfmove_clock, board.fullmove = PACKED.unpack(data)
+            for index, position in enumerate(POSITIONS):
+                code = squares[index >> 1] >> (index & 1) * 4 & 15
+                if code:
+                    board.add(Color.black if code & 8 else Color.white, PACKED_PIECES[code & 7], position)
+        except (struct.error, IndexError, TypeError):
+            raise ValueError("Couldn't parse packed board: " + repr(data))
+        board.to_move = Color.black if flags & 1 else Color.white
+        board.castling = "".join(right for bit, right in enumerate("KQkq", 1) if flags >> bit & 1)
+        board.en_passant = POSITIONS[en_passant] if en_passant < 64 else None
+        return board
+
+    def to_packed(self):
+        """the position in 38 bytes: a nibble per square from A1 to H8, a byte of flags for the side
+        to move and the castling rights, the en passant square (64 for none), then the halfmove
+        clock and move number"""
+        codes = [PACKED_CODES[piece.color, piece.NOTATION] if piece else 0 for piece in self.squares()]
+        squares = bytes(codes[index] | codes[index + 1] << 4 for index in range(0, 64, 2))
+        flags = (self.to_move is Color.black) | sum(1 << bit for bit, right in enumerate("KQkq", 1)
+                                                    if right in self.castling)
+        en_passant = self.en_passant.index if self.en_passant else 64
+        return PACKED.pack(squares, flags, en_passant, self.halfmove_clock, self.fullmove)
+
     def __getitem__(self, row):
         return self.rows[row]
 
     def positions(self):
-        for row in range(8):
-            for col in range(8):
-                yield Position(row, col)
+        return iter(POSITIONS)
 
     def squares(self):
         for row in self.rows:
             yield from row
 
     def pieces(self):
-        return (square for square in self.squares() if square)
+        return self.white_pieces() + self.black_pieces()
 
     def white_pieces(self):
-        return (piece for piece in self.pieces() if piece.is_white)
+        return list(self.piece_lists[Color.white])
 
     def black_pieces(self):
-        return (piece for piece in self.pieces() if piece.is_black)
+        return list(self.piece_lists[Color.black])
+
+    def pieces_of(self, color, piece_type):
+        """color's pieces of piece_type, which may be given as the type or its notation"""
+        notation = piece_type if isinstance(piece_type, str) else piece_type.NOTATION
+        return list(self.piece_types[color, notation.upper()])
 
     def add(self, color, piece_type, position):
         piece = piece_type(color, position, self)
+        self.place(piece, position)
+        return piece
+
+    def place(self, piece, position):
         self.rows[position.row][position.col] = piece
+        piece.position = position
+        self.piece_key ^= ZOBRIST_PIECES[piece.color, piece.NOTATION][position.index]
+        self.piece_lists[piece.color][piece] = None
+        self.piece_types[piece.color, piece.NOTATION][piece] = None
+
+    def remove(self, position):
+        piece = self.at(position)
+        self.rows[position.row][position.col] = None
+        self.piece_key ^= ZOBRIST_PIECES[piece.color, piece.NOTATION][position.index]
+        del self.piece_lists[piece.color][piece]
+        del self.piece_types[piece.color, piece.NOTATION][piece]
         return piece
 
+    @property
+    def key(self):
+        """64 bit zobrist hash of the position, including side to move, castling rights and en passant"""
+        key = self.piece_key
+        if self.to_move is Color.black:
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        for right in self.castling:
+            key ^= ZOBRIST_CASTLING[right]
+        if self.en_passant is not None and self._en_passant_capturable():
+            key ^= ZOBRIST_EN_PASSANT[self.en_passant.col]
+        return key
+
+    def _en_passant_capturable(self):
+        # an en passant square nobody can capture on doesn't make the position any different
+        en_passant = self.en_passant
+        for position in PAWN_ATTACKS[self.to_move.opponent][en_passant.row][en_passant.col]:
+            piece = self.rows[position.row][position.col]
+            if piece is not None and piece.color is self.to_move and piece.NOTATION == "P":
+                return True
+        return False
+
+    def compute_key(self):
+        """the zobrist hash recomputed from scratch, which key should always agree with"""
+        piece_key = 0
+        for piece in self.pieces():
+            piece_key ^= ZOBRIST_PIECES[piece.color, piece.NOTATION][piece.position.index]
+        return self.key ^ self.piece_key ^ piece_key
+
+    def move(self, piece, position):
+        if not self.empty(position):
+            self.remove(position)
+        self.remove(piece.position)
+        self.place(piece, position)
+
     def at(self, position):
         row, col = position
         return self.rows[row][col]
@@ -159,6 +448,216 @@ class Board:
     def empty(self, position):
         return self.at(position) is None
 
+    def king(self, color):
+        for piece in self.piece_types[color, "K"]:
+            return piece
+        return None
+
+    def _can_castle(self, castle):
+        king = self.at(castle.king_begin)
+        rook = self.at(castle.rook_begin)
+        return (king is not None and king.NOTATION == "K" and king.color is castle.color and
+                rook is not None and rook.NOTATION == "R" and rook.color is castle.color)
+
+    def captured_position(self, move):
+        """the square of the piece move captures, or None if it captures nothing.
+        en passant is the one capture that doesn't land on the captured piece"""
+        if not self.empty(move.end):
+            return move.end
+        piece = self.at(move.begin)
+        if move.end is self.en_passant and piece is not None and piece.NOTATION == "P":
+            return Position(move.begin.row, move.end.col)
+        return None
+
+    def make(self, move):
+        """plays move without checking that it is legal, and returns the undo record for unmake"""
+        piece = self.at(move.begin)
+        captured_position = self.captured_position(move)
+        captured = None if captured_position is None else self.remove(captured_position)
+        undo = (move, piece, captured, captured_position, self.castling, self.en_passant, self.to_move,
+                self.halfmove_clock, self.fullmove)
+
+        self.remove(move.begin)
+        promotion = move.promotion
+        if piece.NOTATION == "P" and move.end.row in (0, 7):
+            self.add(piece.color, promotion or Queen, move.end)
+        else:
+            self.place(piece, move.end)
+
+        if piece.NOTATION == "K" and abs(move.end.col - move.begin.col) == 2:
+            castle = CASTLES_BY_KING_END[move.end]
+            self.place(self.remove(castle.rook_begin), castle.rook_end)
+
+        if self.castling:
+            lost = CASTLING_SQUARES.get(move.begin, "") + CASTLING_SQUARES.get(move.end, "")
+            self.castling = "".join(right for right in self.castling if right not in lost)
+        if piece.NOTATION == "P" and abs(move.end.row - move.begin.row) == 2:
+            self.en_passant = Position((move.begin.row + move.end.row) // 2, move.begin.col)
+        else:
+            self.en_passant = None
+        self.halfmove_clock = 0 if captured is not None or piece.NOTATION == "P" else self.halfmove_clock + 1
+        if piece.color is Color.black:
+            self.fullmove += 1
+        self.to_move = piece.color.opponent
+        return undo
+
+    def unmake(self, undo):
+        (move, piece, captured, captured_position, self.castling, self.en_passant, self.to_move,
+         self.halfmove_clock, self.fullmove) = undo
+        if piece.NOTATION == "K" and abs(move.end.col - move.begin.col) == 2:
+            castle = CASTLES_BY_KING_END[move.end]
+            self.place(self.remove(castle.rook_end), castle.rook_begin)
+        self.remove(move.end)
+        self.place(piece, move.begin)
+        if captured is not None:
+            self.place(captured, captured_position)
+
+    def is_attacked(self, position, color, ignore=None):
+        """whether any piece of color attacks position, treating the piece ignore as absent"""
+        rows = self.rows
+        row, col = position
+        for targets, notation in ((KNIGHT_TARGETS[row][col], "N"), (KING_TARGETS[row][col], "K"),
+                                  (PAWN_ATTACKS[color.opponent][row][col], "P")):
+            for target in targets:
+                piece = rows[target.row][target.col]
+                if piece is not None and piece.color is color and piece.NOTATION == notation:
+                    return True
+        rays = RAYS[row][col]
+        for direction in Queen.DIRECTIONS:
+            sliders = "RQ" if direction in Rook.DIRECTIONS else "BQ"
+            for target in rays[direction]:
+                piece = rows[target.row][target.col]
+                if piece is None or piece is ignore:
+                    continue
+                if piece.color is color and piece.NOTATION in sliders:
+                    return True
+                break
+        return False
+
+    def _checks_and_pins(self, king):
+        """returns the pieces giving check to king, the squares that would resolve a single check,
+        and a map of each pinned piece to the squares it may still move to"""
+        rows = self.rows
+        row, col = king.position
+        color = king.color
+        checkers = []
+        resolving = set()
+        pins = {}
+        rays = RAYS[row][col]
+        for direction in Queen.DIRECTIONS:
+            sliders = "RQ" if direction in Rook.DIRECTIONS else "BQ"
+            ray = rays[direction]
+            shield = None
+            for index, target in enumerate(ray):
+                piece = rows[target.row][target.col]
+                if piece is None:
+                    continue
+                if piece.color is color:
+                    if shield is not None:
+                        break
+                    shield = piece
+                    continue
+                if piece.NOTATION in sliders:
+                    line = ray[:index + 1]
+                    if shield is None:
+                        checkers.append(piece)
+                        resolving.update(line)
+                    else:
+                        pins[shield] = set(line)
+                break
+        for targets, notation in ((KNIGHT_TARGETS[row][col], "N"), (PAWN_ATTACKS[color][row][col], "P")):
+            for target in targets:
+                piece = rows[target.row][target.col]
+                if piece is not None and piece.color is not color and piece.NOTATION == notation:
+                    checkers.append(piece)
+                    resolving.add(target)
+        return checkers, resolving, pins
+
+    def _is_legal_after(self, move, color):
+        undo = self.make(move)
+        king = self.king(color)
+        legal = king is None or not self.is_attacked(king.position, color.opponent)
+        self.unmake(undo)
+        return legal
+
+    def _legal_en_passant(self, begin, color):
+        """the en passant capture from begin, or None if it would leave color's king in check.
+        the captured pawn leaves its square too, which can expose the king along the row,
+        so just play this rare move out rather than special casing it"""
+        move = Move(begin, self.en_passant)
+        return move if self._is_legal_after(move, color) else None
+
+    def legal_moves(self, color=None):
+        """every legal move for color (by default the side to move), found by working out checks
+        and pins up front instead of playing out each pseudo legal move"""
+        color = color or self.to_move
+        enemy = color.opponent
+        king = self.king(color)
+        checkers, resolving, pins = self._checks_and_pins(king) if king else ([], set(), {})
+        moves = []
+
+        if king is not None:
+            begin = king.position
+            for target in king._leaper_moves(king._moves) + king.possible_attacks:
+                if not self.is_attacked(target, enemy, ignore=king):
+                    moves.append(Move(begin, target))
+            if not checkers:
+                for castle in king._castles():
+                    if not any(self.is_attacked(square, enemy) for square in castle.king_path):
+                        moves.append(Move(begin, castle.king_end))
+            if len(checkers) > 1:
+                return moves
+
+        pieces = list(self.white_pieces() if color is Color.white else self.black_pieces())
+        for piece in pieces:
+            if piece is king:
+                continue
+            begin = piece.position
+            allowed = pins.get(piece)
+            is_pawn = piece.NOTATION == "P"
+            for target in piece.possible_moves + piece.possible_attacks:
+                if is_pawn and target is self.en_passant:
+                    move = self._legal_en_passant(begin, color)
+                    if move is not None:
+                        moves.append(move)
+                    continue
+                if checkers and target not in resolving:
+                    continue
+                if allowed is not None and target not in allowed:
+                    continue
+                if is_pawn and target.row in (0, 7):
+                    moves.extend(Move(begin, target, promotion) for promotion in PROMOTIONS)
+                else:
+                    moves.append(Move(begin, target))
+        return moves
+
+    def is_check(self, color=None):
+        color = color or self.to_move
+        king = self.king(color)
+        return king is not None and self.is_attacked(king.position, color.opponent)
+
+    def is_checkmate(self, color=None):
+        return self.is_check(color) and not self.legal_moves(color)
+
+    def is_stalemate(self, color=None):
+        return not self.is_check(color) and not self.legal_moves(color)
+
+    def has_insufficient_material(self):
+        # neither side can mate with bare kings, or a king and a single minor piece against a king
+        others = [piece.NOTATION for piece in self.pieces() if piece.NOTATION != "K"]
+        return not others or (len(others) == 1 and others[0] in "NB")
+
+    def status(self, color=None, moves=None):
+        """one of "checkmate", "stalemate", "insufficient material", "check" or "playing".
+        moves are color's legal moves, if the caller already has them"""
+        color = color or self.to_move
+        in_check = self.is_check(color)
+        if not (self.legal_moves(color) if moves is None else moves):
+            return "checkmate" if in_check else "stalemate"
+        if self.has_insufficient_material():
+            return "insufficient material"
+        return "check" if in_check else "playing"
+
 
 class Piece:
 
@@ -200,15 +699,15 @@ class Piece:
     def is_black(self):
         return self.color == Color.black
 
-    def move_to(self, position):
-        if self.board.empty(position) and not self.valid_move(position):
-            raise Exception("cannot move there!")
-        if not self.board.empty(position) and not self.valid_attack(position):
+    def move_to(self, position, promotion=None):
+        move = Move(self.position, position, promotion)
+        if self.board.captured_position(move) is None:
+            if not self.valid_move(position):
+                raise Exception("cannot move there!")
+        elif not self.valid_attack(position):
             raise Exception("cannot attack there!")
 
-        self.board[self.row][self.col] = None
-        self.board[position.row][position.col] = self
-        self.position = position
+        return self.board.make(move)
 
     def valid_move(self, position):
         return position in self.possible_moves
@@ -216,22 +715,45 @@ class Piece:
     def valid_attack(self, position):
         return position in self.possible_attacks
 
-    def _enemy_at(self, position):
-        return not self.board.empty(position) and self.color != self.board.at(position).color
-
-    def _stop_filter(self, positions, inclusive=False):
-        done = not inclusive
-        for position in positions:
-            if position.in_bounds and self.board.empty(position):
-                yield position
-            elif not done:
-                yield position
-                done = True
-            else:
-                return
+    def _leaper_moves(self, targets):
+        rows = self.board.rows
+        return [position for position in targets if rows[position.row][position.col] is None]
+
+    def _leaper_attacks(self, targets):
+        rows = self.board.rows
+        attacks = []
+        for position in targets:
+            piece = rows[position.row][position.col]
+            if piece is not None and piece.color != self.color:
+                attacks.append(position)
+        return attacks
+
+    def _slider_moves(self, rays):
+        rows = self.board.rows
+        moves = []
+        for ray in rays:
+            for position in ray:
+                if rows[position.row][position.col] is not None:
+                    break
+                moves.append(position)
+        return moves
+
+    def _slider_attacks(self, rays):
+        rows = self.board.rows
+        attacks = []
+        for ray in rays:
+            for position in ray:
+                piece = rows[position.row][position.col]
+                if piece is not None:
+                    if piece.color != self.color:
+                        attacks.append(position)
+                    break
+        return attacks
 
-    def _enemy_filter(self, positions):
-        return (position for position in positions if self._enemy_at(position))
+    @property
+    def _rays(self):
+        rays = RAYS[self.row][self.col]
+        return [rays[direction] for direction in self.DIRECTIONS]
 
                           
 class Pawn(Piece):
@@ -243,23 +765,28 @@ class Pawn(Piece):
     MOVE_OFFSETS = {Color.white: [(1, 0)], Color.black: [(-1, 0)]}
     DOUBLE_MOVE_OFFSETS = {Color.white: [(1, 0), (2, 0)], Color.black: [(-1, 0), (-2, 0)]}
     ATTACK_OFFSETS = {Color.white: [(1, 1), (1, -1)], Color.black: [(-1, 1), (-1, -1)]}
+    # the row pawns start on, the only one they can double move from
+    START_ROWS = {Color.white: 1, Color.black: 6}
 
     def _can_double_move(self):
-        return (self.color, self.row) in [(Color.white, 1), (Color.black, 6)]
+        return self.row == Pawn.START_ROWS[self.color]
 
     @property
     def possible_moves(self):
-        if self._can_double_move():
-            moves = [self.position + offset for offset in Pawn.DOUBLE_MOVE_OFFSETS[self.color]]
-        else:
-            moves = [self.position + offset for offset in Pawn.MOVE_OFFSETS[self.color]]
-        return list(self._stop_filter(moves))
+        # the push table is a ray, so a blocked single push also blocks the double push
+        return self._slider_moves([PAWN_PUSHES[self.color][self.row][self.col]])
 
-    # TODO: support en passant
     @property
     def possible_attacks(self):
-        attacks = [self.position + offset for offset in Pawn.ATTACK_OFFSETS[self.color]]
-        return list(self._enemy_filter(attacks))
+        targets = PAWN_ATTACKS[self.color][self.row][self.col]
+        return self._leaper_attacks(targets) + self._en_passant_attacks(targets)
+
+    def _en_passant_attacks(self, targets):
+        # only the side that didn't just double move can capture en passant
+        en_passant = self.board.en_passant
+        if en_passant is not None and en_passant in targets and en_passant.row == (5 if self.is_white else 2):
+            return [en_passant]
+        return []
 
 
 class Rook(Piece):
@@ -267,19 +794,15 @@ class Rook(Piece):
     NAME = "Rook"
     NOTATION = "R"
 
-    @property
-    def _move_iterators(self):
-        return [self.position.iterator_up(),    self.position.iterator_down(),
-                self.position.iterator_right(), self.position.iterator_left()]
+    DIRECTIONS = [UP, DOWN, RIGHT, LEFT]
 
     @property
     def possible_moves(self):
-        return list(itertools.chain(*(self._stop_filter(moves) for moves in self._move_iterators)))
+        return self._slider_moves(self._rays)
 
     @property
     def possible_attacks(self):
-        in_range = itertools.chain(*(self._stop_filter(moves, inclusive=True) for moves in self._move_iterators))
-        return list(self._enemy_filter(in_range))
+        return self._slider_attacks(self._rays)
 
 
 class Bishop(Piece):
@@ -287,19 +810,15 @@ class Bishop(Piece):
     NAME = "Bishop"
     NOTATION = "B"
 
-    @property
-    def _move_iterators(self):
-        return [self.position.iterator_upright(),   self.position.iterator_upleft(),
-                self.position.iterator_downright(), self.position.iterator_downleft()]
+    DIRECTIONS = [UPRIGHT, UPLEFT, DOWNRIGHT, DOWNLEFT]
 
     @property
     def possible_moves(self):
-        return list(itertools.chain(*(self._stop_filter(moves) for moves in self._move_iterators)))
+        return self._slider_moves(self._rays)
 
     @property
     def possible_attacks(self):
-        in_range = itertools.chain(*(self._stop_filter(moves, inclusive=True) for moves in self._move_iterators))
-        return list(self._enemy_filter(in_range))
+        return self._slider_attacks(self._rays)
 
 
 class Queen(Piece):
@@ -307,21 +826,15 @@ class Queen(Piece):
     NAME = "Queen"
     NOTATION = "Q"
 
-    @property
-    def _move_iterators(self):
-        return [self.position.iterator_up(),        self.position.iterator_down(),
-                self.position.iterator_right(),     self.position.iterator_left(),
-                self.position.iterator_upright(),   self.position.iterator_upleft(),
-                self.position.iterator_downright(), self.position.iterator_downleft()]
+    DIRECTIONS = [UP, DOWN, RIGHT, LEFT, UPRIGHT, UPLEFT, DOWNRIGHT, DOWNLEFT]
 
     @property
     def possible_moves(self):
-        return list(itertools.chain(*(self._stop_filter(moves) for moves in self._move_iterators)))
+        return self._slider_moves(self._rays)
 
     @property
     def possible_attacks(self):
-        in_range = itertools.chain(*(self._stop_filter(moves, inclusive=True) for moves in self._move_iterators))
-        return list(self._enemy_filter(in_range))
+        return self._slider_attacks(self._rays)
 
 
 class King(Piece):
@@ -333,16 +846,26 @@ class King(Piece):
 
     @property
     def _moves(self):
-        positions = [self.position + offset for offset in King.MOVE_OFFSETS]
-        return [position for position in positions if position.in_bounds]
+        return KING_TARGETS[self.row][self.col]
 
     @property
     def possible_moves(self):
-        return [position for position in self._moves if self.board.empty(position)]
+        return self._leaper_moves(self._moves) + [castle.king_end for castle in self._castles()]
 
     @property
     def possible_attacks(self):
-        return list(self._enemy_filter(self._moves))
+        return self._leaper_attacks(self._moves)
+
+    def _castles(self):
+        """castles this king still has the right to make, through empty squares.
+        whether the squares it passes are attacked is left to Board.legal_moves"""
+        castles = []
+        for right in self.board.castling:
+            castle = CASTLES[right]
+            if castle.color is self.color and self.position is castle.king_begin:
+                if all(self.board.empty(square) for square in castle.between):
+                    castles.append(castle)
+        return castles
 
 
 class Knight(Piece):
@@ -354,15 +877,93 @@ class Knight(Piece):
 
     @property
     def _moves(self):
-        positions = [self.position + offset for offset in Knight.MOVE_OFFSETS]
-        return [position for position in positions if position.in_bounds]
+        return KNIGHT_TARGETS[self.row][self.col]
 
     @property
     def possible_moves(self):
-        return [position for position in self._moves if self.board.empty(position)]
+        return self._leaper_moves(self._moves)
 
     @property
     def possible_attacks(self):
-        return list(self._enemy_filter(self._moves))
+        return self._leaper_attacks(self._moves)
+
 
+# lookup tables indexed by [row][col], computed once at import so that move generation
+# never has to do position arithmetic or bounds checks
 
+def _square_table(build):
+    return [[build(Position(row, col)) for col in range(8)] for row in range(8)]
+
+def _leaper_targets(offsets):
+    def build(position):
+        targets = (position + offset for offset in offsets)
+        return tuple(target for target in targets if target.in_bounds)
+    return _square_table(build)
+
+def _ray(position, direction):
+    ray = []
+    position = position + direction
+    while position.in_bounds:
+        ray.append(position)
+        position = position + direction
+    return tuple(ray)
+
+def _pawn_pushes(color):
+    def build(position):
+        offsets = Pawn.DOUBLE_MOVE_OFFSETS if position.row == Pawn.START_ROWS[color] else Pawn.MOVE_OFFSETS
+        targets = (position + offset for offset in offsets[color])
+        return tuple(target for target in targets if target.in_bounds)
+    return _square_table(build)
+
+KNIGHT_TARGETS = _leaper_targets(Knight.MOVE_OFFSETS)
+KING_TARGETS = _leaper_targets(King.MOVE_OFFSETS)
+PAWN_ATTACKS = {color: _leaper_targets(Pawn.ATTACK_OFFSETS[color]) for color in Color}
+PAWN_PUSHES = {color: _pawn_pushes(color) for color in Color}
+RAYS = _square_table(lambda position: {direction: _ray(position, direction) for direction in Queen.DIRECTIONS})
+
+PROMOTIONS = [Queen, Rook, Bishop, Knight]
+
+# Board.to_packed: square nibbles, flags, en passant square, halfmove clock and move number.
+# a square's nibble is the index of its piece type here, plus 8 for black pieces
+PACKED = struct.Struct("<32sBBHH")
+PACKED_PIECES = [None, King, Queen, Rook, Bishop, Knight, Pawn]
+PACKED_CODES = {(color, piece_type.NOTATION): index | (8 if color is Color.black else 0)
+                for index, piece_type in enumerate(PACKED_PIECES) if piece_type for color in Color}
+
+
+class Castle:
+
+    def __init__(self, color, king_begin, king_end, rook_begin, rook_end):
+        self.color = color
+        self.king_begin = Position.from_notation(king_begin)
+        self.king_end = Position.from_notation(king_end)
+        self.rook_begin = Position.from_notation(rook_begin)
+        self.rook_end = Position.from_notation(rook_end)
+        low, high = sorted([self.king_begin.col, self.rook_begin.col])
+        # squares that have to be empty, and squares the king may not pass through while attacked
+        self.between = [Position(self.king_begin.row, col) for col in range(low + 1, high)]
+        self.king_path = [self.rook_end, self.king_end]
+
+CASTLES = {"K": Castle(Color.white, "E1", "G1", "H1", "F1"),
+           "Q": Castle(Color.white, "E1", "C1", "A1", "D1"),
+           "k": Castle(Color.black, "E8", "G8", "H8", "F8"),
+           "q": Castle(Color.black, "E8", "C8", "A8", "D8")}
+CASTLES_BY_KING_END = {castle.king_end: castle for castle in CASTLES.values()}
+
+# moving from or capturing on one of these squares gives up the matching castling rights
+CASTLING_SQUARES = {Position.from_notation("E1"): "KQ", Position.from_notation("H1"): "K",
+                    Position.from_notation("A1"): "Q", Position.from_notation("E8"): "kq",
+                    Position.from_notation("H8"): "k", Position.from_notation("A8"): "q"}
+
+
+# zobrist keys, from a fixed seed so that hashes agree across processes and restarts
+_zobrist_random = random.Random(20141220)
+
+def _zobrist_key():
+    return _zobrist_random.getrandbits(64)
+
+ZOBRIST_PIECES = {(color, piece_type.NOTATION): [_zobrist_key() for index in range(64)]
+                  for color in Color for piece_type in [King, Queen, Rook, Bishop, Knight, Pawn]}
+ZOBRIST_BLACK_TO_MOVE = _zobrist_key()
+ZOBRIST_CASTLING = {right: _zobrist_key() for right in "KQkq"}
+ZOBRIST_EN_PASSANT = [_zobrist_key() for col in range(8)]
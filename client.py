@@ -1,64 +1,467 @@
 from urllib.request import urlopen
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode, urlsplit
+import http.client
 import json
+import threading
+import time
 import chess
-from chess import Board, Color, Position, Piece
+from chess import Board, Color, Move, Position, Piece
 
 LOCALHOST = "http://127.0.0.1:5000"
 
-class GameConnection:
+# how long a subscription waits before reconnecting to a dropped /events stream
+RECONNECT_SECONDS = 2
 
-    def __init__(self, base_url):
+# how many moves behind the cached board can be and still be caught up move by move,
+# rather than reloaded
+DELTA_LIMIT = 16
+
+# the board formats a server can send, the compact ones are a fraction of the size of the json
+# and much quicker to turn back into a Board
+WIRE_FORMATS = {"json": "application/json", "fen": "application/x-chess-fen", "packed": "application/x-chess-packed"}
+DECODERS = {WIRE_FORMATS["fen"]: lambda body: Board.from_fen(body.decode('ascii')),
+            WIRE_FORMATS["packed"]: Board.from_packed}
+
+# errors that mean a kept alive connection was closed by the server while it sat idle
+STALE_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+# statuses worth trying an idempotent request again for
+RETRY_STATUSES = (502, 503, 504)
+
+class ConnectionPool:
+    """Persistent HTTP/1.1 connections to one server, kept alive and reused between requests.
+    Idempotent requests that fail are retried up to retries times, backing off exponentially,
+    and stats counts the requests, retries, connections opened and the time spent waiting."""
+
+    def __init__(self, url, size=4, timeout=10.0, retries=3, backoff_seconds=0.1):
+        parts = urlsplit(url)
+        self.connection_type = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+        self.host = parts.hostname
+        self.port = parts.port
+        # how many idle connections to hold on to, more than that are closed once they're done
+        self.size = size
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+        self.idle = []
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "retries": 0, "connections": 0, "seconds": 0.0, "max_seconds": 0.0}
+
+    @classmethod
+    def for_url(constructor, url):
+        """the pool shared by everything talking to url's server"""
+        parts = urlsplit(url)
+        with _pools_lock:
+            key = (parts.scheme, parts.netloc)
+            if key not in _pools:
+                _pools[key] = constructor(url)
+            return _pools[key]
+
+    def _acquire(self):
+        with self.lock:
+            if self.idle:
+                return self.idle.pop(), True
+            self.stats["connections"] += 1
+        return self.connection_type(self.host, self.port, timeout=self.timeout), False
+
+    def _release(self, connection):
+        with self.lock:
+            if len(self.idle) < self.size:
+                self.idle.append(connection)
+                return
+        connection.close()
+
+    def request(self, method, path, body=None, headers={}, idempotent=False):
+        """returns the status, headers and body of the response. connection failures raise URLError"""
+        start = time.monotonic()
+        attempt = 0
+        while True:
+            connection, reused = self._acquire()
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                data = response.read()
+            except (http.client.HTTPException, OSError) as e:
+                connection.close()
+                # the server never saw a request sent down a connection it had already closed
+                stale = reused and isinstance(e, STALE_ERRORS)
+                if not stale and (not idempotent or attempt >= self.retries):
+                    self._record(start)
+                    raise URLError(e)
+                self._retry(attempt if not stale else None)
+                attempt += not stale
+                continue
+            if response.will_close:
+                connection.close()
+            else:
+                self._release(connection)
+            if idempotent and response.status in RETRY_STATUSES and attempt < self.retries:
+                self._retry(attempt)
+                attempt += 1
+                continue
+            self._record(start)
+            return response.status, response.headers, data
+
+    def _retry(self, attempt):
+        with self.lock:
+            self.stats["retries"] += 1
+        if attempt is not None:
+            time.sleep(self.backoff_seconds * 2 ** attempt)
+
+    def _record(self, start):
+        elapsed = time.monotonic() - start
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["seconds"] += elapsed
+            self.stats["max_seconds"] = max(self.stats["max_seconds"], elapsed)
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for connection in idle:
+            connection.close()
+
+
+# the shared pools handed out by ConnectionPool.for_url, by scheme and host
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class CachedGame:
+    """The client side copy of a game that GameConnection and the asyncio client keep, and the
+    bookkeeping for their requests that doesn't depend on how the requests are made."""
+
+    def __init__(self, base_url, wire_format="packed"):
         self.base_url = base_url
+        self.path = urlsplit(base_url).path
+        # servers that don't know the compact formats just answer with json
+        self.accept = WIRE_FORMATS[wire_format]
+        if wire_format != "json":
+            self.accept += ", application/json;q=0.5"
         self.invalidated = True
-        print("initializing connection to: " + base_url)
-        self._validate() # does the first load
-        print("initialized connection to: " + base_url)
+        # url -> (etag, response) for conditional requests
+        self._etags = {}
+        # the server's version of the game that the cached board is at, if it's known
+        self._version = None
 
-    def _get(self, path, **kwargs):
-        url = self.base_url + path
-
-        # assemble url args
+    def _url(self, path, **kwargs):
+        url = self.path + path
         if kwargs:
-            url += "?" + "&".join([key + "=" + str(kwargs[key]) for key in kwargs])
+            url += "?" + urlencode(kwargs)
+        return url
+
+    def _request_headers(self, url, conditional, etag=None):
+        # conditional requests send back the last ETag, and get an empty 304 if nothing changed.
+        # etag is sent in its place for a response the caller keeps itself, like the cached board
+        headers = {"Accept": self.accept}
+        cached = self._etags.get(url) if conditional else None
+        if cached or etag:
+            headers["If-None-Match"] = etag or cached[0]
+        return headers
 
-        resp = json.loads(urlopen(url).read().decode('utf8'))
+    def _response(self, url, conditional, status, headers, body, etag=None):
+        cached = self._etags.get(url) if conditional else None
+        if status == 304 and etag:
+            return None
+        if status == 304 and cached:
+            return cached[1]
+        _check(self.base_url + url[len(self.path):], status, headers)
+        resp = _decode(headers, body)
+        etag = headers.get("ETag")
+        if conditional and etag:
+            self._etags[url] = (etag, resp)
         return resp
 
     def _load_from_response(self, resp):
         next_turn = {"turn": resp["turn"], "current_player": resp["current_player"]}
-        self._cached_board = Board.from_notation(resp["board"])
+        board = resp["board"]
+        if isinstance(board, Board):
+            self._cached_board = board
+            self._version = resp.get("version")
+        else:
+            # the json board has no castling rights or en passant square, so moves can't
+            # safely be played on it and the next sync has to load the whole board
+            self._cached_board = Board.from_notation(board)
+            self._version = None
         return next_turn
 
-    def _validate(self):
-        if self.invalidated:
-            self._load_from_response(self._get("/board"))
-            self.invalidated = False
+    def _load_changes(self, resp):
+        if "moves" in resp:
+            # only what happened since our version, played on the board we already have
+            for notation in resp["moves"]:
+                self._cached_board.make(Move.from_notation(notation))
+        else:
+            self._cached_board = Board.from_fen(resp["fen"])
+        self._version = resp["version"]
+        self.invalidated = False
+
+    def _move_args(self, begin, end, promotion):
+        """the /move query, with the version of the cached board so that the server can leave the
+        board out of its answer when the move follows straight on from it"""
+        kwargs = {"begin": begin, "end": end}
+        if promotion:
+            kwargs["promotion"] = promotion
+        if self._version and not self.invalidated:
+            kwargs["since"] = self._version
+        return kwargs
+
+    def _load_move(self, begin, end, resp, promotion=None):
+        if "error" not in resp and _follows(self._version, resp.get("version")):
+            # nothing else happened in between, so just play the move on the cached board
+            self._cached_board.make(Move(Position.from_notation(str(begin)), Position.from_notation(str(end)),
+                                         Piece.from_notation(promotion) if promotion else None))
+            self._version = resp["version"]
+            return {"turn": resp["turn"], "current_player": resp["current_player"]}
+        if "board" not in resp:
+            # a short answer we can't place, the next sync catches the board up
+            self.refresh()
+            return {"turn": resp["turn"], "current_player": resp["current_player"]}
+        # take advantage of the move response to refresh the board
+        return self._load_from_response(resp)
+
+    def _load_unchanged(self):
+        # a 304 from /changes, the cached board is already at the server's version
+        self.invalidated = False
 
     def refresh(self):
         self.invalidated = True
 
+
+class GameConnection(CachedGame):
+
+    def __init__(self, base_url, wire_format="packed", pool=None):
+        CachedGame.__init__(self, base_url, wire_format)
+        # requests go through a pool of keep-alive connections shared with every other
+        # connection to the same server, unless a differently configured pool is passed in
+        self.pool = pool or ConnectionPool.for_url(base_url)
+        print("initializing connection to: " + base_url)
+        self._validate() # does the first load
+        print("initialized connection to: " + base_url)
+
+    @classmethod
+    def new_game(constructor, server_url):
+        """creates a fresh game on the server and connects to it"""
+        resp = _post(server_url + "/games", {})
+        return constructor(server_url + "/games/" + resp["id"])
+
+    def _get(self, path, conditional=False, idempotent=True, etag=None, **kwargs):
+        url = self._url(path, **kwargs)
+        status, headers, body = self.pool.request("GET", url, headers=self._request_headers(url, conditional, etag),
+                                                  idempotent=idempotent)
+        return self._response(url, conditional, status, headers, body, etag)
+
+    def stats(self):
+        """request counts and latency for this connection's server, see ConnectionPool"""
+        return dict(self.pool.stats)
+
+    def _validate(self):
+        if self.invalidated:
+            try:
+                resp = self._get("/changes", etag=self._version, since=self._version or "", limit=DELTA_LIMIT)
+            except HTTPError:
+                # an older server without /changes
+                self._load_from_response(self._get("/board"))
+                self.invalidated = False
+                return
+            if resp is None:
+                self._load_unchanged()
+            else:
+                self._load_changes(resp)
+
     def board(self):
         self._validate()
         return self._cached_board
 
     def turn(self):
-        return self._get("/turn")
+        return self._get("/turn", conditional=True)
+
+    def history(self, since=0, limit=None):
+        """the moves played from ply since onwards, pass back the response's "next" to get later ones"""
+        if limit is None:
+            return self._get("/history", since=since)
+        return self._get("/history", since=since, limit=limit)
+
+    def moves(self, square=None):
+        """the current player's legal moves as notation, or only the moves of the piece on square"""
+        if square is None:
+            return self._get("/moves", conditional=True)
+        return self._get("/moves", conditional=True, **{"from": square})
 
     def print_board(self):
         pretty(self._get("/board"))
 
-    def move(self, begin, end):
-        resp = self._get("/move", begin=begin, end=end)
-        # take advantage of the move response to refresh the board
-        return self._load_from_response(resp)
+    def _open_events(self, since=None):
+        return urlopen(self.base_url + "/events" + ("?since=" + str(since) if since is not None else ""))
+
+    def events(self, since=None, stream=None):
+        """yields the game state pushed by the server every time a move or reset happens"""
+        stream = stream or self._open_events(since)
+        with stream:
+            parser = EventParser()
+            for line in stream:
+                state = parser.feed(line)
+                if state is not None:
+                    yield state
+
+    def subscribe(self, callback):
+        """calls callback(state) on a background thread whenever the game changes. returns the
+        Subscription, or None if the server can't push changes and the caller has to poll"""
+        try:
+            stream = self._open_events()
+        except (HTTPError, URLError):
+            return None
+        return Subscription(self, callback, stream)
+
+    def wait_for_turn(self, color, poll_seconds=5):
+        """blocks until it is color's turn, listening for pushed changes if the server supports them"""
+        color = str(color)
+        try:
+            for state in self.events():
+                if state["current_player"] == color:
+                    self.refresh()
+                    return state
+        except (HTTPError, URLError):
+            pass
+        while self.turn()["current_player"] != color:
+            time.sleep(poll_seconds)
+        self.refresh()
+        return self.turn()
+
+    def move(self, begin, end, promotion=None):
+        """plays a move, promotion is the notation of the piece a pawn becomes, a queen by default"""
+        resp = self._get("/move", idempotent=False, **self._move_args(begin, end, promotion))
+        return self._load_move(begin, end, resp, promotion)
+
+    def move_many(self, moves, atomic=False):
+        """plays several moves in one round trip. moves are (begin, end) or (begin, end, promotion)
+        tuples, or dicts that may also name another "game" on the same server. returns the
+        per move results, and leaves the cached board at the final position."""
+        entries = [_batch_entry(move) for move in moves]
+        resp = _post(self.base_url + "/batch", {"moves": entries, "atomic": atomic}, self.pool)
+        # moves that didn't name a game went to this connection's game
+        own = [result["game"] for entry, result in zip(entries, resp["results"]) if "game" not in entry]
+        if own:
+            self._load_from_response(resp["games"][own[0]])
+        else:
+            self.refresh()
+        return resp["results"]
 
     def reset(self):
-        resp = self._get("/reset")
+        resp = self._get("/reset", idempotent=False)
         return self._load_from_response(resp)
 
 
+def _follows(version, next_version):
+    """whether next_version is the version straight after version, they look like "<nonce>-<number>" """
+    if not version or not next_version:
+        return False
+    nonce, _, number = version.rpartition("-")
+    next_nonce, _, next_number = next_version.rpartition("-")
+    return nonce == next_nonce and number.isdigit() and next_number.isdigit() and int(next_number) == int(number) + 1
+
+def _check(url, status, headers):
+    # raises for failures just like urlopen would
+    if status >= 400:
+        raise HTTPError(url, status, headers.get("X-Chess-Error", http.client.responses.get(status, "")), headers, None)
+
+def _decode(headers, body):
+    """the response as a dict like the /board json, with compact boards decoded to a Board"""
+    mimetype = headers.get_content_type()
+    if mimetype not in DECODERS:
+        return json.loads(body.decode('utf8'))
+    board = DECODERS[mimetype](body)
+    resp = {"turn": board.fullmove, "current_player": str(board.to_move), "board": board}
+    # the status, and an error or anything else, come as X-Chess-<Name> headers
+    for header, value in headers.items():
+        if header.lower().startswith("x-chess-"):
+            resp[header[len("x-chess-"):].lower()] = value
+    return resp
+
+def _post(url, body, pool=None):
+    pool = pool or ConnectionPool.for_url(url)
+    status, headers, data = pool.request("POST", urlsplit(url).path, body=json.dumps(body).encode('utf8'),
+                                         headers={"Content-Type": "application/json"})
+    _check(url, status, headers)
+    return json.loads(data.decode('utf8'))
+
+def _batch_entry(move):
+    if isinstance(move, dict):
+        return {key: str(value) for key, value in move.items()}
+    entry = {"begin": str(move[0]), "end": str(move[1])}
+    if len(move) > 2:
+        entry["promotion"] = str(move[2])
+    return entry
+
+def move_many(server_url, moves, atomic=False):
+    """plays moves across any number of games on one server in a single round trip,
+    moves are dicts with "game", "begin", "end" and optionally "promotion" """
+    return _post(server_url + "/batch", {"moves": [_batch_entry(move) for move in moves], "atomic": atomic})
+
+
+class EventParser:
+    """turns the lines of a server sent event stream into the states they carry"""
+
+    def __init__(self):
+        self.fields = {}
+
+    def feed(self, line):
+        """takes the next line, returning the event's state if the line finished one"""
+        line = line.decode('utf8').rstrip("\r\n")
+        if not line:
+            # a blank line ends the event
+            fields, self.fields = self.fields, {}
+            if "data" in fields:
+                return json.loads(fields["data"])
+        elif not line.startswith(":"):
+            field, _, value = line.partition(":")
+            self.fields[field] = value[1:] if value.startswith(" ") else value
+        return None
+
+
+class Subscription(threading.Thread):
+    """background listener for GameConnection.subscribe, reconnecting if the stream drops"""
+
+    def __init__(self, conn, callback, stream):
+        threading.Thread.__init__(self, daemon=True)
+        self.conn = conn
+        self.callback = callback
+        self.stream = stream
+        self.closed = False
+        self.start()
+
+    def run(self):
+        since = None
+        while not self.closed:
+            try:
+                for state in self.conn.events(since, self.stream):
+                    if self.closed:
+                        return
+                    since = state["version"]
+                    self.conn.refresh()
+                    self.callback(state)
+            except (HTTPError, URLError, OSError, ValueError, AttributeError):
+                # http.client raises AttributeError when close() shuts the stream from another thread
+                pass
+            while not self.closed:
+                time.sleep(RECONNECT_SECONDS)
+                try:
+                    self.stream = self.conn._open_events(since)
+                    break
+                except (HTTPError, URLError, OSError):
+                    pass
+
+    def close(self):
+        self.closed = True
+        try:
+            self.stream.close()
+        except OSError:
+            pass
+
+
 def pretty(resp):
     board = resp["board"]
+    if isinstance(board, Board):
+        board = board.to_notation()
     print("it is " + resp["current_player"] + "'s turn!")
     print("     " + "     ".join("ABCDEFGH"))
     for row_num, row in enumerate(board):
@@ -67,6 +470,19 @@ def pretty(resp):
     print("     " + "     ".join("ABCDEFGH"))
 
 
+def _legal_move(board, begin, end, promotion=None):
+    """the Move from begin to end for the mocks, raising if the side to move can't play it"""
+    move = Move(Position.from_notation(str(begin)), Position.from_notation(str(end)),
+                Piece.from_notation(promotion) if promotion else None)
+    legal = board.legal_moves(board.to_move)
+    if move not in legal and promotion is None:
+        # a pawn reaching the last rank becomes a queen unless told otherwise, as on the server
+        move = Move(move.begin, move.end, chess.Queen)
+    if move not in legal:
+        raise Exception("cannot move there!")
+    return move
+
+
 class MockGameConnection:
 
     def __init__(self):
@@ -89,19 +505,30 @@ class MockGameConnection:
         # no op because it's all local
         pass
 
+    def subscribe(self, callback):
+        # every change happens in this process, so there's nothing to be pushed
+        return None
+
     def board(self):
         return self._board
 
     def turn(self):
         return {"turn": self.turn_count, "current_player": self.cur_player}
 
+    def moves(self, square=None):
+        square = Position.from_notation(str(square)) if square is not None else None
+        # the mock lets one player move both sides, so it goes by the board's side to move
+        to_move = self._board.to_move
+        return {"moves": [move.to_notation() for move in self._board.legal_moves(to_move)
+                          if square is None or move.begin is square],
+                "current_player": str(to_move), "status": self._board.status(to_move)}
+
     def print_board(self):
         pretty({"board": self._board.to_notation(), "current_player": str(self.cur_player)})
 
-    def move(self, begin, end):
-        begin_position = Position.from_notation(str(begin))
-        end_position = Position.from_notation(str(end))
-        self._board.at(begin_position).move_to(end_position)
+    def move(self, begin, end, promotion=None):
+        self._board.make(_legal_move(self._board, begin, end, promotion))
+        self._next_turn()
         return self.turn()
 
     def reset(self):
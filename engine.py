@@ -0,0 +1,465 @@
+import argparse
+import ctypes
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+import chess
+from chess import Board, Color
+
+# piece values in centipawns, the king's doesn't matter since it's never captured
+VALUES = {"P": 100, "N": 320, "B": 330, "R": 500, "Q": 900, "K": 0}
+
+# bonuses by square for white pieces, from A1 to H8. black uses the same tables mirrored top to bottom
+_PAWN_SQUARES = [0] * 8 + [5, 10, 10, -20, -20, 10, 10, 5] + [5, -5, -10, 0, 0, -10, -5, 5] + \
+                [0, 0, 0, 20, 20, 0, 0, 0] + [5, 5, 10, 25, 25, 10, 5, 5] + [10, 10, 20, 30, 30, 20, 10, 10] + \
+                [50] * 8 + [0] * 8
+_CENTER = [min(col, 7 - col) + min(row, 7 - row) for row in range(8) for col in range(8)]
+PIECE_SQUARES = {"P": _PAWN_SQUARES,
+                 "N": [8 * center - 30 for center in _CENTER],
+                 "B": [4 * center - 10 for center in _CENTER],
+                 "R": [0] * 48 + [10] * 8 + [0] * 8,
+                 "Q": [2 * center - 5 for center in _CENTER],
+                 # tucked away on the back row, out of the center
+                 "K": [20, 30, 10, 0, 0, 10, 30, 20] + [-10 * center for center in _CENTER[8:]]}
+
+MATE = 100000
+# scores beyond this are mates, which are stored in the transposition table relative to the node
+MATE_BOUND = MATE - 1000
+INFINITY = MATE + 1
+
+# transposition table entry bounds
+EXACT, LOWER, UPPER = range(3)
+
+# how many nodes go by between looks at the clock
+CLOCK_NODES = 1024
+
+
+class OutOfTime(Exception):
+    pass
+
+
+class SearchResult:
+
+    def __init__(self, move, score, depth, nodes, seconds, pv):
+        self.move = move
+        # centipawns from the point of view of the side to move, or MATE minus plies to a mate
+        self.score = score
+        self.depth = depth
+        self.nodes = nodes
+        self.seconds = seconds
+        self.pv = pv
+
+    @property
+    def nodes_per_second(self):
+        return self.nodes / max(self.seconds, 1e-9)
+
+    def __str__(self):
+        return "depth {:2d} score {:6d} nodes {:9d} {:9.0f} nodes/sec pv {}".format(
+            self.depth, self.score, self.nodes, self.nodes_per_second, " ".join(move.to_notation() for move in self.pv))
+
+
+def evaluate(board):
+    """static score of the position in centipawns, from the point of view of the side to move"""
+    score = 0
+    for piece in board.pieces():
+        notation = piece.NOTATION
+        position = piece.position
+        if piece.color is Color.white:
+            score += VALUES[notation] + PIECE_SQUARES[notation][position.index]
+        else:
+            score -= VALUES[notation] + PIECE_SQUARES[notation][(7 - position.row) * 8 + position.col]
+    return score if board.to_move is Color.white else -score
+
+def _victim(board, move):
+    captured = board.captured_position(move)
+    return 0 if captured is None else VALUES[board.at(captured).NOTATION]
+
+
+class TranspositionTable:
+    """Fixed size table of search results keyed by zobrist key. A slot keeps whichever entry cost
+    the most to find: a new entry replaces one from an earlier search or a shallower one, and
+    otherwise the deeper entry from the current search stays."""
+
+    def __init__(self, size=1 << 18):
+        self.size = size
+        # (key, depth, score, bound, move, generation) or None
+        self.entries = [None] * size
+        self.generation = 0
+
+    def new_search(self):
+        self.generation += 1
+
+    def get(self, key):
+        entry = self.entries[key % self.size]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    def put(self, key, depth, score, bound, move):
+        index = key % self.size
+        entry = self.entries[index]
+        if entry is None or entry[0] == key or entry[5] != self.generation or depth >= entry[1]:
+            self.entries[index] = (key, depth, score, bound, move, self.generation)
+
+    def clear(self):
+        self.entries = [None] * self.size
+
+
+class SharedTranspositionTable(TranspositionTable):
+    """TranspositionTable in shared memory, so search processes can use each other's results.
+    Each entry is two 64 bit words, the key xored with the data and the data itself, so an entry
+    torn by two processes writing it at once no longer matches its key and reads as a miss
+    rather than as garbage. Make one in the parent and hand it to worker processes as they start."""
+
+    def __init__(self, size=1 << 18, slots=None, generation=0):
+        self.size = size
+        self.slots = slots if slots is not None else multiprocessing.RawArray(ctypes.c_uint64, 2 * size)
+        self.generation = generation
+
+    def get(self, key):
+        index = 2 * (key % self.size)
+        data = self.slots[index + 1]
+        if self.slots[index] ^ data != key:
+            return None
+        code = data >> 42 & 0x7fff
+        return (key, data >> 32 & 0xff, (data & 0xffffffff) - (1 << 31), data >> 40 & 3,
+                chess.Move.from_code(code) if code else None, data >> 57)
+
+    def put(self, key, depth, score, bound, move):
+        index = 2 * (key % self.size)
+        data = self.slots[index + 1]
+        check = self.slots[index] ^ data
+        generation = self.generation & 0x7f
+        if data == 0 or check == key or data >> 57 != generation or depth >= data >> 32 & 0xff:
+            # a0a0 is never a move, so code 0 means none
+            data = ((score + (1 << 31)) | depth << 32 | bound << 40 | (move.to_code() if move else 0) << 42
+                    | generation << 57)
+            self.slots[index] = key ^ data
+            self.slots[index + 1] = data
+
+    def clear(self):
+        ctypes.memset(self.slots, 0, ctypes.sizeof(self.slots))
+
+
+class Engine:
+    """Alpha-beta search with iterative deepening under a time budget, a transposition table,
+    captures ordered most valuable victim first and then least valuable attacker, killer moves,
+    and a quiescence search of captures at the leaves."""
+
+    def __init__(self, table_size=1 << 18, table=None, stop=None):
+        self.table = table if table is not None else TranspositionTable(table_size)
+        # a shared flag another process can set to end the search early
+        self.stop = stop
+        # lazy smp helpers start deeper so they aren't all searching the same tree in step
+        self.first_depth = 1
+        self.nodes = 0
+        self.deadline = None
+        self.killers = []
+        # zobrist keys of the positions on the current line, to score repetitions as draws
+        self.path = []
+
+    def search(self, board, seconds=1.0, max_depth=64, report=None):
+        """the best move found for the side to move within seconds, as a SearchResult. report, if
+        given, is called with the result of every depth as it completes"""
+        start = time.perf_counter()
+        self.deadline = start + seconds
+        self.nodes = 0
+        self.table.new_search()
+        moves = board.legal_moves()
+        if not moves:
+            return None
+        best = SearchResult(moves[0], 0, 0, 0, 0.0, [moves[0]])
+        for depth in range(min(self.first_depth, max_depth), max_depth + 1):
+            self.killers = [[None, None] for ply in range(depth + 1)]
+            self.path = []
+            try:
+                score = self._negamax(board, depth, -INFINITY, INFINITY, 0)
+            except OutOfTime:
+                break
+            pv = self.principal_variation(board, depth)
+            best = SearchResult(pv[0] if pv else best.move, score, depth, self.nodes, time.perf_counter() - start, pv)
+            if report:
+                report(best)
+            # no point looking deeper once a forced mate is found
+            if abs(score) > MATE_BOUND or len(moves) == 1:
+                break
+        best.nodes = self.nodes
+        best.seconds = time.perf_counter() - start
+        return best
+
+    def principal_variation(self, board, depth):
+        """the line the search expects, read back out of the transposition table"""
+        pv = []
+        undos = []
+        seen = set()
+        while len(pv) < depth:
+            entry = self.table.get(board.key)
+            if entry is None or entry[4] is None or board.key in seen or entry[4] not in board.legal_moves():
+                break
+            seen.add(board.key)
+            pv.append(entry[4])
+            undos.append(board.make(entry[4]))
+        for undo in reversed(undos):
+            board.unmake(undo)
+        return pv
+
+    def _tick(self):
+        self.nodes += 1
+        if self.nodes % CLOCK_NODES == 0 and (time.perf_counter() > self.deadline or
+                                              (self.stop is not None and self.stop.value)):
+            raise OutOfTime()
+
+    def _order(self, board, moves, best_move, ply):
+        killers = self.killers[ply] if ply < len(self.killers) else ()
+
+        def priority(move):
+            if move == best_move:
+                return 1000000
+            victim = _victim(board, move)
+            if victim or move.promotion:
+                attacker = VALUES[board.at(move.begin).NOTATION]
+                return 100000 + victim * 10 - attacker + (VALUES[move.promotion.NOTATION] if move.promotion else 0)
+            if move in killers:
+                return 50000
+            return 0
+        return sorted(moves, key=priority, reverse=True)
+
+    def _negamax(self, board, depth, alpha, beta, ply):
+        self._tick()
+        key = board.key
+        if ply and (key in self.path or board.halfmove_clock >= 100):
+            return 0
+        original_alpha = alpha
+
+        entry = self.table.get(key)
+        best_move = None
+        if entry is not None:
+            best_move = entry[4]
+            if ply and entry[1] >= depth:
+                score = _from_table(entry[2], ply)
+                if entry[3] == EXACT:
+                    return score
+                if entry[3] == LOWER:
+                    alpha = max(alpha, score)
+                else:
+                    beta = min(beta, score)
+                if alpha >= beta:
+                    return score
+
+        moves = board.legal_moves()
+        if not moves:
+            return -MATE + ply if board.is_check() else 0
+        if depth <= 0:
+            return self._quiescence(board, alpha, beta, ply, moves)
+
+        best_score = -INFINITY
+        self.path.append(key)
+        try:
+            for move in self._order(board, moves, best_move, ply):
+                quiet = _victim(board, move) == 0 and not move.promotion
+                undo = board.make(move)
+                try:
+                    score = -self._negamax(board, depth - 1, -beta, -alpha, ply + 1)
+                finally:
+                    board.unmake(undo)
+                if score > best_score:
+                    best_score = score
+                    best_move = move
+                if score > alpha:
+                    alpha = score
+                if alpha >= beta:
+                    if quiet and ply < len(self.killers) and move not in self.killers[ply]:
+                        self.killers[ply] = [move, self.killers[ply][0]]
+                    break
+        finally:
+            self.path.pop()
+
+        if best_score <= original_alpha:
+            bound = UPPER
+        elif best_score >= beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        self.table.put(key, depth, _to_table(best_score, ply), bound, best_move)
+        return best_score
+
+    def _quiescence(self, board, alpha, beta, ply, moves=None):
+        """searches captures and promotions only, until the position is quiet enough to evaluate.
+        moves are the legal moves, if the caller has already generated them"""
+        self._tick()
+        stand_pat = evaluate(board)
+        if stand_pat >= beta:
+            return stand_pat
+        alpha = max(alpha, stand_pat)
+        if moves is None:
+            moves = board.legal_moves()
+        captures = [move for move in moves if move.promotion or _victim(board, move)]
+        for move in self._order(board, captures, None, len(self.killers)):
+            undo = board.make(move)
+            try:
+                score = -self._quiescence(board, -beta, -alpha, ply + 1)
+            finally:
+                board.unmake(undo)
+            if score >= beta:
+                return score
+            alpha = max(alpha, score)
+        return alpha
+
+
+def _to_table(score, ply):
+    # mates are stored as distances from this node, so they're still right when reached another way
+    if score > MATE_BOUND:
+        return score + ply
+    if score < -MATE_BOUND:
+        return score - ply
+    return score
+
+def _from_table(score, ply):
+    if score > MATE_BOUND:
+        return score - ply
+    if score < -MATE_BOUND:
+        return score + ply
+    return score
+
+
+# the shared table and stop flag of a search worker process, set as the process starts
+_worker_slots = None
+_worker_stop = None
+
+def _start_worker(slots, stop):
+    global _worker_slots, _worker_stop
+    _worker_slots, _worker_stop = slots, stop
+
+def _search_worker(args):
+    fen, seconds, max_depth, worker, generation = args
+    table = SharedTranspositionTable(len(_worker_slots) // 2, _worker_slots, generation)
+    engine = Engine(table=table, stop=_worker_stop)
+    engine.first_depth = 1 + worker % 2
+    result = engine.search(Board.from_fen(fen), seconds, max_depth)
+    # the first worker to finish, at the time limit or by running out of depth, stops the rest
+    _worker_stop.value = 1
+    return worker, result
+
+
+class ParallelEngine:
+    """Lazy SMP: every worker process searches the same position, sharing one transposition table
+    in shared memory, so each finds much of its tree already searched by the others. The first
+    worker to finish stops the rest, and the deepest search wins. The workers stay up between
+    searches, so close the engine, or use it as a context manager, when done with it."""
+
+    def __init__(self, processes=None, table_size=1 << 20):
+        self.processes = processes or multiprocessing.cpu_count()
+        self.table = SharedTranspositionTable(table_size)
+        self.stop = multiprocessing.RawValue(ctypes.c_byte, 0)
+        self.pool = ProcessPoolExecutor(self.processes, initializer=_start_worker,
+                                        initargs=(self.table.slots, self.stop))
+
+    def search(self, board, seconds=1.0, max_depth=64, report=None):
+        """as Engine.search, though report is only called once with the final result"""
+        if not board.legal_moves():
+            return None
+        start = time.perf_counter()
+        self.stop.value = 0
+        jobs = [(board.to_fen(), seconds, max_depth, worker, self.table.generation)
+                for worker in range(self.processes)]
+        self.table.new_search()
+        futures = [self.pool.submit(_search_worker, job) for job in jobs]
+        wait(futures)
+        results = [future.result() for future in futures]
+        worker, best = max(results, key=lambda result: (result[1].depth, -result[0]))
+        best = SearchResult(best.move, best.score, best.depth, sum(result.nodes for worker, result in results),
+                            time.perf_counter() - start, best.pv)
+        if report:
+            report(best)
+        return best
+
+    def close(self):
+        self.stop.value = 1
+        self.pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def benchmark(processes, depth, names=None, report=print):
+    """time to reach depth on the perft positions with one process and then with processes,
+    returning the overall speedup"""
+    import perft
+    names = names or list(perft.POSITIONS)
+    totals = [0.0, 0.0]
+    with ParallelEngine(processes) as parallel:
+        # start the worker processes before the clock is running
+        parallel.search(Board.from_fen(chess.STARTING_FEN), float("inf"), 1)
+        for name in names:
+            board = Board.from_fen(perft.POSITIONS[name][0])
+            single = Engine(table_size=1 << 20).search(board, float("inf"), depth)
+            multi = parallel.search(board, float("inf"), depth)
+            totals[0] += single.seconds
+            totals[1] += multi.seconds
+            report("{:10s} 1 process {:7.2f}s {:8.0f} nodes/sec, {} processes {:7.2f}s {:8.0f} nodes/sec, "
+                   "speedup {:.2f}x".format(name, single.seconds, single.nodes_per_second, processes,
+                                            multi.seconds, multi.nodes_per_second, single.seconds / multi.seconds))
+    report("overall speedup at depth {} with {} processes: {:.2f}x".format(depth, processes, totals[0] / totals[1]))
+    return totals[0] / totals[1]
+
+
+# how long engine_bot thinks for each move
+BOT_SECONDS = 0.5
+
+_bot_engine = None
+
+def engine_bot(board, color):
+    """the engine as a tournament bot, one engine per process so its table carries between moves"""
+    global _bot_engine
+    if _bot_engine is None:
+        _bot_engine = Engine()
+    return _bot_engine.search(board, BOT_SECONDS).move
+
+def play(conn, color, seconds=1.0, engine=None, report=None):
+    """plays color's moves in conn's game with the engine until the game is over, returning how it ended"""
+    engine = engine or Engine()
+    color = Color.white if str(color) == "white" else Color.black
+    while True:
+        conn.wait_for_turn(color)
+        board = Board.from_fen(conn.board().to_fen())
+        status = board.status(color)
+        if status in ("checkmate", "stalemate", "insufficient material"):
+            return status
+        result = engine.search(board, seconds, report=report)
+        move = result.move
+        conn.move(move.begin, move.end, move.promotion.NOTATION if move.promotion else None)
+        if conn.board().to_move is color:
+            # the server turned the move down, most likely because the game is over
+            return "move refused: " + move.to_notation()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="alpha-beta search engine")
+    parser.add_argument("--fen", default=chess.STARTING_FEN, help="the position to search")
+    parser.add_argument("--seconds", type=float, default=5.0, help="time to think for")
+    parser.add_argument("--depth", type=int, default=64, help="the deepest to search")
+    parser.add_argument("--processes", type=int, default=1, help="search processes, 0 for one per core")
+    parser.add_argument("--play", help="url of a game to play in rather than searching one position")
+    parser.add_argument("--color", choices=["white", "black"], default="white", help="the side to play with --play")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="compare time to --depth on the perft positions with one process and with --processes")
+    args = parser.parse_args()
+    processes = args.processes or multiprocessing.cpu_count()
+
+    if args.benchmark:
+        benchmark(processes, args.depth if args.depth < 64 else 5)
+    else:
+        engine = ParallelEngine(processes) if processes > 1 else Engine()
+        try:
+            if args.play:
+                import client
+                print(play(client.GameConnection(args.play), args.color, args.seconds, engine, report=print))
+            else:
+                result = engine.search(Board.from_fen(args.fen), args.seconds, args.depth, report=print)
+                print("best move: " + (result.move.to_notation() if result else "none"))
+        finally:
+            if processes > 1:
+                engine.close()
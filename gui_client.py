@@ -1,7 +1,7 @@
 from tkinter import *
 import tkinter.simpledialog as dialogs
 import tkinter.messagebox as messages
-from enum import Enum, unique
+import queue
 import sys
 import chess
 from chess import Position
@@ -23,11 +23,15 @@ PIECE_IMAGES = {
             "BP": "icons/black_pawn.gif"
         }
 
-EMPTY_IMAGE = "icons/empty.gif"
 LIGHT_MOVABLE_IMAGE = "icons/light_blue.gif"
 DARK_MOVABLE_IMAGE = "icons/dark_blue.gif"
 
+# the piece icons are this many pixels square
+SQUARE_PIXELS = 60
+
 REFRESH_RATE_MILLS = 5000
+# how often changes pushed by the server are picked up, which only checks a local queue
+EVENT_RATE_MILLS = 50
 
 class GameWindow(Frame):
   
@@ -54,25 +58,31 @@ class GameWindow(Frame):
 
         # initialize current turn label
         self.turn_label = Label(self, text="Loading...")
-        self.turn_label.grid(sticky=N+S+E+W, row=0, columnspan=8)
+        self.turn_label.grid(sticky=N+S+E+W, row=0)
 
-        # initialize buttons container
+        # one canvas for the whole board, kept for the life of the window and reused by every game
         self.grid(sticky=N+S+E+W)
-        for index in range(9):
-            self.rowconfigure(index, weight=1, minsize=60)
-        for index in range(8):
-            self.columnconfigure(index, weight=1, minsize=60)
+        self.view = BoardView(self, self.on_click)
+        self.view.grid(row=1)
 
-        # grid of buttons corresponding to board squares
-        self.buttons = [[None] * 8 for x in range(8)]
+        # the selected square, and the squares its piece can move to
         self.selected = None
+        self.targets = set()
+
+        # changes pushed by the server, filled in from the subscription's thread
+        self.subscription = None
+        self.events = queue.Queue()
 
         # registers the refresh call
         self.root.after(REFRESH_RATE_MILLS, self.reload_clock)
 
     def load_conn(self, conn):
+        if self.subscription:
+            self.subscription.close()
         self._conn = conn
         self.current_turn = conn.turn()
+        self.events = queue.Queue()
+        self.subscription = conn.subscribe(self.events.put)
         self.reload_board()
 
     def new_local_game(self):
@@ -93,25 +103,37 @@ class GameWindow(Frame):
         self.reload_board()
 
     def reload_clock(self):
+        if self.subscription:
+            self.check_events()
+            delay = EVENT_RATE_MILLS
+        else:
+            # no push channel, so fall back to polling the server
+            self.check_turn()
+            delay = REFRESH_RATE_MILLS
+        # registers the refresh call again, forming a clock
+        self.root.after(delay, self.reload_clock)
+
+    def check_events(self):
+        state = None
+        while not self.events.empty():
+            state = self.events.get()
+        if state:
+            self.current_turn = {"turn": state["turn"], "current_player": state["current_player"]}
+            self.reset_all()
+
+    def check_turn(self):
         current_turn = self._conn.turn()
         if self.current_turn != current_turn:
             self.current_turn = current_turn
             self._conn.refresh()
             self.reset_all()
-        # registers the refresh call again, forming a clock
-        self.root.after(REFRESH_RATE_MILLS, self.reload_clock)
 
     @property
     def board(self):
         return self._conn.board()
 
     def reload_board(self):
-        self.refresh_label()
-        for row_num, row in enumerate(self.board.rows):
-            for col_num, square in enumerate(row):
-                button = SquareButton(self, self.buttons, row_num, col_num)
-                button.grid(sticky=N+S+E+W, row=row_num + 1, column=col_num)
-                self.buttons[row_num][col_num] = button
+        self.reset_all()
 
     def refresh_label(self):
         message = "Turn: " + str(self.current_turn["turn"]) 
@@ -121,117 +143,101 @@ class GameWindow(Frame):
     def reset_all(self):
         self.refresh_label()
         self.selected = None
-        for button_row in self.buttons:
-            for button in button_row:
-                button.reset()
-
-    def on_click(self, button):
-        if button is self.selected or not self.selected and not button.empty:
-            button.toggle_selected()
-            self.selected = button if button.selected else None
-            # reset if unclick
-            if not button.selected:
-                self.reset_all()
-            else:
-                for position in button.piece.possible_moves:
-                    self.buttons[position.row][position.col].set_movable()
-                for position in button.piece.possible_attacks:
-                    self.buttons[position.row][position.col].set_attackable()
-        if button.movable or button.attackable:
-            self.current_turn = self._conn.move(self.selected.position, button.position)
-            self.reset_all()
-
-
-@unique
-class State(Enum):
-    blank = 1
-    selected = 2
-    movable = 3
-    attackable = 4
-
-class SquareButton(Label):
-
-    def __init__(self, game_window, buttons, row, col):
-        Label.__init__(self, game_window)
-        self.game_window = game_window
-        self.buttons = buttons
-        self.row = row
-        self.col = col
-        self.state = State.blank
-
-        self["highlightbackground"] = "black"
-        self["highlightthickness"] = 1
-        self.bind("<Button-1>", self.on_click)
-        self.reset()
-
-    def update_icon(self):
-        square = self.board[self.row][self.col]
-        image_name = PIECE_IMAGES[square.to_notation()] if square else EMPTY_IMAGE
-        self.set_image(image_name)
-
-    def reset(self):
-        self.state = State.blank
-        self["bg"] = "cornsilk3" if self.is_dark else "linen"
-        self.update_icon()
-
-    @property
-    def board(self):
-        return self.game_window.board
-
-    @property
-    def is_dark(self):
-        return (self.row + self.col) % 2 == 0
-
-    @property
-    def selected(self):
-        return self.state == State.selected
-
-    @property
-    def movable(self):
-        return self.state == State.movable
-
-    @property
-    def attackable(self):
-        return self.state == State.attackable
-
-    @property
-    def position(self):
-        return Position(self.row, self.col)
-
-    @property
-    def piece(self):
-        return self.board.at(self.position)
+        self.targets = set()
+        self.view.clear_highlights()
+        self.view.render(self.board)
 
-    @property
-    def empty(self):
-        return self.board.empty(self.position)
-
-    def set_image(self, image_filename, *, image_cache=dict()):
-        if image_filename not in image_cache:
-            image_cache[image_filename] = PhotoImage(file=image_filename)
-        self.image = image_cache[image_filename]
-        self["image"] = self.image
-
-    def set_selected(self):
-        self.state = State.selected
-        self["bg"] = "goldenrod" if self.is_dark else "pale goldenrod"
-
-    def set_movable(self):
-        self.state = State.movable
-        self.set_image(DARK_MOVABLE_IMAGE if self.is_dark else LIGHT_MOVABLE_IMAGE)
-
-    def set_attackable(self):
-        self.state = State.attackable
-        self["bg"] = "pink"
-
-    def toggle_selected(self):
-        if self.selected:
-            self.reset()
+    def on_click(self, position):
+        if position in self.targets:
+            self.current_turn = self._conn.move(self.selected, position)
+            self.reset_all()
+        elif position == self.selected:
+            # unclicking the piece
+            self.reset_all()
+        elif self.selected is None and not self.board.empty(position):
+            self.selected = position
+            self.view.highlight(position, "selected")
+            # the server works out the legal moves once per position for every client
+            for notation in self._conn.moves(position)["moves"]:
+                target = Position.from_notation(notation[2:4])
+                if target not in self.targets:
+                    self.targets.add(target)
+                    self.view.highlight(target, "movable" if self.board.empty(target) else "attackable")
+
+
+def load_image(image_filename, *, image_cache=dict()):
+    """every window shares one copy of each icon"""
+    if image_filename not in image_cache:
+        image_cache[image_filename] = PhotoImage(file=image_filename)
+    return image_cache[image_filename]
+
+
+class BoardView(Canvas):
+    """The board drawn on a single canvas. Each square has a background and a piece image item
+    made once up front, and render only reconfigures the piece items whose square changed since
+    the last board it drew. Selection and move highlights are items of their own, laid over the
+    squares and deleted when they go away."""
+
+    HIGHLIGHT_COLORS = {"selected": ("goldenrod", "pale goldenrod"), "attackable": ("pink", "pink")}
+
+    def __init__(self, master, on_click):
+        Canvas.__init__(self, master, width=8 * SQUARE_PIXELS, height=8 * SQUARE_PIXELS,
+                        highlightthickness=0, background="white")
+        # load every icon up front rather than stalling on the first move that needs one
+        for image_filename in list(PIECE_IMAGES.values()) + [LIGHT_MOVABLE_IMAGE, DARK_MOVABLE_IMAGE]:
+            load_image(image_filename)
+        # the canvas item showing each square's piece, and the notation of the piece it shows
+        self.piece_items = []
+        self.shown = [""] * 64
+        for position in chess.POSITIONS:
+            left, top = self.corner(position)
+            self.create_rectangle(left, top, left + SQUARE_PIXELS, top + SQUARE_PIXELS, outline="black",
+                                  fill="cornsilk3" if self.is_dark(position) else "linen", tags="square")
+        # pieces are all made after the squares so that they stack above every square
+        for position in chess.POSITIONS:
+            left, top = self.corner(position)
+            self.piece_items.append(self.create_image(left + SQUARE_PIXELS // 2, top + SQUARE_PIXELS // 2,
+                                                      tags="piece"))
+        self.bind("<Button-1>", lambda event: self.clicked(event, on_click))
+
+    @staticmethod
+    def corner(position):
+        # rows go down the window from the first rank, as the board's rows do
+        return position.col * SQUARE_PIXELS, position.row * SQUARE_PIXELS
+
+    @staticmethod
+    def is_dark(position):
+        return (position.row + position.col) % 2 == 0
+
+    def clicked(self, event, on_click):
+        row, col = event.y // SQUARE_PIXELS, event.x // SQUARE_PIXELS
+        if 0 <= row < 8 and 0 <= col < 8:
+            on_click(Position(row, col))
+
+    def render(self, board):
+        for position, piece in zip(chess.POSITIONS, board.squares()):
+            notation = piece.to_notation() if piece else ""
+            if notation != self.shown[position.index]:
+                self.shown[position.index] = notation
+                self.itemconfigure(self.piece_items[position.index],
+                                   image=load_image(PIECE_IMAGES[notation]) if notation else "")
+
+    def highlight(self, position, kind):
+        """marks position as "selected", "movable" or "attackable" until clear_highlights"""
+        left, top = self.corner(position)
+        if kind == "movable":
+            self.create_image(left + SQUARE_PIXELS // 2, top + SQUARE_PIXELS // 2,
+                              image=load_image(DARK_MOVABLE_IMAGE if self.is_dark(position) else LIGHT_MOVABLE_IMAGE),
+                              tags="highlight")
         else:
-            self.set_selected()
-
-    def on_click(self, event):
-        self.game_window.on_click(self)
+            dark, light = self.HIGHLIGHT_COLORS[kind]
+            item = self.create_rectangle(left, top, left + SQUARE_PIXELS, top + SQUARE_PIXELS, outline="black",
+                                         fill=dark if self.is_dark(position) else light, tags="highlight")
+            # over the square's background but under its piece
+            self.tag_lower(item, "piece")
+
+    def clear_highlights(self):
+        self.delete("highlight")
 
         
 if __name__ == '__main__':
@@ -0,0 +1,229 @@
+import argparse
+import json
+import logging
+import threading
+import time
+from collections import Counter
+from urllib.error import URLError
+from urllib.parse import urlencode
+import chess
+from chess import Move
+import client
+import tournament
+
+# how long bots play for, and how long one waiting for its opponent sleeps between /turn polls
+SECONDS = 10.0
+POLL_SECONDS = 0.01
+
+# games are reset once they reach this many moves, so no game stalls the run
+MAX_FULLMOVES = 100
+
+# the latency percentiles reported for every endpoint
+PERCENTILES = [50, 95, 99]
+
+# the compact wire format, as the clients use by default
+ACCEPT = {"Accept": client.WIRE_FORMATS["packed"]}
+
+
+class Recorder:
+    """Every request's latency by endpoint, along with the ones that failed and the moves the server
+    turned down. Bots record from their own threads, so everything goes through one lock."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = Counter()
+        self.rejected = Counter()
+        # how often each failure came up, by endpoint and message, to tell what went wrong
+        self.messages = Counter()
+        self.games = 0
+        self.moves = 0
+
+    def record(self, endpoint, seconds, error=None, rejected=False):
+        with self.lock:
+            self.latencies.setdefault(endpoint, []).append(seconds)
+            if error is not None:
+                self.errors[endpoint] += 1
+                self.messages[endpoint + ": " + error] += 1
+            if rejected:
+                self.rejected[endpoint] += 1
+
+    def finished_game(self):
+        with self.lock:
+            self.games += 1
+
+    def moved(self):
+        with self.lock:
+            self.moves += 1
+
+    def report(self, elapsed):
+        """the run as a json-able dict, with latencies in milliseconds"""
+        with self.lock:
+            endpoints = {}
+            for endpoint, latencies in sorted(self.latencies.items()):
+                latencies = sorted(latencies)
+                summary = {"requests": len(latencies), "requests_per_second": len(latencies) / max(elapsed, 1e-9),
+                           "errors": self.errors[endpoint], "error_rate": self.errors[endpoint] / len(latencies),
+                           "rejected": self.rejected[endpoint],
+                           "mean_ms": 1000 * sum(latencies) / len(latencies), "max_ms": 1000 * latencies[-1]}
+                for p in PERCENTILES:
+                    summary["p" + str(p) + "_ms"] = 1000 * percentile(latencies, p)
+                endpoints[endpoint] = summary
+            requests = sum(len(latencies) for latencies in self.latencies.values())
+            errors = sum(self.errors.values())
+            return {"seconds": elapsed, "requests": requests, "requests_per_second": requests / max(elapsed, 1e-9),
+                    "errors": errors, "error_rate": errors / max(requests, 1),
+                    "games": self.games, "moves": self.moves, "moves_per_second": self.moves / max(elapsed, 1e-9),
+                    "endpoints": endpoints, "error_messages": dict(self.messages.most_common(20))}
+
+
+def percentile(ordered, p):
+    """the nearest rank percentile of already sorted values"""
+    rank = max(int(-(-len(ordered) * p // 100)), 1)
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class SimulatedPlayer(threading.Thread):
+    """Plays colors in one game the way a bot script would: polls /turn until it's to move, fetches
+    the /board, picks a move with a tournament bot and sends it to /move. Whoever is to move when
+    the game ends resets it, so the players of a game never race each other."""
+
+    def __init__(self, url, game_id, colors, bot, recorder, deadline, max_fullmoves=MAX_FULLMOVES):
+        threading.Thread.__init__(self, daemon=True)
+        # no retries, a failed request is counted rather than hidden
+        self.pool = client.ConnectionPool(url, size=1, retries=0)
+        self.path = "/games/" + game_id
+        self.colors = [str(color) for color in colors]
+        self.bot = tournament.load_bot(bot)
+        self.recorder = recorder
+        self.deadline = deadline
+        self.max_fullmoves = max_fullmoves
+
+    def _get(self, endpoint, headers={}, **kwargs):
+        """the decoded response from endpoint, or None if it failed, recording how long it took"""
+        path = self.path + endpoint + ("?" + urlencode(kwargs) if kwargs else "")
+        start = time.perf_counter()
+        try:
+            status, response_headers, body = self.pool.request("GET", path, headers=headers)
+            client._check(path, status, response_headers)
+            resp = client._decode(response_headers, body)
+        except (URLError, ValueError) as e:
+            self.recorder.record(endpoint, time.perf_counter() - start, error=str(e))
+            return None
+        self.recorder.record(endpoint, time.perf_counter() - start, rejected="error" in resp)
+        return resp
+
+    def run(self):
+        try:
+            while time.monotonic() < self.deadline:
+                self.play_turn()
+        finally:
+            self.pool.close()
+
+    def play_turn(self):
+        turn = self._get("/turn")
+        if turn is None or turn["current_player"] not in self.colors:
+            time.sleep(POLL_SECONDS)
+            return
+        resp = self._get("/board", headers=ACCEPT)
+        if resp is None:
+            return
+        board = resp["board"]
+        if resp["status"] in chess.GAME_OVER or board.fullmove > self.max_fullmoves:
+            if self._get("/reset", headers=ACCEPT) is not None:
+                self.recorder.finished_game()
+            return
+        move = self.bot(board, board.to_move)
+        move = Move.from_notation(move) if isinstance(move, str) else move
+        promotion = {"promotion": move.promotion.NOTATION} if move.promotion else {}
+        resp = self._get("/move", headers=ACCEPT, begin=str(move.begin), end=str(move.end), **promotion)
+        if resp is not None and "error" not in resp:
+            self.recorder.moved()
+
+
+def start_server(host="127.0.0.1", port=0):
+    """serves server.app from a background thread, returning the server and its url"""
+    import server
+    from werkzeug.serving import make_server
+    # a log line per request would cost more than most of the requests being measured
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    httpd = make_server(host, port, server.app, threaded=True)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd, "http://" + host + ":" + str(httpd.server_port)
+
+def create_games(url, count, recorder):
+    """the ids of count new games on the server, fewer if any can't be created"""
+    pool = client.ConnectionPool(url, retries=0)
+    game_ids = []
+    try:
+        for game in range(count):
+            start = time.perf_counter()
+            try:
+                status, headers, body = pool.request("POST", "/games")
+                client._check(url + "/games", status, headers)
+                game_ids.append(json.loads(body.decode("utf8"))["id"])
+            except (URLError, ValueError) as e:
+                recorder.record("/games", time.perf_counter() - start, error=str(e))
+                continue
+            recorder.record("/games", time.perf_counter() - start)
+    finally:
+        pool.close()
+    return game_ids
+
+def run(url, players=8, seconds=SECONDS, bot="random_bot", max_fullmoves=MAX_FULLMOVES):
+    """plays players simulated bots against the server at url for seconds and returns the report.
+    bots play two to a game, and an odd one out plays both sides of its own"""
+    recorder = Recorder()
+    game_ids = create_games(url, (players + 1) // 2, recorder)
+    deadline = time.monotonic() + seconds
+    threads = []
+    for number, game_id in enumerate(game_ids):
+        sides = [[chess.Color.white], [chess.Color.black]] if 2 * number + 1 < players else [list(chess.Color)]
+        threads += [SimulatedPlayer(url, game_id, colors, bot, recorder, deadline, max_fullmoves) for colors in sides]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    report = recorder.report(time.perf_counter() - start)
+    report.update({"url": url, "players": len(threads), "bot": tournament.bot_name(bot)})
+    return report
+
+def print_report(report):
+    print("{} players for {:.1f}s: {} requests, {:.1f} requests/sec, {} moves, {} games finished, {:.2%} errors".format(
+        report["players"], report["seconds"], report["requests"], report["requests_per_second"], report["moves"],
+        report["games"], report["error_rate"]))
+    print("{:10s} {:>9s} {:>9s} {:>8s} {:>8s} {:>8s} {:>8s} {:>8s}".format(
+        "endpoint", "requests", "req/sec", "errors", "p50 ms", "p95 ms", "p99 ms", "max ms"))
+    for endpoint, summary in report["endpoints"].items():
+        print("{:10s} {:9d} {:9.1f} {:8.2%} {:8.2f} {:8.2f} {:8.2f} {:8.2f}".format(
+            endpoint, summary["requests"], summary["requests_per_second"], summary["error_rate"],
+            summary["p50_ms"], summary["p95_ms"], summary["p99_ms"], summary["max_ms"]))
+    for message, count in report["error_messages"].items():
+        print("  {:5d} x {}".format(count, message))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="plays simulated bots against a chess server to measure it under load")
+    parser.add_argument("--players", type=int, default=8, help="simulated bots, each in its own thread, two to a game")
+    parser.add_argument("--seconds", type=float, default=SECONDS, help="how long to play for")
+    parser.add_argument("--bot", default="random_bot", help="the bot picking moves, as module:function")
+    parser.add_argument("--max-fullmoves", type=int, default=MAX_FULLMOVES, help="reset games this long")
+    parser.add_argument("--url", help="an already running server to test, otherwise one is started here")
+    parser.add_argument("--report", help="write the report to this json file, to compare runs against")
+    args = parser.parse_args()
+
+    httpd = None
+    if args.url:
+        url = args.url.rstrip("/")
+    else:
+        httpd, url = start_server()
+    try:
+        report = run(url, args.players, args.seconds, args.bot, args.max_fullmoves)
+    finally:
+        if httpd:
+            httpd.shutdown()
+    print_report(report)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=4, sort_keys=True)
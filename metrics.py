@@ -0,0 +1,163 @@
+import bisect
+import itertools
+import math
+import threading
+import time
+
+# the prometheus client's default latency buckets, in seconds
+DEFAULT_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+# how many independently locked shards updates are spread over
+SHARDS = 16
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _Shard:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (metric name, labels) to a count for counters, or to per bucket counts
+        # followed by the sum and the count for histograms
+        self.values = {}
+
+
+class Metrics:
+    """Counters, histograms and gauges, rendered in the prometheus text format. Every thread is
+    handed one of SHARDS shards the first time it records anything, and only ever takes that
+    shard's lock, so request threads hardly ever wait on each other. render adds up the shards."""
+
+    def __init__(self, shards=SHARDS):
+        self.shards = [_Shard() for index in range(shards)]
+        self.local = threading.local()
+        self.next_shard = itertools.count()
+        # name to (kind, help, buckets or gauge function), in the order they were declared
+        self.declared = {}
+
+    def counter(self, name, help):
+        self.declared[name] = ("counter", help, None)
+        return Counter(self, name)
+
+    def histogram(self, name, help, buckets=DEFAULT_BUCKETS):
+        self.declared[name] = ("histogram", help, sorted(buckets))
+        return Histogram(self, name, sorted(buckets))
+
+    def gauge(self, name, help, function):
+        """a gauge whose value is function(), called when the metrics are rendered"""
+        self.declared[name] = ("gauge", help, function)
+
+    def _shard(self):
+        shard = getattr(self.local, "shard", None)
+        if shard is None:
+            # next on an itertools.count is atomic, so threads spread evenly over the shards
+            shard = self.local.shard = self.shards[next(self.next_shard) % len(self.shards)]
+        return shard
+
+    def totals(self):
+        """every recorded value added up across the shards, by (name, labels)"""
+        totals = {}
+        for shard in self.shards:
+            with shard.lock:
+                values = [(key, list(value) if isinstance(value, list) else value)
+                          for key, value in shard.values.items()]
+            for key, value in values:
+                if key not in totals:
+                    totals[key] = value
+                elif isinstance(value, list):
+                    totals[key] = [total + part for total, part in zip(totals[key], value)]
+                else:
+                    totals[key] += value
+        return totals
+
+    def value(self, name, **labels):
+        """one counter's total, or one histogram's per bucket counts, sum and count"""
+        return self.totals().get((name, _labels(labels)))
+
+    def render(self):
+        totals = self.totals()
+        by_name = {}
+        for (name, labels), value in sorted(totals.items()):
+            by_name.setdefault(name, []).append((labels, value))
+        lines = []
+        for name, (kind, help, extra) in self.declared.items():
+            lines.append("# HELP " + name + " " + help)
+            lines.append("# TYPE " + name + " " + kind)
+            if kind == "gauge":
+                lines.append(name + " " + _number(extra()))
+                continue
+            for labels, value in by_name.get(name, []):
+                if kind == "counter":
+                    lines.append(name + _format_labels(labels) + " " + _number(value))
+                    continue
+                cumulative = 0
+                for bound, count in zip(extra + [math.inf], value):
+                    cumulative += count
+                    lines.append(name + "_bucket" + _format_labels(labels + (("le", _number(bound)),)) + " " +
+                                 _number(cumulative))
+                lines.append(name + "_sum" + _format_labels(labels) + " " + _number(value[-2]))
+                lines.append(name + "_count" + _format_labels(labels) + " " + _number(value[-1]))
+        return "\n".join(lines) + "\n"
+
+
+class Counter:
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def inc(self, amount=1, **labels):
+        shard = self.metrics._shard()
+        key = (self.name, _labels(labels))
+        with shard.lock:
+            shard.values[key] = shard.values.get(key, 0) + amount
+
+
+class Histogram:
+
+    def __init__(self, metrics, name, buckets):
+        self.metrics = metrics
+        self.name = name
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        shard = self.metrics._shard()
+        key = (self.name, _labels(labels))
+        with shard.lock:
+            counts = shard.values.get(key)
+            if counts is None:
+                # a count per bucket, one more for anything past the last, then the sum and count
+                counts = shard.values[key] = [0] * (len(self.buckets) + 3)
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def time(self, **labels):
+        """a context manager that observes how long its block took"""
+        return _Timer(self, labels)
+
+
+class _Timer:
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+def _labels(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for key, value in labels)
+    return "{" + ",".join(key + '="' + value + '"' for (key, _), value in zip(labels, escaped)) + "}"
+
+def _number(value):
+    return "+Inf" if value == math.inf else repr(value)
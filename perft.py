@@ -0,0 +1,106 @@
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+import chess
+from chess import Board, Move
+from bitboard import BitBoard
+
+# the standard perft positions from the chess programming wiki, with their published node counts by depth
+POSITIONS = {
+    "start": (chess.STARTING_FEN,
+              [20, 400, 8902, 197281, 4865609, 119060324]),
+    "kiwipete": ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+                 [48, 2039, 97862, 4085603, 193690690]),
+    "position3": ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+                  [14, 191, 2812, 43238, 674624, 11030083]),
+    "position4": ("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+                  [6, 264, 9467, 422333, 15833292]),
+    "position5": ("rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+                  [44, 1486, 62379, 2103487, 89941194]),
+    "position6": ("r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+                  [46, 2079, 89890, 3894594, 164075551]),
+}
+
+BOARD_TYPES = {"board": Board, "bitboard": BitBoard}
+
+
+def perft(board, depth):
+    """counts the leaf nodes of the legal move tree under board, depth plies deep"""
+    moves = board.legal_moves()
+    if depth <= 1:
+        # bulk count the last ply rather than making and unmaking each move
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        undo = board.make(move)
+        nodes += perft(board, depth - 1)
+        board.unmake(undo)
+    return nodes
+
+def divide(board, depth):
+    """perft split by root move, for finding which branch disagrees with a reference engine"""
+    counts = {}
+    for move in board.legal_moves():
+        undo = board.make(move)
+        counts[move.to_notation()] = perft(board, depth - 1)
+        board.unmake(undo)
+    return counts
+
+def _perft_after(args):
+    fen, move_notation, depth, board_type_name = args
+    board = BOARD_TYPES[board_type_name].from_fen(fen)
+    board.make(Move.from_notation(move_notation))
+    return move_notation, perft(board, depth - 1)
+
+def parallel_divide(fen, depth, processes=None, board_type_name="board"):
+    """divide with the root moves farmed out across a process pool"""
+    board = BOARD_TYPES[board_type_name].from_fen(fen)
+    jobs = [(fen, move.to_notation(), depth, board_type_name) for move in board.legal_moves()]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return dict(pool.map(_perft_after, jobs))
+
+
+def run(fen, max_depth, expected=None, divide_mode=False, processes=0, board_type_name="board"):
+    """prints nodes, time and nodes/sec for every depth up to max_depth, returns whether all counts matched"""
+    board_type = BOARD_TYPES[board_type_name]
+    all_match = True
+    for depth in range(1, max_depth + 1):
+        start = time.perf_counter()
+        if processes and depth > 1:
+            counts = parallel_divide(fen, depth, processes, board_type_name)
+        elif divide_mode:
+            counts = divide(board_type.from_fen(fen), depth)
+        else:
+            counts = {"": perft(board_type.from_fen(fen), depth)}
+        elapsed = time.perf_counter() - start
+        nodes = sum(counts.values())
+
+        if divide_mode and depth == max_depth:
+            for move_notation in sorted(counts):
+                print("  " + move_notation + ": " + str(counts[move_notation]))
+        line = "depth {:2d}: {:12d} nodes {:9.3f}s {:12.0f} nodes/sec".format(depth, nodes, elapsed, nodes / max(elapsed, 1e-9))
+        if expected and depth <= len(expected):
+            match = nodes == expected[depth - 1]
+            all_match = all_match and match
+            line += "  ok" if match else "  MISMATCH, expected " + str(expected[depth - 1])
+        print(line)
+    return all_match
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="perft move generation benchmark and correctness check")
+    parser.add_argument("--position", choices=sorted(POSITIONS), default="start", help="a standard perft position")
+    parser.add_argument("--fen", help="a custom position, overrides --position")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--divide", action="store_true", help="print the node count under each root move")
+    parser.add_argument("--processes", type=int, default=0, help="split root moves across this many processes")
+    parser.add_argument("--board", choices=sorted(BOARD_TYPES), default="board", help="board implementation to test")
+    args = parser.parse_args()
+
+    if args.fen:
+        fen, expected = args.fen, None
+    else:
+        fen, expected = POSITIONS[args.position]
+    print(fen)
+    ok = run(fen, args.depth, expected, args.divide, args.processes, args.board)
+    raise SystemExit(0 if ok else 1)
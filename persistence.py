@@ -0,0 +1,291 @@
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from chess import Move
+
+# how often the write-ahead log is synced to disk: after every record, every batch_size records,
+# or once interval_seconds have passed since the last sync
+FSYNC_POLICIES = ["always", "batch", "interval"]
+
+# write-ahead log record kinds
+CREATE, MOVE, UNMOVE, RESET, DELETE = range(1, 6)
+
+# crc32 of everything after it, record kind, game id length, Move.to_code and when the move
+# was played, then the game id
+RECORD = struct.Struct("<IBBHd")
+
+# magic, the first log generation that isn't included, and how many games follow
+SNAPSHOT = struct.Struct("<4sII")
+SNAPSHOT_MAGIC = b"RCS1"
+# game id length, FEN length, number of zobrist keys and MoveLog bytes, then each of them
+SNAPSHOT_GAME = struct.Struct("<BHII")
+
+SNAPSHOT_NAME = "snapshot.bin"
+LOG_PREFIX = "wal-"
+LOG_SUFFIX = ".log"
+
+
+def _log_name(generation):
+    return LOG_PREFIX + "%08d" % generation + LOG_SUFFIX
+
+def _log_generation(name):
+    return int(name[len(LOG_PREFIX):-len(LOG_SUFFIX)])
+
+def _mapped(path):
+    """the file memory mapped for reading, or empty bytes since empty files can't be mapped"""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def _fsync_directory(path):
+    # makes renames and new files durable, not every platform can open a directory though
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class Store:
+    """Durable storage for every game in a GameRegistry. Each change to a game is appended to a
+    write-ahead log as a small binary record, and checkpoint writes a snapshot of every game
+    and starts a new log, so restarting only has to load the snapshot and replay the moves since.
+
+    The log is split into numbered generations. The snapshot covers every generation before the
+    one it names, so a crash part way through a checkpoint just replays a little more."""
+
+    def __init__(self, path, fsync="batch", batch_size=64, interval_seconds=1.0, snapshot_records=10000):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError("fsync must be one of " + ", ".join(FSYNC_POLICIES) + ", not: " + str(fsync))
+        self.path = path
+        self.fsync = fsync
+        self.batch_size = batch_size
+        self.interval_seconds = interval_seconds
+        # how many log records to allow before checkpoint_due says it's time for a snapshot
+        self.snapshot_records = snapshot_records
+        # guards the log file, always taken after any game or registry lock
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.log = None
+        self.records = 0
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+        # syncs records left over when appends stop, for the "interval" policy
+        self.flusher = None
+        self.closed = threading.Event()
+        os.makedirs(path, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.path, name)
+
+    def _generations(self):
+        return sorted(_log_generation(name) for name in os.listdir(self.path)
+                      if name.startswith(LOG_PREFIX) and name.endswith(LOG_SUFFIX))
+
+    def recover(self, new_game):
+        """loads every game from the snapshot and the log after it, as a dict of id to game.
+        new_game makes an empty game, which has to offer restore, move, unmove and reset.
+        opens the log for appending, so it has to be called before anything is logged."""
+        games = {}
+        generation = 0
+        if os.path.exists(self._path(SNAPSHOT_NAME)):
+            generation = self._load_snapshot(games, new_game)
+        generations = [later for later in self._generations() if later >= generation]
+        self.records = sum(self._replay(later, games, new_game) for later in generations)
+        self.generation = generations[-1] if generations else generation
+        self.log = open(self._path(_log_name(self.generation)), "ab", buffering=0)
+        if self.fsync == "interval":
+            self.flusher = threading.Thread(target=self._flush, daemon=True)
+            self.flusher.start()
+        return games
+
+    def load(self, game_id, new_game):
+        """one game as it stands in the snapshot and the log, or None if there's no such game, for
+        games that were let go of after recovery. takes the log lock, so nothing is appended meanwhile"""
+        games = {}
+        with self.lock:
+            generation = 0
+            if os.path.exists(self._path(SNAPSHOT_NAME)):
+                generation = self._load_snapshot(games, new_game, only=game_id)
+            for later in self._generations():
+                if later >= generation:
+                    self._replay(later, games, new_game, only=game_id)
+        return games.get(game_id)
+
+    def _load_snapshot(self, games, new_game, only=None):
+        data = _mapped(self._path(SNAPSHOT_NAME))
+        try:
+            magic, generation, count = SNAPSHOT.unpack_from(data, 0)
+            if magic != SNAPSHOT_MAGIC:
+                raise ValueError("not a snapshot: " + self._path(SNAPSHOT_NAME))
+            offset = SNAPSHOT.size
+            for index in range(count):
+                id_length, fen_length, key_count, history_length = SNAPSHOT_GAME.unpack_from(data, offset)
+                offset += SNAPSHOT_GAME.size
+                game_id = data[offset:offset + id_length].decode("utf8")
+                offset += id_length
+                fen = data[offset:offset + fen_length].decode("ascii")
+                offset += fen_length
+                keys = struct.unpack_from("<" + str(key_count) + "Q", data, offset)
+                offset += key_count * 8
+                history = data[offset:offset + history_length]
+                offset += history_length
+                if only is not None and game_id != only:
+                    continue
+                game = new_game()
+                game.restore(fen, keys, history)
+                games[game_id] = game
+            return generation
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+
+    def _replay(self, generation, games, new_game, only=None):
+        """applies one log generation to games, or just to the game with id only, returning how
+        many records it held"""
+        path = self._path(_log_name(generation))
+        data = _mapped(path)
+        # undo records for the moves replayed so far, for the unmoves of rolled back batches
+        undos = {}
+        offset = 0
+        records = 0
+        try:
+            while offset + RECORD.size <= len(data):
+                crc, kind, id_length, code, timestamp = RECORD.unpack_from(data, offset)
+                end = offset + RECORD.size + id_length
+                if end > len(data) or zlib.crc32(data[offset + 4:end]) != crc:
+                    break
+                game_id = data[offset + RECORD.size:end].decode("utf8")
+                offset = end
+                records += 1
+                if only is not None and game_id != only:
+                    continue
+                if kind == CREATE:
+                    games[game_id] = new_game()
+                    undos[game_id] = []
+                elif kind == DELETE:
+                    games.pop(game_id, None)
+                elif game_id not in games:
+                    continue
+                elif kind == MOVE:
+                    undos.setdefault(game_id, []).append(games[game_id].move(Move.from_code(code), timestamp))
+                elif kind == UNMOVE:
+                    games[game_id].unmove(undos[game_id].pop())
+                elif kind == RESET:
+                    games[game_id].reset()
+                    undos[game_id] = []
+            torn = offset < len(data)
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+        if torn and only is None:
+            # the last record was cut off by a crash, drop it so new records follow the good ones
+            with open(path, "r+b") as f:
+                f.truncate(offset)
+        return records
+
+    def append(self, kind, game_id, code=0, timestamp=0.0):
+        game_id = game_id.encode("utf8")
+        body = RECORD.pack(0, kind, len(game_id), code, timestamp)[4:] + game_id
+        with self.lock:
+            self.log.write(struct.pack("<I", zlib.crc32(body)) + body)
+            self.records += 1
+            self.unsynced += 1
+            if (self.fsync == "always" or (self.fsync == "batch" and self.unsynced >= self.batch_size)
+                    or (self.fsync == "interval" and time.monotonic() - self.last_sync >= self.interval_seconds)):
+                self._sync()
+
+    def _sync(self):
+        os.fsync(self.log.fileno())
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def sync(self):
+        with self.lock:
+            if self.unsynced:
+                self._sync()
+
+    def _flush(self):
+        # append only checks the interval when another record comes along, so without this the
+        # last records before a quiet spell would wait for the next one however long that took
+        while not self.closed.wait(self.interval_seconds / 2):
+            with self.lock:
+                due = time.monotonic() - self.last_sync >= self.interval_seconds
+                if self.log is not None and self.unsynced and due:
+                    self._sync()
+
+    def journal(self, game_id):
+        return Journal(self, game_id)
+
+    def created(self, game_id):
+        self.append(CREATE, game_id)
+
+    def deleted(self, game_id):
+        self.append(DELETE, game_id)
+
+    @property
+    def checkpoint_due(self):
+        return self.records >= self.snapshot_records
+
+    def checkpoint(self, snapshots):
+        """writes snapshots, a dict of game id to Game.snapshot(), and starts a new log generation.
+        the caller has to hold every game's lock, so that nothing changes part way through."""
+        with self.lock:
+            self._sync()
+            self.log.close()
+            self.generation += 1
+            self.log = open(self._path(_log_name(self.generation)), "ab", buffering=0)
+
+            temporary = self._path(SNAPSHOT_NAME + ".tmp")
+            with open(temporary, "wb") as f:
+                f.write(SNAPSHOT.pack(SNAPSHOT_MAGIC, self.generation, len(snapshots)))
+                for game_id, (fen, keys, history) in snapshots.items():
+                    game_id = game_id.encode("utf8")
+                    fen = fen.encode("ascii")
+                    f.write(SNAPSHOT_GAME.pack(len(game_id), len(fen), len(keys), len(history)))
+                    f.write(game_id + fen + struct.pack("<" + str(len(keys)) + "Q", *keys) + history)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporary, self._path(SNAPSHOT_NAME))
+            _fsync_directory(self.path)
+
+            for earlier in self._generations():
+                if earlier < self.generation:
+                    os.remove(self._path(_log_name(earlier)))
+            self.records = 0
+
+    def close(self):
+        self.closed.set()
+        with self.lock:
+            if self.log is not None:
+                self._sync()
+                self.log.close()
+                self.log = None
+        if self.flusher is not None:
+            self.flusher.join()
+
+
+class Journal:
+    """what a Game logs its changes through, one per game"""
+
+    def __init__(self, store, game_id):
+        self.store = store
+        self.game_id = game_id
+
+    def move(self, move, timestamp):
+        self.store.append(MOVE, self.game_id, move.to_code(), timestamp)
+
+    def unmove(self):
+        self.store.append(UNMOVE, self.game_id)
+
+    def reset(self):
+        self.store.append(RESET, self.game_id)
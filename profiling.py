@@ -0,0 +1,230 @@
+import cProfile
+import functools
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter
+import chess
+
+# profiling is off unless CHESS_PROFILE is set to the fraction of requests to profile, e.g. 0.05
+FRACTION_VARIABLE = "CHESS_PROFILE"
+# "stacks" samples the call stacks of profiled requests for flame graphs,
+# "cprofile" runs them under cProfile for exact per function times
+MODE_VARIABLE = "CHESS_PROFILE_MODE"
+MODES = ["stacks", "cprofile"]
+# set to 1 to time the move generator, see instrument_movegen
+MOVEGEN_VARIABLE = "CHESS_PROFILE_MOVEGEN"
+
+# how often the stacks of profiled requests are sampled
+SAMPLE_SECONDS = 0.002
+# how many of the costliest functions the report lists for each route
+TOP_FUNCTIONS = 20
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return os.path.basename(code.co_filename) + ":" + getattr(code, "co_qualname", code.co_name)
+
+
+class RequestProfiler:
+    """Profiles a random fraction of requests, adding the results up by route. In "stacks" mode a
+    background thread samples the stacks of the requests being profiled, which costs them next to
+    nothing and gives collapsed stacks for flame graph tools. In "cprofile" mode each picked request
+    runs under cProfile, which slows it down but counts every call."""
+
+    def __init__(self, fraction=0.0, mode="stacks", sample_seconds=SAMPLE_SECONDS):
+        self.lock = threading.Lock()
+        self.fraction = 0.0
+        self.mode = "stacks"
+        self.configure(fraction, mode)
+        self.sample_seconds = sample_seconds
+        # the route each thread being stack sampled is answering
+        self.active = {}
+        self.sampler = None
+        self.reset()
+
+    @classmethod
+    def from_environment(constructor, environ=os.environ):
+        return constructor(float(environ.get(FRACTION_VARIABLE) or 0), environ.get(MODE_VARIABLE) or "stacks")
+
+    def configure(self, fraction=None, mode=None):
+        """changes how many requests are profiled and how, raising ValueError for bad settings"""
+        if fraction is not None:
+            fraction = float(fraction)
+            if not 0 <= fraction <= 1:
+                raise ValueError("the fraction of requests to profile must be between 0 and 1")
+            self.fraction = fraction
+        if mode is not None:
+            if mode not in MODES:
+                raise ValueError("unknown profiling mode: " + str(mode))
+            self.mode = mode
+
+    def reset(self):
+        """forgets everything collected so far"""
+        with self.lock:
+            # collapsed stack, "route;outermost;...;innermost", to how many samples found it
+            self.stacks = Counter()
+            # route to the pstats.Stats of every request profiled under cProfile
+            self.stats = {}
+            self.requests = Counter()
+
+    def start(self, route):
+        """starts profiling the current request if it's picked, returning what stop needs"""
+        if not self.fraction or random.random() >= self.fraction:
+            return None
+        if self.mode == "cprofile":
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # newer pythons only allow one cProfile at a time, so this request goes without
+                return None
+            return route, profile
+        with self.lock:
+            self.active[threading.get_ident()] = route
+            if self.sampler is None:
+                self.sampler = threading.Thread(target=self._sample, daemon=True)
+                self.sampler.start()
+        return route, None
+
+    def stop(self, token):
+        if token is None:
+            return
+        route, profile = token
+        if profile is not None:
+            profile.disable()
+            stats = pstats.Stats(profile)
+        with self.lock:
+            if profile is None:
+                self.active.pop(threading.get_ident(), None)
+            elif route in self.stats:
+                self.stats[route].add(stats)
+            else:
+                self.stats[route] = stats
+            self.requests[route] += 1
+
+    def _sample(self):
+        while True:
+            time.sleep(self.sample_seconds)
+            with self.lock:
+                if not self.active and not self.fraction:
+                    # switched off, a later start makes a new sampler
+                    self.sampler = None
+                    return
+                active = dict(self.active)
+            frames = sys._current_frames()
+            samples = []
+            for ident, route in active.items():
+                frame = frames.get(ident)
+                names = []
+                while frame is not None:
+                    names.append(_frame_name(frame))
+                    frame = frame.f_back
+                if names:
+                    samples.append(route + ";" + ";".join(reversed(names)))
+            with self.lock:
+                self.stacks.update(samples)
+
+    def collapsed(self):
+        """the sampled stacks as "frame;frame;frame count" lines, as flamegraph.pl and speedscope read"""
+        with self.lock:
+            return "".join(stack + " " + str(count) + "\n" for stack, count in sorted(self.stacks.items()))
+
+    def report(self):
+        """the settings, and for each profiled route how many requests were profiled and where
+        their time went, costliest first"""
+        with self.lock:
+            routes = {route: {"requests": count} for route, count in self.requests.items()}
+            for route, stats in self.stats.items():
+                functions = sorted(stats.stats.items(), key=lambda item: -item[1][3])[:TOP_FUNCTIONS]
+                routes[route]["functions"] = [
+                    {"function": os.path.basename(filename) + ":" + str(line) + "(" + name + ")",
+                     "calls": calls, "seconds": own, "cumulative": cumulative}
+                    for (filename, line, name), (primitive, calls, own, cumulative, callers) in functions]
+            # for sampled stacks, how often each function was the one running
+            innermost = {}
+            for stack, count in self.stacks.items():
+                route, _, frames = stack.partition(";")
+                innermost.setdefault(route, Counter())[frames.rpartition(";")[2]] += count
+            for route, counts in innermost.items():
+                routes.setdefault(route, {"requests": 0})["samples"] = [
+                    {"function": function, "samples": count} for function, count in counts.most_common(TOP_FUNCTIONS)]
+        return {"fraction": self.fraction, "mode": self.mode, "routes": routes, "movegen": movegen_timings()}
+
+
+# function name to [calls, seconds], while the move generator is instrumented
+_timings = {}
+_timings_lock = threading.Lock()
+# the methods instrument_movegen replaced, to put back
+_originals = {}
+
+def _timed(name, function):
+    @functools.wraps(function)
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            with _timings_lock:
+                timing = _timings.setdefault(name, [0, 0.0])
+                timing[0] += 1
+                timing[1] += elapsed
+    return timed
+
+def _movegen_methods():
+    # Board and any loaded subclass that generates moves its own way, like bitboard.BitBoard
+    boards = [chess.Board] + chess.Board.__subclasses__()
+    targets = [(board_type, name) for board_type in boards
+               for name in ["legal_moves", "from_notation", "from_fen", "make", "unmake", "is_attacked"]
+               if name in board_type.__dict__]
+    # every piece class that generates its own moves, including any BitBoard ones and their mixin if loaded
+    pending = [chess.Piece]
+    classes = set()
+    while pending:
+        piece_type = pending.pop()
+        classes.update(piece_type.__mro__[:-1])
+        pending.extend(piece_type.__subclasses__())
+    for piece_type in sorted(classes, key=lambda piece_type: piece_type.__name__):
+        targets += [(piece_type, name) for name in ["possible_moves", "possible_attacks"]
+                    if name in piece_type.__dict__]
+    return targets
+
+def instrument_movegen():
+    """wraps the move generator's methods so that movegen_timings counts their calls and time.
+    nothing is wrapped until this is called, so move generation costs nothing extra otherwise"""
+    for owner, name in _movegen_methods():
+        if (owner, name) in _originals:
+            continue
+        original = owner.__dict__[name]
+        label = owner.__name__ + "." + name
+        if isinstance(original, property):
+            wrapped = property(_timed(label, original.fget))
+        elif isinstance(original, classmethod):
+            wrapped = classmethod(_timed(label, original.__func__))
+        else:
+            wrapped = _timed(label, original)
+        _originals[owner, name] = original
+        setattr(owner, name, wrapped)
+
+def uninstrument_movegen():
+    """puts the original methods back"""
+    for (owner, name), original in list(_originals.items()):
+        setattr(owner, name, original)
+        del _originals[owner, name]
+
+def movegen_instrumented():
+    return bool(_originals)
+
+def movegen_timings():
+    """calls and seconds by function, for as long as the move generator has been instrumented.
+    calls nest, legal_moves includes the possible_moves it asks for"""
+    with _timings_lock:
+        return {name: {"calls": calls, "seconds": seconds} for name, (calls, seconds) in sorted(_timings.items())}
+
+def reset_movegen_timings():
+    with _timings_lock:
+        _timings.clear()
@@ -1,16 +1,85 @@
-from flask import Flask, request
+from flask import Flask, Response, g, request
+from collections import Counter
 import json
+import os
+import threading
+import time
+import uuid
 from chess import *
+import metrics
+import persistence
+import profiling
+
+# how often an idle /events stream sends a comment, so dead connections get noticed
+KEEPALIVE_SECONDS = 15
+
+# the board formats the board returning routes can answer with, picked by the Accept header.
+# the compact ones are just the encoded board, with the status and anything else in headers
+JSON_MIMETYPE = "application/json"
+FEN_MIMETYPE = "application/x-chess-fen"
+PACKED_MIMETYPE = "application/x-chess-packed"
+ENCODERS = {FEN_MIMETYPE: Board.to_fen, PACKED_MIMETYPE: Board.to_packed}
+
+# how many moves /history sends when it isn't given a limit, and the most it will send at once
+HISTORY_LIMIT = 100
+MAX_HISTORY_LIMIT = 1000
 
 class Game:
 
     def __init__(self):
+        # reentrant so that routes can hold the lock across several Game calls
+        self.lock = threading.RLock()
+        # notified every time the version goes up, for the /events streams
+        self.changed = threading.Condition(self.lock)
+        self.version = 0
+        # tells this game's versions apart from any other game's in ETags
+        self.nonce = uuid.uuid4().hex[:8]
+        self._rendered = (None, None, None)
+        self._encoded = (None, {})
+        self._moves = (None, None, {})
+        self._status = (None, None, None)
+        self.last_access = time.monotonic()
+        # where changes are logged when the server is persistent, see persistence.Journal
+        self.journal = None
         self.reset()
 
     def reset(self):
-        self.board = Board.from_notation(STARTING_NOTATION)
-        self.turn = 1
-        self.cur_player = Color.white
+        with self.lock:
+            self.board = Board.from_notation(STARTING_NOTATION)
+            self.turn = 1
+            self.cur_player = Color.white
+            # zobrist key of every position reached, and how many times each one has come up
+            self.keys = [self.board.key]
+            self.repetitions = Counter(self.keys)
+            self.history = MoveLog()
+            self.last_move = None
+            self._changed()
+            # every move and unmove moves the version and the history in step, so the version
+            # a client saw tells us which moves it's missing
+            self.base_version = self.version
+            if self.journal:
+                self.journal.reset()
+
+    def snapshot(self):
+        """everything restore needs to bring the game back, as (fen, zobrist keys, MoveLog bytes)"""
+        with self.lock:
+            return self.board.to_fen(), list(self.keys), bytes(self.history.records)
+
+    def restore(self, fen, keys, history):
+        with self.lock:
+            self.board = Board.from_fen(fen)
+            self.turn = self.board.fullmove
+            self.cur_player = self.board.to_move
+            self.keys = list(keys)
+            self.repetitions = Counter(self.keys)
+            self.history = MoveLog(history)
+            self.last_move = self.history.read(len(self.history) - 1)[0][2] if len(self.history) else None
+            self._changed()
+            self.base_version = self.version - len(self.history)
+
+    def _changed(self):
+        self.version += 1
+        self.changed.notify_all()
 
     def next_turn(self):
         if self.cur_player == Color.white:
@@ -19,56 +88,641 @@ class Game:
             self.turn += 1
             self.cur_player = Color.white
 
+    def move(self, move, timestamp=None):
+        """plays move, returning a record that unmove can take it back with"""
+        with self.lock:
+            timestamp = time.time() if timestamp is None else timestamp
+            self.history.append(move, self.board.at(move.begin).NOTATION, timestamp)
+            undo = (self.board.make(move), self.turn, self.cur_player, self.last_move)
+            self.next_turn()
+            key = self.board.key
+            self.keys.append(key)
+            self.repetitions[key] += 1
+            self.last_move = move
+            self._changed()
+            if self.journal:
+                self.journal.move(move, timestamp)
+            return undo
+
+    def unmove(self, undo):
+        """takes back the latest move, for rolling back a batch that failed part way through.
+        the version goes back down too, which is safe because the lock has been held throughout"""
+        with self.lock:
+            board_undo, self.turn, self.cur_player, self.last_move = undo
+            self.repetitions[self.keys.pop()] -= 1
+            self.history.pop()
+            self.board.unmake(board_undo)
+            self.version -= 1
+            self._rendered = (None, None, None)
+            self._encoded = (None, {})
+            self._moves = (None, None, {})
+            self._status = (None, None, None)
+            if self.journal:
+                self.journal.unmove()
+
+    @property
+    def etag(self):
+        return self.nonce + "-" + str(self.version)
+
+    def state(self):
+        """the /board json for the current version, as a dict and serialized,
+        only built once per version however many times it is asked for"""
+        version, state, body = self._rendered
+        if version != self.version:
+            state = {"turn": self.turn, "current_player": str(self.cur_player), "board": self.board.to_notation(),
+                     "status": self.status(), "version": self.etag}
+            body = json.dumps(state)
+            self._rendered = (self.version, state, body)
+        return state, body
+
+    def encoded(self, mimetype):
+        """the board in one of the compact ENCODERS formats, also built once per version"""
+        version, encodings = self._encoded
+        if version != self.version:
+            encodings = {}
+            self._encoded = (self.version, encodings)
+        if mimetype not in encodings:
+            encodings[mimetype] = ENCODERS[mimetype](self.board)
+        return encodings[mimetype]
+
+    def legal_moves(self):
+        """the current player's legal moves, none once the game is over, generated once per version"""
+        version, moves = self._moves[:2]
+        if version != self.version:
+            moves = [] if self.status() in GAME_OVER else self._status[2]
+            self._moves = (self.version, moves, {})
+        return moves
+
+    def moves_body(self, square=None):
+        """the /moves json for all the legal moves, or just those of the piece on square, serialized
+        once per version and square however many spectators and bots ask"""
+        moves = self.legal_moves()
+        bodies = self._moves[2]
+        if square not in bodies:
+            state = self.state()[0]
+            bodies[square] = json.dumps({"moves": [move.to_notation() for move in moves
+                                                   if square is None or move.begin is square],
+                                         "current_player": state["current_player"], "status": state["status"],
+                                         "version": state["version"]})
+        return bodies[square]
+
+    def moves_since(self, etag, limit):
+        """the moves played since the version with this etag, or None if that's not a version of
+        this game since its last reset, or more than limit moves ago"""
+        nonce, _, version = etag.partition("-")
+        if nonce != self.nonce or not version.isdigit():
+            return None
+        ply = int(version) - self.base_version
+        if not 0 <= ply <= len(self.history) or len(self.history) - ply > limit:
+            return None
+        return [move for ply, timestamp, move, piece in self.history.read(ply)]
+
+    def event(self):
+        """what /events sends to subscribers, a summary of the last change"""
+        return {"version": self.version, "turn": self.turn, "current_player": str(self.cur_player),
+                "status": self.status(), "move": self.last_move.to_notation() if self.last_move else None}
+
+    def status(self):
+        """worked out once per version, along with the current player's legal moves it needs"""
+        version, status, moves = self._status
+        if version != self.version:
+            moves = self.board.legal_moves(self.cur_player)
+            if self.repetitions[self.keys[-1]] >= 3:
+                status = "threefold repetition"
+            # the clock counts plies, so 100 is fifty moves by each player
+            elif self.board.halfmove_clock >= 100:
+                status = "fifty move rule"
+            else:
+                status = self.board.status(self.cur_player, moves)
+            self._status = (self.version, status, moves)
+        return status
+
+
+class GameRegistry:
+    """Every game hosted by the server, by id. Each game has its own lock, so moves in different
+    games never wait on each other, and games nobody has touched for idle_seconds are evicted.
+    Given a persistence.Store, the games it holds are recovered and every change is logged to it.
+    Evicted games then stay in the store and are loaded back from it the next time they're asked for,
+    they're only lost by deleting them."""
 
-game = Game()
+    def __init__(self, idle_seconds=3600, sweep_seconds=60, store=None):
+        self.store = store
+        self.games = store.recover(Game) if store else {}
+        for game_id, game in self.games.items():
+            game.journal = store.journal(game_id)
+        # only guards adding and removing games, lookups go straight to the dict
+        self.lock = threading.Lock()
+        self.idle_seconds = idle_seconds
+        self.sweep_seconds = sweep_seconds
+        self.last_sweep = time.monotonic()
+        # games that are never evicted, like the default game behind the single game routes
+        self.pinned = set()
+        # ids of evicted games that are only in the store now
+        self.evicted = set()
+
+    def __len__(self):
+        return len(self.games) + len(self.evicted)
+
+    def __contains__(self, game_id):
+        return game_id in self.games or game_id in self.evicted
+
+    def ids(self):
+        return list(self.games) + list(self.evicted)
+
+    def create(self, game_id=None, pinned=False):
+        game = Game()
+        with self.lock:
+            game_id = game_id or uuid.uuid4().hex
+            self.games[game_id] = game
+            if pinned:
+                self.pinned.add(game_id)
+            if self.store:
+                self.store.created(game_id)
+                game.journal = self.store.journal(game_id)
+        self._maybe_sweep()
+        return game_id, game
+
+    def get(self, game_id):
+        game = self.games.get(game_id)
+        if game is None and game_id in self.evicted:
+            with self.lock:
+                game = self.games.get(game_id) or self._reload(game_id)
+        if game is not None:
+            game.last_access = time.monotonic()
+        return game
+
+    def _reload(self, game_id):
+        # the caller holds the registry lock
+        if game_id not in self.evicted:
+            return None
+        game = self.store.load(game_id, Game)
+        if game is not None:
+            game.journal = self.store.journal(game_id)
+            self.games[game_id] = game
+        self.evicted.discard(game_id)
+        return game
+
+    def remove(self, game_id):
+        with self.lock:
+            self.pinned.discard(game_id)
+            game = self.games.pop(game_id, None)
+            if game is None and game_id in self.evicted:
+                game = self.store.load(game_id, Game)
+                self.evicted.discard(game_id)
+            if game is not None and self.store:
+                self.store.deleted(game_id)
+            return game
+
+    def _maybe_sweep(self):
+        if time.monotonic() - self.last_sweep > self.sweep_seconds:
+            self.evict_idle()
+
+    def evict_idle(self):
+        now = time.monotonic()
+        with self.lock:
+            self.last_sweep = now
+            idle = [game_id for game_id, game in self.games.items()
+                    if now - game.last_access > self.idle_seconds and game_id not in self.pinned]
+            if self.store:
+                # every change is already in the log, so the game can be loaded back from it.
+                # marked before it goes, so a get without the lock never finds it in neither
+                self.evicted.update(idle)
+            for game_id in idle:
+                del self.games[game_id]
+        return idle
+
+    def checkpoint(self):
+        """snapshots every game to the store, holding every lock so the snapshot matches the log.
+        evicted games are loaded from the store for their snapshot, without being brought back"""
+        with self.lock:
+            # the same order as /batch takes them in, so the two can't deadlock
+            locked = [self.games[game_id].lock for game_id in sorted(self.games)]
+            for lock in locked:
+                lock.acquire()
+            try:
+                snapshots = {game_id: game.snapshot() for game_id, game in self.games.items()}
+                for game_id in self.evicted:
+                    game = self.store.load(game_id, Game)
+                    if game is not None:
+                        snapshots[game_id] = game.snapshot()
+                self.store.checkpoint(snapshots)
+            finally:
+                for lock in reversed(locked):
+                    lock.release()
+
+    def checkpoint_if_due(self):
+        if self.store and self.store.checkpoint_due:
+            self.checkpoint()
+
+
+DEFAULT_GAME = "default"
+
+games = GameRegistry()
+games.create(DEFAULT_GAME, pinned=True)
+
+def persist(path, **options):
+    """switches the server over to games stored durably under path, recovering any already there.
+    options are passed on to persistence.Store"""
+    global games
+    games = GameRegistry(store=persistence.Store(path, **options))
+    if DEFAULT_GAME in games:
+        games.pinned.add(DEFAULT_GAME)
+    else:
+        games.create(DEFAULT_GAME, pinned=True)
+    return games
 
 app = Flask(__name__)
 
+stats = metrics.Metrics()
+REQUESTS = stats.counter("chess_requests_total", "requests answered, by route, method and status code")
+REQUEST_SECONDS = stats.histogram("chess_request_seconds", "time taken to answer a request, by route")
+MOVE_CHECK_SECONDS = stats.histogram("chess_move_check_seconds", "time taken to validate a move",
+                                     buckets=[0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05])
+MOVES = stats.counter("chess_moves_total", "moves played")
+REJECTED_MOVES = stats.counter("chess_rejected_moves_total", "moves turned down, by reason")
+stats.gauge("chess_games", "games being hosted", lambda: len(games))
+
+profiler = profiling.RequestProfiler.from_environment()
+if os.environ.get(profiling.MOVEGEN_VARIABLE):
+    profiling.instrument_movegen()
+
+def _route():
+    # routes rather than paths, so game ids don't make a new series each
+    return request.url_rule.rule if request.url_rule else "unmatched"
+
+@app.before_request
+def start_timer():
+    g.start = time.perf_counter()
+    g.profile = profiler.start(_route())
+
+@app.after_request
+def checkpoint(response):
+    # after the route has let go of its game's lock, so that the snapshot can take every lock
+    games.checkpoint_if_due()
+    return response
+
+@app.after_request
+def record_request(response):
+    profiler.stop(g.pop("profile", None))
+    route = _route()
+    REQUESTS.inc(route=route, method=request.method, status=response.status_code)
+    if "start" in g:
+        REQUEST_SECONDS.observe(time.perf_counter() - g.start, route=route)
+    return response
+
+def no_game(game_id):
+    return json.dumps({"error": "no game with id: " + str(game_id)}), 404
+
+@app.route('/metrics')
+def show_metrics():
+    """request, move and game counts and latencies in the prometheus text format"""
+    return Response(stats.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/profile', methods=["GET"])
+def show_profile():
+    """what profiling has found so far, by route, and the move generator timings"""
+    return json.dumps(profiler.report())
+
+@app.route('/profile', methods=["POST"])
+def configure_profile():
+    """switches profiling on, off or over to another mode. takes a json object with any of
+    "fraction", "mode", "movegen" (true or false) and "reset" (true to forget what's been collected).
+    only answers requests from this machine"""
+    if request.remote_addr not in ("127.0.0.1", "::1"):
+        return json.dumps({"error": "profiling can only be configured locally"}), 403
+    body = request.get_json(force=True, silent=True) or {}
+    try:
+        profiler.configure(body.get("fraction"), body.get("mode"))
+    except (TypeError, ValueError) as e:
+        return json.dumps({"error": str(e)}), 400
+    if "movegen" in body:
+        if body["movegen"]:
+            profiling.instrument_movegen()
+        else:
+            profiling.uninstrument_movegen()
+    if body.get("reset"):
+        profiler.reset()
+        profiling.reset_movegen_timings()
+    return json.dumps(profiler.report())
+
+@app.route('/profile/stacks')
+def profile_stacks():
+    """the sampled stacks collapsed one per line, ready for flamegraph.pl or speedscope"""
+    return Response(profiler.collapsed(), mimetype="text/plain")
+
 @app.route('/')
 def index():
     return "Hello World!"
 
-@app.route('/board')
-def display_board(extras=dict()):
-    display = {"turn": game.turn, "current_player": str(game.cur_player), "board": game.board.to_notation()}
+@app.route('/games', methods=["GET"])
+def list_games():
+    return json.dumps({"games": games.ids()})
+
+@app.route('/games', methods=["POST"])
+def create_game():
+    game_id, game = games.create()
+    with game.lock:
+        return display_game(game, extras={"id": game_id})
+
+@app.route('/games/<game_id>', methods=["DELETE"])
+def delete_game(game_id):
+    if game_id == DEFAULT_GAME or games.remove(game_id) is None:
+        return no_game(game_id)
+    return json.dumps({"deleted": game_id})
+
+def wire_format():
+    return request.accept_mimetypes.best_match([JSON_MIMETYPE, FEN_MIMETYPE, PACKED_MIMETYPE], default=JSON_MIMETYPE)
+
+def display_game(game, extras=dict()):
+    mimetype = wire_format()
+    if mimetype != JSON_MIMETYPE:
+        # the turn and player are in the encoded board, so only the status and extras go alongside
+        headers = {"X-Chess-" + key.capitalize(): str(value) for key, value in extras.items()}
+        state = game.state()[0]
+        headers["X-Chess-Status"] = state["status"]
+        headers["X-Chess-Version"] = state["version"]
+        return Response(game.encoded(mimetype), mimetype=mimetype, headers=headers)
+    state, body = game.state()
+    if not extras:
+        return body
+    display = dict(state)
     display.update(extras)
     return json.dumps(display)
 
+def conditional(game, render, variant=""):
+    """answers 304 Not Modified without rendering anything if the client already has this version.
+    variant tells apart responses that are rendered differently for the same version"""
+    etag = game.etag + variant
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = app.make_response(render())
+    response.set_etag(etag)
+    return response
+
+@app.route('/board')
+@app.route('/games/<game_id>/board')
+def display_board(game_id=DEFAULT_GAME):
+    game = games.get(game_id)
+    if game is None:
+        return no_game(game_id)
+    with game.lock:
+        mimetype = wire_format()
+        response = conditional(game, lambda: display_game(game),
+                               "" if mimetype == JSON_MIMETYPE else "-" + mimetype.rpartition("-")[2])
+        response.vary.add("Accept")
+        return response
+
 @app.route('/turn')
-def current_turn():
-    display = {"turn": game.turn, "current_player": str(game.cur_player)}
-    return json.dumps(display)
-    
+@app.route('/games/<game_id>/turn')
+def current_turn(game_id=DEFAULT_GAME):
+    game = games.get(game_id)
+    if game is None:
+        return no_game(game_id)
+    with game.lock:
+        return conditional(game, lambda: json.dumps({"turn": game.turn, "current_player": str(game.cur_player)}))
+
 @app.route('/move')
-def next_move():
-    begin_position = Position.from_notation(request.args.get("begin", ""))
-    end_position = Position.from_notation(request.args.get("end", ""))
+@app.route('/games/<game_id>/move')
+def next_move(game_id=DEFAULT_GAME):
+    game = games.get(game_id)
+    if game is None:
+        return no_game(game_id)
+    with game.lock:
+        # a client that says which version its board is at doesn't need the board back if it's current
+        current = request.args.get("since") == game.etag
+        move, error = check_move(game, request.args.get("begin", ""), request.args.get("end", ""),
+                                 request.args.get("promotion", "Q"))
+        if error:
+            return display_game(game, extras={"error": error})
+        game.move(move)
+        MOVES.inc()
+        if current:
+            state = game.state()[0]
+            return json.dumps({key: state[key] for key in ("turn", "current_player", "status", "version")})
+        return display_game(game)
+
+def check_move(game, begin, end, promotion_notation="Q"):
+    """returns the Move for begin and end if the current player may make it, otherwise an error message"""
+    with MOVE_CHECK_SECONDS.time():
+        move, error = _check_move(game, begin, end, promotion_notation)
+    if error:
+        # without the part after any colon, so the reasons are a short fixed list
+        REJECTED_MOVES.inc(reason=error.partition(":")[0])
+    return move, error
+
+def _check_move(game, begin, end, promotion_notation):
+    try:
+        begin_position = Position.from_notation(begin)
+        end_position = Position.from_notation(end)
+    except ValueError as e:
+        return None, str(e)
     begin_piece = game.board.at(begin_position)
-    end_piece = game.board.at(end_position)
 
+    status = game.status()
+    if status in GAME_OVER:
+        return None, "the game is over: " + status
     if game.board.empty(begin_position):
-        return display_board(extras={"error": "no piece at position: " + str(begin_position)})
+        return None, "no piece at position: " + str(begin_position)
     if begin_piece.color != game.cur_player:
-        return display_board(extras={"error": "that piece is not " + str(game.cur_player)})
+        return None, "that piece is not " + str(game.cur_player)
+
+    if game.board.captured_position(Move(begin_position, end_position)) is None:
+        if not begin_piece.valid_move(end_position):
+            return None, "you cannot move there!"
+    elif not begin_piece.valid_attack(end_position):
+        return None, "you cannot attack that piece!"
+
+    promotion = None
+    if begin_piece.NOTATION == "P" and end_position.row in (0, 7):
+        try:
+            promotion = Piece.from_notation(promotion_notation)
+        except KeyError:
+            promotion = None
+        # kings and pawns are pieces too, but nothing can promote to them
+        if promotion not in PROMOTIONS:
+            return None, "you cannot promote to that!"
+    move = Move(begin_position, end_position, promotion)
+    if move not in game.legal_moves():
+        # a king's two square move got past valid_move, so it's a castle with the rights and room for it
+        if begin_piece.NOTATION == "K" and abs(end_position.col - begin_position.col) == 2:
+            return None, "you cannot castle out of or through check!"
+        return None, "you cannot leave your king in check!"
+    return move, None
+
+@app.route('/batch', methods=["POST"])
+@app.route('/games/<game_id>/batch', methods=["POST"])
+def batch_moves(game_id=DEFAULT_GAME):
+    """plays a list of moves in one request. each move may name its own "game", otherwise it goes
+    to the game in the url. with "atomic" every move is rolled back if any of them fails,
+    otherwise moves are played up to the first failure."""
+    body = request.get_json(force=True, silent=True) or {}
+    if not isinstance(body, dict):
+        return json.dumps({"error": "the body must be a json object"}), 400
+    requested = body.get("moves", [])
+    atomic = bool(body.get("atomic", False))
+    if not isinstance(requested, list) or not all(isinstance(entry, dict) for entry in requested):
+        return json.dumps({"error": "moves must be a list of objects"}), 400
+
+    game_ids = [str(entry.get("game", game_id)) for entry in requested]
+    batch_games = {}
+    for batch_game_id in set(game_ids):
+        batch_games[batch_game_id] = games.get(batch_game_id)
+        if batch_games[batch_game_id] is None:
+            return no_game(batch_game_id)
 
-    if game.board.empty(end_position) and not begin_piece.valid_move(end_position):
-        return display_board(extras={"error": "you cannot move there!"})
-    if not game.board.empty(end_position) and not begin_piece.valid_attack(end_position):
-        return display_board(extras={"error": "you cannot attack that piece!"})
+    # always lock in the same order so that overlapping batches can't deadlock
+    locked = [batch_games[batch_game_id].lock for batch_game_id in sorted(batch_games)]
+    for lock in locked:
+        lock.acquire()
+    try:
+        results = []
+        played = []
+        failed = False
+        for entry, batch_game_id in zip(requested, game_ids):
+            result = {"game": batch_game_id, "begin": entry.get("begin"), "end": entry.get("end")}
+            results.append(result)
+            if failed:
+                result["error"] = "not played, an earlier move failed"
+                continue
+            game = batch_games[batch_game_id]
+            move, error = check_move(game, str(entry.get("begin", "")), str(entry.get("end", "")),
+                                     str(entry.get("promotion", "Q")))
+            if error:
+                result["error"] = error
+                failed = True
+                continue
+            played.append((game, game.move(move), result))
+            result["move"] = move.to_notation()
 
-    begin_piece.move_to(end_position)
-    game.next_turn()
+        if failed and atomic:
+            for game, undo, result in reversed(played):
+                game.unmove(undo)
+                result["error"] = "rolled back, a later move failed"
+            played = []
+        MOVES.inc(len(played))
 
-    return display_board()
+        display = {"results": results, "played": len(played),
+                   "games": {batch_game_id: game.state()[0] for batch_game_id, game in batch_games.items()}}
+        return json.dumps(display)
+    finally:
+        for lock in reversed(locked):
+            lock.release()
+
+@app.route('/events')
+@app.route('/games/<game_id>/events')
+def game_events(game_id=DEFAULT_GAME):
+    """server sent event stream with one event per change to the game. a subscriber that passes
+    the last version it saw (as ?since= or Last-Event-ID) only hears about later changes,
+    otherwise the current state is sent straight away."""
+    game = games.get(game_id)
+    if game is None:
+        return no_game(game_id)
+    since = request.args.get("since", request.headers.get("Last-Event-ID"))
+    try:
+        since = int(since) if since is not None else None
+    except ValueError:
+        since = None
+
+    def stream(version):
+        while games.get(game_id) is game:
+            with game.lock:
+                game.changed.wait_for(lambda: game.version != version, timeout=KEEPALIVE_SECONDS)
+                event = game.event() if game.version != version else None
+            if event is None:
+                yield ": keepalive\n\n"
+                continue
+            version = event["version"]
+            yield "id: " + str(version) + "\nevent: " + ("move" if event["move"] else "reset") + "\n"
+            yield "data: " + json.dumps(event) + "\n\n"
+
+    return Response(stream(since), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.route('/moves')
+@app.route('/games/<game_id>/moves')
+def legal_moves(game_id=DEFAULT_GAME):
+    """the current player's legal moves, or with ?from= only those of the piece on that square"""
+    game = games.get(game_id)
+    if game is None:
+        return no_game(game_id)
+    square = request.args.get("from")
+    if square is not None:
+        try:
+            square = Position.from_notation(square)
+        except ValueError as e:
+            return json.dumps({"error": str(e)}), 400
+    with game.lock:
+        return conditional(game, lambda: game.moves_body(square))
+
+@app.route('/history')
+@app.route('/games/<game_id>/history')
+def move_history(game_id=DEFAULT_GAME):
+    """the moves played so far, from ply ?since= onwards and at most ?limit= of them.
+    "next" is the since to pass to get the moves after these."""
+    game = games.get(game_id)
+    if game is None:
+        return no_game(game_id)
+    try:
+        since = max(0, int(request.args.get("since", 0)))
+        limit = min(max(0, int(request.args.get("limit", HISTORY_LIMIT))), MAX_HISTORY_LIMIT)
+    except ValueError:
+        return json.dumps({"error": "since and limit must be integers"}), 400
+    with game.lock:
+        page = game.history.page(since, limit)
+    return json.dumps(page)
+
+@app.route('/changes')
+@app.route('/games/<game_id>/changes')
+def changes(game_id=DEFAULT_GAME):
+    """brings a client's board up to date from the ?since= version it has. if it isn't too far
+    behind, that's the moves played since, otherwise it's the whole board as a FEN"""
+    game = games.get(game_id)
+    if game is None:
+        return no_game(game_id)
+    try:
+        limit = min(max(0, int(request.args.get("limit", HISTORY_LIMIT))), MAX_HISTORY_LIMIT)
+    except ValueError:
+        return json.dumps({"error": "limit must be an integer"}), 400
+    def render():
+        state = game.state()[0]
+        display = {key: state[key] for key in ("turn", "current_player", "status", "version")}
+        moves = game.moves_since(request.args.get("since", ""), limit)
+        if moves is None:
+            display["fen"] = game.encoded(FEN_MIMETYPE)
+        else:
+            display["moves"] = [move.to_notation() for move in moves]
+        return json.dumps(display)
+    with game.lock:
+        # the ETag is the game's version, so a client whose board is already current gets a 304
+        return conditional(game, render)
 
 @app.route('/reset')
-def reset_game():
-    game.reset()
-    return display_board()
+@app.route('/games/<game_id>/reset')
+def reset_game(game_id=DEFAULT_GAME):
+    game = games.get(game_id)
+    if game is None:
+        return no_game(game_id)
+    with game.lock:
+        game.reset()
+        return display_game(game)
 
 
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="serves chess games over a json api")
+    parser.add_argument("--data-dir", help="keep games in this directory so they survive a restart")
+    parser.add_argument("--fsync", choices=persistence.FSYNC_POLICIES, default="batch",
+                        help="how often the move log is synced to disk when using --data-dir")
+    args = parser.parse_args()
+    if args.data_dir:
+        persist(args.data_dir, fsync=args.fsync)
+
     # host="0.0.0.0" here is how we make the server public
     # see: http://flask.pocoo.org/docs/0.10/quickstart/#public-server
-    app.run(debug=True, host="0.0.0.0")
+    try:
+        # the reloader would run a second process appending to the same log
+        app.run(debug=True, host="0.0.0.0", use_reloader=not args.data_dir)
+    finally:
+        if games.store:
+            games.store.close()
 
@@ -0,0 +1,179 @@
+import unittest
+import asyncio
+import threading
+from http.server import ThreadingHTTPServer
+from urllib.error import HTTPError
+import async_client
+from async_client import AsyncGameConnection, AsyncMockGameConnection
+from chess import Color
+from client_test import KeepAliveHandler
+
+try:
+    import server
+    from werkzeug.serving import make_server
+except ImportError:
+    server = None
+
+class RecordingHandler(KeepAliveHandler):
+    """KeepAliveHandler that keeps the headers of every request it's sent"""
+
+    received = []
+
+    def do_GET(self):
+        self.received.append(dict(self.headers))
+        KeepAliveHandler.do_GET(self)
+
+
+class AsyncConnectionPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = "http://127.0.0.1:" + str(self.server.server_port)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_keep_alive(self):
+        async def fetch():
+            pool = async_client.AsyncConnectionPool(self.url, size=2, backoff_seconds=0)
+            responses = await asyncio.gather(*[pool.request("GET", "/board") for request in range(6)])
+            connections = pool.stats["connections"]
+            # the server hanging up on an idle connection just means opening another
+            for request in range(3):
+                await pool.request("GET", "/hangup")
+            stale = pool.stats["retries"]
+            unavailable = await pool.request("GET", "/unavailable", idempotent=True)
+            pool.close()
+            return pool, responses, connections, stale, unavailable
+        pool, responses, connections, stale, unavailable = asyncio.run(fetch())
+        self.assertEqual([200] * 6, [status for status, headers, body in responses])
+        # only two requests are ever in flight, so two connections serve all six
+        self.assertEqual(2, connections)
+        self.assertGreater(stale, 0)
+        self.assertEqual(503, unavailable[0])
+        self.assertGreaterEqual(pool.stats["retries"], stale + 3)
+
+    def test_retry_headers(self):
+        recording = ThreadingHTTPServer(("127.0.0.1", 0), RecordingHandler)
+        threading.Thread(target=recording.serve_forever, daemon=True).start()
+        RecordingHandler.received = []
+        headers = {"Accept": "application/x-chess-fen", "X-Foo": "bar"}
+        async def fetch():
+            pool = async_client.AsyncConnectionPool("http://127.0.0.1:" + str(recording.server_port),
+                                                    retries=2, backoff_seconds=0)
+            try:
+                return await pool.request("GET", "/unavailable", headers=headers, idempotent=True)
+            finally:
+                pool.close()
+        try:
+            status, response_headers, body = asyncio.run(fetch())
+        finally:
+            recording.shutdown()
+            recording.server_close()
+        self.assertEqual(503, status)
+        self.assertEqual("application/json", response_headers["Content-Type"])
+        # the retries go out with the request's own headers, not the 503's
+        self.assertEqual(3, len(RecordingHandler.received))
+        for received in RecordingHandler.received:
+            self.assertEqual(RecordingHandler.received[0], received)
+            self.assertEqual({"Accept": "application/x-chess-fen", "X-Foo": "bar"},
+                             {key: received.get(key) for key in headers})
+            self.assertNotIn("Content-Length", received)
+
+
+@unittest.skipIf(server is None, "flask is not installed")
+class AsyncGameConnectionTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = make_server("127.0.0.1", 0, server.app, threaded=True)
+        cls.url = "http://127.0.0.1:" + str(cls.server.server_port)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def test_many_games(self):
+        async def play():
+            conns = await asyncio.gather(*[AsyncGameConnection.new_game(self.url) for game in range(8)])
+            await asyncio.gather(*[conn.move("E2", "E4") for conn in conns])
+            for conn in conns:
+                conn.refresh()
+            boards = await asyncio.gather(*[conn.board() for conn in conns])
+            return conns, boards
+        conns, boards = asyncio.run(play())
+        self.assertEqual(8, len({conn.base_url for conn in conns}))
+        self.assertTrue(all(board.to_move is Color.black for board in boards))
+        self.assertIs(conns[0].pool, conns[-1].pool)
+        self.assertEqual(8 * 4, conns[0].stats()["requests"])
+
+    def test_wait_for_turn(self):
+        async def play():
+            white = await AsyncGameConnection.new_game(self.url)
+            black = await AsyncGameConnection.connect(white.base_url)
+            waiting = asyncio.ensure_future(white.wait_for_turn(Color.black))
+            await asyncio.sleep(0.1)
+            self.assertFalse(waiting.done())
+            await white.move("E2", "E4")
+            state = await asyncio.wait_for(waiting, 5)
+            await black.move("E7", "E5")
+            return state, await white.wait_for_turn(Color.white), await white.board()
+        state, turn, board = asyncio.run(play())
+        self.assertEqual("E2E4", state["move"])
+        self.assertEqual("white", turn["current_player"])
+        self.assertEqual("BP", board.at(async_client.Position.from_notation("E5")).to_notation())
+
+    def test_missing_game(self):
+        with self.assertRaises(HTTPError):
+            asyncio.run(AsyncGameConnection.connect(self.url + "/games/missing"))
+
+
+class AsyncMockGameConnectionTest(unittest.TestCase):
+
+    def test_wait_for_turn(self):
+        async def play():
+            conn = AsyncMockGameConnection()
+            waiting = asyncio.ensure_future(conn.wait_for_turn(Color.black))
+            await asyncio.sleep(0)
+            self.assertFalse(waiting.done())
+            await conn.move("E2", "E4")
+            return await waiting, await conn.board()
+        turn, board = asyncio.run(play())
+        self.assertEqual({"turn": 1, "current_player": Color.black}, turn)
+        self.assertTrue(board.empty(async_client.Position.from_notation("E2")))
+
+    def test_moves(self):
+        async def moves():
+            conn = AsyncMockGameConnection()
+            return await conn.moves(), await conn.moves("G1")
+        every, knight = asyncio.run(moves())
+        self.assertEqual(20, len(every["moves"]))
+        self.assertEqual(("white", "playing"), (every["current_player"], every["status"]))
+        self.assertEqual(["G1F3", "G1H3"], sorted(knight["moves"]))
+
+    def test_move(self):
+        async def play():
+            conn = AsyncMockGameConnection()
+            # nothing on E3, and a pawn can't go three squares
+            for begin, end in [("E3", "E4"), ("E2", "E6")]:
+                with self.assertRaisesRegex(Exception, "cannot move there!"):
+                    await conn.move(begin, end)
+            for begin, end in [("B2", "B4"), ("A7", "A5"), ("B4", "A5"), ("B7", "B6"), ("A5", "B6"), ("H7", "H6"),
+                               ("B6", "C7"), ("H6", "H5")]:
+                await conn.move(begin, end)
+            turn = await conn.move("C7", "B8", promotion="N")
+            return conn, turn, await conn.board(), await conn.history(since=8), await conn.moves("B8")
+        conn, turn, board, history, moves = asyncio.run(play())
+        self.assertEqual({"turn": 5, "current_player": Color.black}, turn)
+        self.assertEqual("N", board.at(async_client.Position.from_notation("B8")).NOTATION)
+        self.assertEqual((9, 9), (history["total"], history["next"]))
+        self.assertEqual({"ply": 8, "player": "white", "piece": "pawn", "start": "C7", "end": "B8", "move": "C7B8N"},
+                         {key: value for key, value in history["moves"][0].items() if key != "timestamp"})
+        self.assertEqual("black", moves["current_player"])
+        self.assertEqual([], moves["moves"])
+
+if __name__ == '__main__':
+    unittest.main()
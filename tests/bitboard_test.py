@@ -0,0 +1,86 @@
+import unittest
+import random
+import chess
+import perft
+import bitboard
+from chess import Board, Color, Position, Piece, Pawn
+from bitboard import BitBoard
+
+class BitBoardTest(unittest.TestCase):
+
+    def setUp(self):
+        self.notations = bitboard.BENCHMARK_NOTATIONS
+        self.boards = [Board.from_notation(notation) for notation in self.notations]
+        self.bitboards = [BitBoard.from_notation(notation) for notation in self.notations]
+
+    def test_to_notation(self):
+        for notation, board in zip(self.notations, self.bitboards):
+            self.assertListEqual(notation, board.to_notation())
+
+    def test_piece_types(self):
+        for board in self.bitboards:
+            for piece in board.pieces():
+                self.assertIsInstance(piece, Piece.from_notation(piece.NOTATION))
+
+    def test_pieces(self):
+        for board, bit_board in zip(self.boards, self.bitboards):
+            self.assertListEqual([piece.to_notation() for piece in board.pieces()],
+                                 [piece.to_notation() for piece in bit_board.pieces()])
+            self.assertEqual(len(list(board.white_pieces())), len(list(bit_board.white_pieces())))
+            self.assertEqual(len(list(board.black_pieces())), len(list(bit_board.black_pieces())))
+
+    def test_empty(self):
+        for board, bit_board in zip(self.boards, self.bitboards):
+            for position in board.positions():
+                self.assertEqual(board.empty(position), bit_board.empty(position))
+
+    def test_possible_moves(self):
+        for board, bit_board in zip(self.boards, self.bitboards):
+            for piece in board.pieces():
+                bit_piece = bit_board.at(piece.position)
+                self.assertSetEqual(set(piece.possible_moves), set(bit_piece.possible_moves))
+
+    def test_possible_attacks(self):
+        for board, bit_board in zip(self.boards, self.bitboards):
+            for piece in board.pieces():
+                bit_piece = bit_board.at(piece.position)
+                self.assertSetEqual(set(piece.possible_attacks), set(bit_piece.possible_attacks))
+
+    def test_move_to(self):
+        board = BitBoard.from_notation(chess.STARTING_NOTATION)
+        board.at(Position(1, 4)).move_to(Position(3, 4))
+        self.assertTrue(board.empty(Position(1, 4)))
+        self.assertFalse(board.empty(Position(3, 4)))
+        self.assertTrue(board.empty((1, 4)))
+        self.assertEqual(bitboard.bit(Position(3, 4)), board.bitboards[Color.white, "P"] & bitboard.bit(Position(3, 4)))
+        self.assertEqual(0, board.occupancy & bitboard.bit(Position(1, 4)))
+
+    def test_capture(self):
+        board = BitBoard()
+        rook = board.add(Color.white, chess.Rook, Position(0, 0))
+        board.add(Color.black, Pawn, Position(5, 0))
+        rook.move_to(Position(5, 0))
+        self.assertEqual(0, board.occupied[Color.black])
+        self.assertEqual(bitboard.bit(Position(5, 0)), board.occupancy)
+        self.assertEqual(1, len(list(board.pieces())))
+
+    def test_legal_moves(self):
+        # random games from every perft position, comparing the two boards' moves and attacks each ply
+        rng = random.Random(7)
+        for fen, expected in perft.POSITIONS.values():
+            board, bit_board = Board.from_fen(fen), BitBoard.from_fen(fen)
+            for ply in range(60):
+                moves = board.legal_moves()
+                self.assertSetEqual(set(moves), set(bit_board.legal_moves()), board.to_fen())
+                self.assertEqual(len(moves), len(bit_board.legal_moves()), board.to_fen())
+                for color in Color:
+                    for position in board.positions():
+                        self.assertEqual(board.is_attacked(position, color), bit_board.is_attacked(position, color))
+                if not moves:
+                    break
+                move = rng.choice(moves)
+                board.make(move)
+                bit_board.make(move)
+
+if __name__ == '__main__':
+    unittest.main()
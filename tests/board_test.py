@@ -86,14 +86,73 @@ class BoardTest(unittest.TestCase):
             if position not in (Position(3, 4), Position(6, 6)):
                 self.assertIsNone(board.at(position))
 
+    def test_piece_lists(self):
+        board = Board.from_fen("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1")
+        self.assertEqual(["E1"], [str(piece.position) for piece in board.pieces_of(Color.white, "K")])
+        self.assertEqual(8, len(board.pieces_of(Color.black, Pawn)))
+        # castling, a capture, and a promotion, followed through unmake
+        undos = [board.make(chess.Move.from_notation(notation)) for notation in ["E1G1", "H3G2", "D5E6", "G2H1Q"]]
+        self.assertIs(board.at(Position.from_notation("G1")), board.king(Color.white))
+        self.assertEqual(7, len(board.pieces_of(Color.white, Pawn)))
+        self.assertEqual(["E7", "H1"], sorted(str(piece.position) for piece in board.pieces_of(Color.black, "q")))
+        self.assertEqual(6, len(board.pieces_of(Color.black, Pawn)))
+        for undo in reversed(undos):
+            board.unmake(undo)
+        for color in Color:
+            pieces = board.white_pieces() if color is Color.white else board.black_pieces()
+            self.assertEqual(sorted(str(piece.position) for piece in board.squares() if piece and piece.color is color),
+                             sorted(str(piece.position) for piece in pieces))
+        self.assertIs(board.at(Position.from_notation("E1")), board.king(Color.white))
+        self.assertEqual(1, len(board.pieces_of(Color.black, "Q")))
+        self.assertIsNone(Board().king(Color.white))
+
     def test_at(self):
         for position in self.board.positions():
             self.assertIs(self.board[position.row][position.col], self.board.at(position))
         for piece in self.board.pieces():
             self.assertIs(piece, self.board.at(piece.position))
 
+    def test_fen(self):
+        board = Board.from_fen(chess.STARTING_FEN)
+        self.assertListEqual(chess.STARTING_NOTATION, board.to_notation())
+        self.assertEqual(chess.STARTING_FEN, board.to_fen())
+        fen = "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R b Kq e3 3 17"
+        self.assertEqual(fen, Board.from_fen(fen).to_fen())
+        with self.assertRaises(ValueError):
+            Board.from_fen("not a fen")
+        for bad in ["rnbqkbnr/pppppppp/9/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+                    "rnbqkbnr/pppppppp/8/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+                    "rnbqkbnrr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+                    "rnbqkbnr/pppppppp/7/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+                    "rnbqkbnr/pppppppp/08/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+                    "rnbqkbnr/ppppppppp/8/8/8/8/PPPPPPP/RNBQKBNR w KQkq - 0 1",
+                    "rnbqkbnr/pppppppp/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+                    "rnbqkbnr/pppxpppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+                    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR x KQkq - 0 1",
+                    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w XYZ - 0 1",
+                    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KKq - 0 1"]:
+            with self.assertRaises(ValueError):
+                Board.from_fen(bad)
+
+    def test_packed(self):
+        fen = "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R b Kq e3 3 17"
+        packed = Board.from_fen(fen).to_packed()
+        self.assertEqual(38, len(packed))
+        self.assertEqual(fen, Board.from_packed(packed).to_fen())
+        self.assertListEqual(self.notation, Board.from_packed(self.board.to_packed()).to_notation())
+        with self.assertRaises(ValueError):
+            Board.from_packed(packed[:-1])
+
     def test_empty(self):
         self.assertTrue(all(self.empty_board.empty((row, col)) for row in range(8) for col in range(8)))
 
+    def test_captured_position(self):
+        board = Board.from_fen("4k3/8/8/3pP3/8/8/8/4K3 w - d6 0 1")
+        self.assertEqual(Position.from_notation("D5"), board.captured_position(chess.Move.from_notation("E5D6")))
+        self.assertIsNone(board.captured_position(chess.Move.from_notation("E5E6")))
+        self.assertIsNone(board.captured_position(chess.Move.from_notation("E1D2")))
+        board = Board.from_fen("4k3/8/8/3p4/4P3/8/8/4K3 w - - 0 1")
+        self.assertEqual(Position.from_notation("D5"), board.captured_position(chess.Move.from_notation("E4D5")))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,151 @@
+import unittest
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.error import HTTPError, URLError
+import client
+from chess import Color
+
+try:
+    import server
+    from werkzeug.serving import make_server
+except ImportError:
+    server = None
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    """answers every request with its path and how many requests its connection has served,
+    failing with 503 for paths under /unavailable and quietly hanging up after /hangup"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.served = getattr(self, "served", 0) + 1
+        body = json.dumps({"path": self.path, "served": self.served}).encode("utf8")
+        self.send_response(503 if self.path.startswith("/unavailable") else 200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.close_connection = self.path == "/hangup"
+
+    def log_message(self, *args):
+        pass
+
+
+class ConnectionPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.pool = client.ConnectionPool("http://127.0.0.1:" + str(self.server.server_port), backoff_seconds=0)
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get(self, path, **kwargs):
+        status, headers, body = self.pool.request("GET", path, **kwargs)
+        return status, json.loads(body.decode("utf8"))
+
+    def test_keep_alive(self):
+        for served in range(1, 4):
+            self.assertEqual((200, {"path": "/board", "served": served}), self.get("/board"))
+        self.assertEqual(1, self.pool.stats["connections"])
+        self.assertEqual(3, self.pool.stats["requests"])
+
+    def test_stale_connection(self):
+        # the server hanging up on an idle connection just means opening another
+        self.get("/hangup")
+        self.assertEqual((200, {"path": "/move", "served": 1}), self.get("/move"))
+        self.assertEqual(2, self.pool.stats["connections"])
+        self.assertEqual(1, self.pool.stats["retries"])
+
+    def test_retries(self):
+        self.assertEqual(503, self.get("/unavailable", idempotent=True)[0])
+        self.assertEqual(3, self.pool.stats["retries"])
+        self.assertEqual(503, self.get("/unavailable")[0])
+        self.assertEqual(3, self.pool.stats["retries"])
+
+    def test_unreachable(self):
+        self.server.shutdown()
+        self.server.server_close()
+        pool = client.ConnectionPool("http://127.0.0.1:" + str(self.server.server_port), retries=2, backoff_seconds=0)
+        with self.assertRaises(URLError):
+            pool.request("GET", "/board", idempotent=True)
+        self.assertEqual(2, pool.stats["retries"])
+
+
+class MockGameConnectionTest(unittest.TestCase):
+
+    def test_move(self):
+        conn = client.MockGameConnection()
+        self.assertEqual({"turn": 1, "current_player": Color.black}, conn.move("E2", "E4"))
+        self.assertEqual({"turn": 2, "current_player": Color.white}, conn.move("E7", "E5"))
+        # a king can't go two squares outside castling, a pawn can't push into another, and black just moved
+        for begin, end in [("E1", "E3"), ("E4", "E5"), ("D8", "H4")]:
+            with self.assertRaises(Exception):
+                conn.move(begin, end)
+        self.assertEqual(Color.white, conn.board().to_move)
+
+
+@unittest.skipIf(server is None, "flask is not installed")
+class GameConnectionTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = make_server("127.0.0.1", 0, server.app, threaded=True)
+        cls.url = "http://127.0.0.1:" + str(cls.server.server_port)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        self.conn = client.GameConnection.new_game(self.url)
+
+    def test_move(self):
+        self.conn.move("E2", "E4")
+        self.conn.refresh()
+        self.assertEqual(Color.black, self.conn.board().to_move)
+        self.assertEqual("black", self.conn.turn()["current_player"])
+        self.assertEqual(["E2E4"], [move["move"] for move in self.conn.history()["moves"]])
+        self.assertGreater(self.conn.stats()["requests"], 0)
+
+    def test_moves(self):
+        self.assertEqual(20, len(self.conn.moves()["moves"]))
+        self.assertEqual(["B1A3", "B1C3"], sorted(self.conn.moves("B1")["moves"]))
+        self.conn.move("B1", "C3")
+        self.assertEqual(["G8F6", "G8H6"], sorted(self.conn.moves("G8")["moves"]))
+
+    def test_delta_sync(self):
+        board = self.conn.board()
+        opponent = client.GameConnection(self.conn.base_url)
+        for mine, theirs in [("E2", "E4"), ("D7", "D5")], [("E4", "E5"), ("F7", "F5")]:
+            self.conn.move(*mine)
+            opponent.move(*theirs)
+            self.conn.refresh()
+            self.conn.board()
+        # caught up in place, including the en passant square the json board would have lost
+        self.assertIs(board, self.conn.board())
+        self.assertEqual(opponent.board().to_fen(), board.to_fen())
+        self.assertEqual("F6", str(board.en_passant))
+
+    def test_move_since(self):
+        board = self.conn.board()
+        requests = self.conn.stats()["requests"]
+        self.conn.move("E2", "E4")
+        self.conn.move("E7", "E5")
+        self.conn.refresh()
+        # the moves are played on the cached board, and the unchanged game is a 304 from /changes
+        self.assertIs(board, self.conn.board())
+        self.assertEqual(requests + 3, self.conn.stats()["requests"])
+        self.assertEqual(client.GameConnection(self.conn.base_url).board().to_fen(), board.to_fen())
+
+    def test_missing_game(self):
+        with self.assertRaises(HTTPError):
+            client.GameConnection(self.url + "/games/missing")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import unittest
+import chess
+from chess import Board, Move
+import engine
+
+class EngineTest(unittest.TestCase):
+
+    def search(self, fen, depth=4, seconds=10):
+        board = Board.from_fen(fen)
+        result = engine.Engine().search(board, seconds, max_depth=depth)
+        # the search always leaves the board as it found it
+        self.assertEqual(fen, board.to_fen())
+        return result
+
+    def test_mate_in_one(self):
+        result = self.search("6k1/5ppp/8/8/8/8/8/R5K1 w - - 0 1")
+        self.assertEqual("A1A8", result.move.to_notation())
+        self.assertEqual(engine.MATE - 1, result.score)
+
+    def test_mate_in_two(self):
+        # the king has to take away the escape square before the rook can mate
+        result = self.search("7k/8/5K2/8/8/8/8/6R1 w - - 0 1", depth=4)
+        self.assertEqual(engine.MATE - 3, result.score)
+        self.assertEqual(3, len(result.pv))
+
+    def test_wins_material(self):
+        result = self.search("4k3/8/8/3q4/8/8/3R4/4K3 w - - 0 1", depth=2)
+        self.assertEqual("D2D5", result.move.to_notation())
+        self.assertGreater(result.score, 0)
+
+    def test_quiescence(self):
+        # the queen takes a pawn defended by a pawn at depth one only without the capture search
+        result = self.search("4k3/2p5/3p4/8/8/8/8/3QK3 w - - 0 1", depth=1)
+        self.assertNotEqual("D1D6", result.move.to_notation())
+
+    def test_moves_generated_once_per_node(self):
+        # the leaves of the full search hand their moves on to the capture search
+        generated = []
+        class RecordingBoard(Board):
+            def legal_moves(self, color=None):
+                generated.append(self.key)
+                return Board.legal_moves(self, color)
+        board = RecordingBoard.from_fen("4k3/2p5/3p4/8/8/8/8/3QK3 w - - 0 1")
+        engine.Engine().search(board, 10, max_depth=1)
+        leaves = [key for key in generated if key != board.key]
+        self.assertGreater(len(leaves), 0)
+        self.assertEqual(len(set(leaves)), len(leaves))
+
+    def test_underpromotion(self):
+        # promoting to a knight forks the king and queen
+        result = self.search("8/q1P1k3/8/8/8/8/8/7K w - - 0 1", depth=3)
+        self.assertEqual("C7C8N", result.move.to_notation())
+
+    def test_report(self):
+        depths = []
+        result = engine.Engine().search(Board.from_fen(chess.STARTING_FEN), 10, max_depth=3, report=depths.append)
+        self.assertEqual([1, 2, 3], [report.depth for report in depths])
+        self.assertEqual(3, len(result.pv))
+        self.assertEqual(result.move, result.pv[0])
+        self.assertGreater(result.nodes_per_second, 0)
+        self.assertIn("nodes/sec", str(result))
+
+    def test_time_limit(self):
+        result = engine.Engine().search(Board.from_fen(chess.STARTING_FEN), 0.2)
+        self.assertLess(result.seconds, 1.0)
+        self.assertIn(result.move, Board.from_fen(chess.STARTING_FEN).legal_moves())
+
+    def test_no_moves(self):
+        self.assertIsNone(self.search("k7/1Q6/1K6/8/8/8/8/8 b - - 0 1"))
+
+    def test_replacement(self):
+        table = engine.TranspositionTable(4)
+        move = Move.from_notation("E2E4")
+        table.put(1, 5, 10, engine.EXACT, move)
+        # a shallower result for another position doesn't push out a deeper one from the same search
+        table.put(5, 2, 20, engine.EXACT, None)
+        self.assertIsNone(table.get(5))
+        self.assertEqual(5, table.get(1)[1])
+        table.put(5, 5, 20, engine.EXACT, None)
+        self.assertIsNone(table.get(1))
+        # but anything from an earlier search gives way
+        table.new_search()
+        table.put(1, 1, 10, engine.EXACT, move)
+        self.assertEqual(move, table.get(1)[4])
+
+    def test_shared_table(self):
+        table = engine.SharedTranspositionTable(4)
+        move = Move.from_notation("E7E8N")
+        table.put(2 ** 64 - 3, 7, -engine.MATE + 5, engine.LOWER, move)
+        self.assertEqual((2 ** 64 - 3, 7, -engine.MATE + 5, engine.LOWER, move, 0), table.get(2 ** 64 - 3))
+        table.put(5, 2, 0, engine.EXACT, None)
+        self.assertIsNone(table.get(5))
+        # half of an entry overwritten by another process reads as a miss
+        table.slots[2] ^= 1 << 40
+        self.assertIsNone(table.get(2 ** 64 - 3))
+        table.clear()
+        self.assertEqual([0] * 8, list(table.slots))
+
+    def test_parallel(self):
+        with engine.ParallelEngine(2, table_size=1 << 12) as parallel:
+            for fen, notation in [("6k1/5ppp/8/8/8/8/8/R5K1 w - - 0 1", "A1A8"),
+                                  ("4k3/8/8/3q4/8/8/3R4/4K3 w - - 0 1", "D2D5")]:
+                result = parallel.search(Board.from_fen(fen), 10, max_depth=3)
+                self.assertEqual(notation, result.move.to_notation())
+            result = parallel.search(Board.from_fen(chess.STARTING_FEN), 0.2)
+            self.assertLess(result.seconds, 2.0)
+            self.assertGreater(result.depth, 0)
+            self.assertIsNone(parallel.search(Board.from_fen("k7/1Q6/1K6/8/8/8/8/8 b - - 0 1")))
+
+if __name__ == '__main__':
+    unittest.main()
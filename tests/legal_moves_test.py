@@ -0,0 +1,123 @@
+import unittest
+import chess
+from chess import Board, Color, Position, Move, Pawn, Queen, Knight
+
+def P(notation):
+    return Position.from_notation(notation)
+
+def empty_notation():
+    return [[""] * 8 for row in range(8)]
+
+def board_with(pieces, to_move=Color.white):
+    """builds a board from a dict like {"E1": "WK", "E8": "BK"}"""
+    notation = empty_notation()
+    for square, piece in pieces.items():
+        position = P(square)
+        notation[position.row][position.col] = piece
+    board = Board.from_notation(notation)
+    board.to_move = to_move
+    return board
+
+class LegalMovesTest(unittest.TestCase):
+
+    def test_starting_position(self):
+        board = Board.from_notation(chess.STARTING_NOTATION)
+        self.assertEqual(20, len(board.legal_moves(Color.white)))
+        self.assertEqual(20, len(board.legal_moves(Color.black)))
+        self.assertEqual("KQkq", board.castling)
+
+    def test_pinned_piece(self):
+        board = board_with({"E1": "WK", "E2": "WN", "E8": "BR", "A8": "BK"})
+        self.assertFalse(any(move.begin is P("E2") for move in board.legal_moves()))
+
+    def test_pinned_slider_moves_along_pin(self):
+        board = board_with({"E1": "WK", "E3": "WR", "E8": "BR", "A8": "BK"})
+        rook_moves = {move.end for move in board.legal_moves() if move.begin is P("E3")}
+        self.assertSetEqual({P("E2"), P("E4"), P("E5"), P("E6"), P("E7"), P("E8")}, rook_moves)
+
+    def test_check_evasion(self):
+        board = board_with({"E1": "WK", "A2": "WR", "E8": "BR", "A8": "BK"})
+        moves = set(board.legal_moves())
+        # the rook can only block, and the king can't step along the checking file
+        self.assertIn(Move(P("A2"), P("E2")), moves)
+        self.assertNotIn(Move(P("A2"), P("A3")), moves)
+        self.assertNotIn(Move(P("E1"), P("E2")), moves)
+        self.assertIn(Move(P("E1"), P("D1")), moves)
+
+    def test_double_check(self):
+        board = board_with({"E1": "WK", "A1": "WR", "E8": "BR", "F3": "BN", "A8": "BK"})
+        self.assertTrue(all(move.begin is P("E1") for move in board.legal_moves()))
+
+    def test_castling(self):
+        board = board_with({"E1": "WK", "A1": "WR", "H1": "WR", "E8": "BK"})
+        self.assertEqual("KQ", board.castling)
+        moves = board.legal_moves()
+        self.assertIn(Move(P("E1"), P("G1")), moves)
+        self.assertIn(Move(P("E1"), P("C1")), moves)
+
+        undo = board.make(Move(P("E1"), P("G1")))
+        self.assertEqual("WR", board.at(P("F1")).to_notation())
+        self.assertTrue(board.empty(P("H1")))
+        self.assertEqual("", board.castling)
+        board.unmake(undo)
+        self.assertEqual("WR", board.at(P("H1")).to_notation())
+        self.assertEqual("KQ", board.castling)
+
+    def test_castling_through_check(self):
+        board = board_with({"E1": "WK", "A1": "WR", "H1": "WR", "E8": "BK", "F8": "BR"})
+        moves = board.legal_moves()
+        self.assertNotIn(Move(P("E1"), P("G1")), moves)
+        self.assertIn(Move(P("E1"), P("C1")), moves)
+
+    def test_en_passant(self):
+        board = board_with({"E1": "WK", "E5": "WP", "D7": "BP", "E8": "BK"}, to_move=Color.black)
+        board.make(Move(P("D7"), P("D5")))
+        self.assertIs(P("D6"), board.en_passant)
+        self.assertIn(Move(P("E5"), P("D6")), board.legal_moves())
+
+        undo = board.make(Move(P("E5"), P("D6")))
+        self.assertTrue(board.empty(P("D5")))
+        board.unmake(undo)
+        self.assertEqual("BP", board.at(P("D5")).to_notation())
+
+    def test_en_passant_discovered_check(self):
+        # taking en passant would clear the whole row between the king and the rook
+        board = board_with({"A5": "WK", "E5": "WP", "D7": "BP", "H5": "BR", "E8": "BK"}, to_move=Color.black)
+        board.make(Move(P("D7"), P("D5")))
+        self.assertNotIn(Move(P("E5"), P("D6")), board.legal_moves())
+
+    def test_promotion(self):
+        board = board_with({"E1": "WK", "B7": "WP", "H8": "BK"})
+        promotions = {move.promotion for move in board.legal_moves() if move.begin is P("B7")}
+        self.assertSetEqual(set(chess.PROMOTIONS), promotions)
+
+        undo = board.make(Move(P("B7"), P("B8"), Knight))
+        self.assertEqual("WN", board.at(P("B8")).to_notation())
+        board.unmake(undo)
+        self.assertEqual("WP", board.at(P("B7")).to_notation())
+
+    def test_checkmate(self):
+        board = board_with({"G1": "WK", "F2": "WP", "G2": "WP", "H2": "WP", "A1": "BR", "E8": "BK"})
+        self.assertTrue(board.is_checkmate())
+        self.assertEqual("checkmate", board.status())
+
+    def test_stalemate(self):
+        board = board_with({"H8": "BK", "F7": "WK", "G6": "WQ"}, to_move=Color.black)
+        self.assertTrue(board.is_stalemate())
+        self.assertEqual("stalemate", board.status())
+
+    def test_insufficient_material(self):
+        board = board_with({"E1": "WK", "C1": "WB", "E8": "BK"})
+        self.assertEqual("insufficient material", board.status())
+
+    def test_move_notation(self):
+        self.assertEqual(Move(P("E7"), P("E8"), Queen), Move.from_notation("E7E8Q"))
+        self.assertEqual("E2E4", Move(P("E2"), P("E4")).to_notation())
+
+    def test_move_code(self):
+        for move in [Move(P("A1"), P("H8")), Move(P("E7"), P("E8"), Queen), Move(P("B2"), P("A1"), Knight)]:
+            self.assertLess(move.to_code(), 1 << 15)
+            self.assertEqual(move, Move.from_code(move.to_code()))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+import socket
+import loadtest
+
+try:
+    import server
+except ImportError:
+    server = None
+
+class RecorderTest(unittest.TestCase):
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual([1, 50, 95, 99, 100], [loadtest.percentile(values, p) for p in [0, 50, 95, 99, 100]])
+        self.assertEqual(7, loadtest.percentile([7], 99))
+
+    def test_report(self):
+        recorder = loadtest.Recorder()
+        for ms in range(1, 11):
+            recorder.record("/turn", ms / 1000)
+        recorder.record("/move", 0.002, rejected=True)
+        recorder.record("/move", 0.004, error="HTTP Error 404: no game")
+        report = recorder.report(2.0)
+        self.assertEqual((12, 6.0, 1), (report["requests"], report["requests_per_second"], report["errors"]))
+        turn = report["endpoints"]["/turn"]
+        self.assertAlmostEqual(5.0, turn["p50_ms"])
+        self.assertAlmostEqual(10.0, turn["p99_ms"])
+        self.assertEqual((0.5, 1), (report["endpoints"]["/move"]["error_rate"], report["endpoints"]["/move"]["rejected"]))
+        self.assertEqual({"/move: HTTP Error 404: no game": 1}, report["error_messages"])
+
+    def test_no_server(self):
+        # a server that isn't there is counted as errors, not raised
+        with socket.socket() as unused:
+            unused.bind(("127.0.0.1", 0))
+            port = unused.getsockname()[1]
+        report = loadtest.run("http://127.0.0.1:" + str(port), players=2, seconds=0.1)
+        self.assertEqual(0, report["players"])
+        self.assertEqual((1, 1.0), (report["errors"], report["error_rate"]))
+
+
+@unittest.skipIf(server is None, "flask is not installed")
+class LoadTest(unittest.TestCase):
+
+    def test_run(self):
+        httpd, url = loadtest.start_server()
+        try:
+            report = loadtest.run(url, players=3, seconds=1.0, max_fullmoves=5)
+        finally:
+            httpd.shutdown()
+        self.assertEqual(3, report["players"])
+        self.assertEqual(0, report["errors"])
+        self.assertGreater(report["moves"], 0)
+        # games past the move limit are reset rather than played out
+        self.assertGreater(report["games"], 0)
+        for endpoint in ["/turn", "/board", "/move", "/reset", "/games"]:
+            self.assertIn(endpoint, report["endpoints"])
+        move = report["endpoints"]["/move"]
+        self.assertEqual(report["moves"], move["requests"])
+        self.assertLessEqual(move["p50_ms"], move["p95_ms"])
+        self.assertLessEqual(move["p95_ms"], move["p99_ms"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+import threading
+import metrics
+
+class MetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = metrics.Metrics(shards=4)
+
+    def test_counter_across_threads(self):
+        counter = self.metrics.counter("test_total", "things counted")
+
+        def count():
+            for index in range(1000):
+                counter.inc(kind="a")
+        threads = [threading.Thread(target=count) for index in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        counter.inc(5, kind="b")
+        self.assertEqual(8000, self.metrics.value("test_total", kind="a"))
+        self.assertEqual(5, self.metrics.value("test_total", kind="b"))
+        self.assertIsNone(self.metrics.value("test_total", kind="c"))
+
+    def test_histogram(self):
+        histogram = self.metrics.histogram("test_seconds", "time taken", buckets=[0.1, 1])
+        for value in [0.05, 0.1, 0.5, 3]:
+            histogram.observe(value, route="/x")
+        with histogram.time(route="/y"):
+            pass
+        self.assertEqual([2, 1, 1, 3.65, 4], self.metrics.value("test_seconds", route="/x"))
+        self.assertEqual(1, self.metrics.value("test_seconds", route="/y")[-1])
+
+    def test_render(self):
+        self.metrics.counter("test_total", "things counted").inc(route='/a"b')
+        self.metrics.histogram("test_seconds", "time taken", buckets=[1]).observe(0.5)
+        self.metrics.gauge("test_games", "games going", lambda: 3)
+        lines = self.metrics.render().splitlines()
+        self.assertEqual(["# HELP test_total things counted", "# TYPE test_total counter",
+                          'test_total{route="/a\\"b"} 1'], lines[:3])
+        self.assertIn('test_seconds_bucket{le="1"} 1', lines)
+        self.assertIn('test_seconds_bucket{le="+Inf"} 1', lines)
+        self.assertIn("test_seconds_sum 0.5", lines)
+        self.assertIn("test_seconds_count 1", lines)
+        self.assertEqual("test_games 3", lines[-1])
+
+if __name__ == '__main__':
+    unittest.main()
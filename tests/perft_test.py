@@ -0,0 +1,59 @@
+import unittest
+import chess
+import perft
+from chess import Board
+from bitboard import BitBoard
+
+# keeps the suite to a few seconds, run perft.py directly for deeper checks
+MAX_NODES = 100000
+
+class PerftTest(unittest.TestCase):
+
+    def assertPerft(self, board_type, name):
+        fen, expected = perft.POSITIONS[name]
+        for depth, nodes in enumerate(expected, 1):
+            if nodes > MAX_NODES:
+                break
+            self.assertEqual(nodes, perft.perft(board_type.from_fen(fen), depth), name + " depth " + str(depth))
+
+    def test_start(self):
+        self.assertPerft(Board, "start")
+
+    def test_kiwipete(self):
+        self.assertPerft(Board, "kiwipete")
+
+    def test_position3(self):
+        self.assertPerft(Board, "position3")
+
+    def test_position4(self):
+        self.assertPerft(Board, "position4")
+
+    def test_position5(self):
+        self.assertPerft(Board, "position5")
+
+    def test_position6(self):
+        self.assertPerft(Board, "position6")
+
+    def test_bitboard(self):
+        for name in perft.POSITIONS:
+            fen, expected = perft.POSITIONS[name]
+            self.assertEqual(expected[1], perft.perft(BitBoard.from_fen(fen), 2), name)
+
+    def test_unmake_restores(self):
+        fen, expected = perft.POSITIONS["kiwipete"]
+        board = Board.from_fen(fen)
+        perft.perft(board, 2)
+        self.assertEqual(fen, board.to_fen())
+
+    def test_divide(self):
+        fen, expected = perft.POSITIONS["position4"]
+        counts = perft.divide(Board.from_fen(fen), 2)
+        self.assertEqual(expected[0], len(counts))
+        self.assertEqual(expected[1], sum(counts.values()))
+
+    def test_parallel_divide(self):
+        fen, expected = perft.POSITIONS["position3"]
+        self.assertEqual(perft.divide(Board.from_fen(fen), 3), perft.parallel_divide(fen, 3, processes=2))
+
+if __name__ == '__main__':
+    unittest.main()
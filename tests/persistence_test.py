@@ -0,0 +1,155 @@
+import unittest
+import os
+import shutil
+import tempfile
+import time
+from chess import Color, Move
+import persistence
+
+try:
+    import server
+except ImportError:
+    server = None
+
+@unittest.skipIf(server is None, "flask is not installed")
+class PersistenceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.stores = []
+
+    def tearDown(self):
+        for store in self.stores:
+            store.close()
+        shutil.rmtree(self.path)
+
+    def open(self, **options):
+        store = persistence.Store(self.path, **options)
+        self.stores.append(store)
+        return server.GameRegistry(store=store)
+
+    def restart(self, **options):
+        self.stores[-1].close()
+        return self.open(**options)
+
+    def play(self, game, *notations):
+        for notation in notations:
+            game.move(Move.from_notation(notation))
+
+    def test_recover_from_log(self):
+        games = self.open()
+        game_id, game = games.create()
+        self.play(game, "E2E4", "E7E5", "G1F3")
+        games = self.restart()
+        recovered = games.get(game_id)
+        self.assertEqual(game.board.to_fen(), recovered.board.to_fen())
+        self.assertEqual(Color.black, recovered.cur_player)
+        self.assertEqual(3, len(recovered.history))
+        self.assertEqual(game.keys, recovered.keys)
+
+    def test_recover_from_snapshot(self):
+        games = self.open()
+        game_id, game = games.create()
+        self.play(game, "G1F3", "G8F6", "F3G1", "F6G8")
+        games.checkpoint()
+        self.assertEqual(["wal-00000001.log"], [name for name in os.listdir(self.path) if name.endswith(".log")])
+        self.play(game, "G1F3", "G8F6", "F3G1", "F6G8")
+        games = self.restart()
+        recovered = games.get(game_id)
+        self.assertEqual(game.board.to_fen(), recovered.board.to_fen())
+        self.assertEqual("threefold repetition", recovered.status())
+        self.assertEqual("F6G8", recovered.last_move.to_notation())
+        self.assertEqual(game.history.records, recovered.history.records)
+
+    def test_unmove_reset_and_delete(self):
+        games = self.open(fsync="always")
+        first_id, first = games.create()
+        second_id, second = games.create()
+        self.play(first, "E2E4")
+        first.unmove(first.move(Move.from_notation("E7E5")))
+        self.play(second, "D2D4")
+        second.reset()
+        games.remove(second_id)
+        games = self.restart()
+        self.assertNotIn(second_id, games)
+        self.assertEqual(1, len(games.get(first_id).history))
+        self.assertEqual(Color.black, games.get(first_id).cur_player)
+
+    def test_torn_record(self):
+        games = self.open()
+        game_id, game = games.create()
+        self.play(game, "E2E4", "E7E5")
+        self.stores[-1].close()
+        log = os.path.join(self.path, "wal-00000000.log")
+        size = os.path.getsize(log)
+        with open(log, "r+b") as f:
+            f.truncate(size - 3)
+        games = self.open()
+        self.assertEqual(1, len(games.get(game_id).history))
+        self.play(games.get(game_id), "D7D5")
+        games = self.restart()
+        self.assertEqual("D7D5", games.get(game_id).last_move.to_notation())
+
+    def test_checkpoint_due(self):
+        games = self.open(snapshot_records=3)
+        game_id, game = games.create()
+        self.play(game, "E2E4")
+        games.checkpoint_if_due()
+        self.assertFalse(os.path.exists(os.path.join(self.path, "snapshot.bin")))
+        self.play(game, "E7E5")
+        games.checkpoint_if_due()
+        self.assertTrue(os.path.exists(os.path.join(self.path, "snapshot.bin")))
+        self.assertFalse(self.stores[-1].checkpoint_due)
+
+    def test_idle_games_reloaded(self):
+        games = self.open(fsync="always")
+        game_id, game = games.create()
+        other_id, other = games.create()
+        self.play(game, "E2E4", "E7E5")
+        self.play(other, "D2D4")
+        game.last_access -= 2 * games.idle_seconds
+        self.assertEqual([game_id], games.evict_idle())
+        self.assertNotIn(game_id, games.games)
+        self.assertIn(game_id, games)
+        self.assertIn(game_id, games.ids())
+        # a checkpoint while it's evicted still keeps it
+        games.checkpoint()
+        reloaded = games.get(game_id)
+        self.assertIsNot(game, reloaded)
+        self.assertEqual(game.board.to_fen(), reloaded.board.to_fen())
+        self.assertEqual(2, len(reloaded.history))
+        # and it carries on logging its moves
+        self.play(reloaded, "G1F3")
+        games = self.restart()
+        self.assertEqual(3, len(games.get(game_id).history))
+        self.assertEqual(1, len(games.get(other_id).history))
+
+    def test_evicted_games_deleted(self):
+        games = self.open(fsync="always")
+        game_id, game = games.create()
+        game.last_access -= 2 * games.idle_seconds
+        games.evict_idle()
+        self.assertIsNotNone(games.remove(game_id))
+        self.assertNotIn(game_id, games)
+        self.assertIsNone(games.get(game_id))
+        games = self.restart()
+        self.assertNotIn(game_id, games)
+
+    def test_interval_sync(self):
+        games = self.open(fsync="interval", interval_seconds=0.05)
+        game_id, game = games.create()
+        self.play(game, "E2E4")
+        store = self.stores[-1]
+        self.assertGreater(store.unsynced, 0)
+        # synced once the interval is up, without waiting for another record
+        deadline = time.monotonic() + 5
+        while store.unsynced and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(0, store.unsynced)
+
+    def test_fsync_policy(self):
+        with self.assertRaises(ValueError):
+            persistence.Store(self.path, fsync="sometimes")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,7 @@
 import unittest
 import chess
 import itertools
+import pickle
 from chess import Position
 
 class PositionTest(unittest.TestCase):
@@ -49,8 +50,46 @@ class PositionTest(unittest.TestCase):
             self.assertEqual(position.row, row)
             self.assertEqual(position.col, col)
 
+    def test_interned(self):
+        for row, position_row in enumerate(self.positions):
+            for col, position in enumerate(position_row):
+                self.assertIs(position, Position(row, col))
+                self.assertIs(position, Position.from_notation(str(position)))
+                self.assertIs(position, pickle.loads(pickle.dumps(position)))
+
+    def test_hash(self):
+        # the hash is the square index, so no two positions collide
+        self.assertSetEqual(set(range(64)), {hash(position) for position in self.flat_positions})
+
+    def test_immutable(self):
+        with self.assertRaises(AttributeError):
+            Position(0, 0).row = 3
+
+    def test_off_board(self):
+        self.assertIs(chess.OFF_BOARD, Position(-1, 4))
+        self.assertIs(chess.OFF_BOARD, Position(3, 8))
+        self.assertIs(chess.OFF_BOARD, Position(7, 7) + (1, 0))
+        self.assertIs(chess.OFF_BOARD, chess.OFF_BOARD + (1, 1))
+        self.assertNotIn(chess.OFF_BOARD, self.flat_positions)
+        self.assertIs(chess.OFF_BOARD, pickle.loads(pickle.dumps(chess.OFF_BOARD)))
+        # it can't stand in for a square, H8 or any other
+        board = chess.Board.from_notation(chess.STARTING_NOTATION)
+        with self.assertRaises(TypeError):
+            board.at(chess.OFF_BOARD)
+
+    def test_from_notation_invalid(self):
+        for notation in ["", "I1", "A9", "A", "A10"]:
+            with self.assertRaises(ValueError):
+                Position.from_notation(notation)
+
     def test_add(self):
-        pass
+        for position in self.flat_positions:
+            for offset in [(1, 0), (0, -1), (2, 1), (-1, -1)]:
+                moved = position + offset
+                expected_in_bounds = 0 <= position.row + offset[0] < 8 and 0 <= position.col + offset[1] < 8
+                self.assertEqual(expected_in_bounds, moved.in_bounds)
+                if moved.in_bounds:
+                    self.assertEqual(offset, moved - position)
 
     def test_pass(self):
         pass
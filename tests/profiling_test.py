@@ -0,0 +1,73 @@
+import unittest
+import time
+import chess
+import perft
+import profiling
+
+class RequestProfilerTest(unittest.TestCase):
+
+    def test_off(self):
+        profiler = profiling.RequestProfiler()
+        self.assertIsNone(profiler.start("/move"))
+        profiler.stop(None)
+        self.assertEqual({}, profiler.report()["routes"])
+
+    def test_configure(self):
+        profiler = profiling.RequestProfiler.from_environment({"CHESS_PROFILE": "0.5", "CHESS_PROFILE_MODE": "cprofile"})
+        self.assertEqual((0.5, "cprofile"), (profiler.fraction, profiler.mode))
+        with self.assertRaises(ValueError):
+            profiler.configure(fraction=1.5)
+        with self.assertRaises(ValueError):
+            profiler.configure(mode="guess")
+        self.assertEqual((0.5, "cprofile"), (profiler.fraction, profiler.mode))
+
+    def test_cprofile(self):
+        profiler = profiling.RequestProfiler(1.0, "cprofile")
+        for index in range(2):
+            token = profiler.start("/move")
+            perft.perft(chess.Board.from_fen(chess.STARTING_FEN), 2)
+            profiler.stop(token)
+        route = profiler.report()["routes"]["/move"]
+        self.assertEqual(2, route["requests"])
+        self.assertTrue(any("perft" in function["function"] for function in route["functions"]))
+
+    def test_stacks(self):
+        profiler = profiling.RequestProfiler(1.0, sample_seconds=0.001)
+        token = profiler.start("/board")
+        end = time.perf_counter() + 0.1
+        while time.perf_counter() < end:
+            perft.perft(chess.Board.from_fen(chess.STARTING_FEN), 2)
+        profiler.stop(token)
+        profiler.configure(fraction=0)
+        lines = profiler.collapsed().splitlines()
+        self.assertTrue(lines)
+        stack, _, count = lines[0].rpartition(" ")
+        self.assertTrue(stack.startswith("/board;"))
+        self.assertGreater(int(count), 0)
+        self.assertTrue(any("profiling_test.py:RequestProfilerTest.test_stacks" in line for line in lines))
+        self.assertIn("samples", profiler.report()["routes"]["/board"])
+
+
+class MovegenTest(unittest.TestCase):
+
+    def tearDown(self):
+        profiling.uninstrument_movegen()
+        profiling.reset_movegen_timings()
+
+    def test_instrument(self):
+        legal_moves = chess.Board.__dict__["legal_moves"]
+        possible_moves = chess.Pawn.__dict__["possible_moves"]
+        profiling.instrument_movegen()
+        self.assertTrue(profiling.movegen_instrumented())
+        self.assertEqual(20, perft.perft(chess.Board.from_fen(chess.STARTING_FEN), 1))
+        timings = profiling.movegen_timings()
+        self.assertEqual(1, timings["Board.legal_moves"]["calls"])
+        self.assertEqual(8, timings["Pawn.possible_moves"]["calls"])
+        self.assertEqual(1, timings["Board.from_fen"]["calls"])
+        profiling.uninstrument_movegen()
+        self.assertIs(legal_moves, chess.Board.__dict__["legal_moves"])
+        self.assertIs(possible_moves, chess.Pawn.__dict__["possible_moves"])
+        self.assertFalse(profiling.movegen_instrumented())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,402 @@
+import unittest
+import json
+from unittest import mock
+import chess
+from chess import Color, Move
+
+try:
+    import server
+except ImportError:
+    server = None
+
+@unittest.skipIf(server is None, "flask is not installed")
+class GameTest(unittest.TestCase):
+
+    def setUp(self):
+        self.game = server.Game()
+
+    def play(self, *notations):
+        for notation in notations:
+            self.game.move(Move.from_notation(notation))
+
+    def test_move(self):
+        self.play("E2E4")
+        self.assertEqual(Color.black, self.game.cur_player)
+        self.assertEqual(2, len(self.game.keys))
+        self.assertEqual("playing", self.game.status())
+
+    def test_threefold_repetition(self):
+        shuffle = ["G1F3", "G8F6", "F3G1", "F6G8"]
+        self.play(*shuffle)
+        self.assertEqual("playing", self.game.status())
+        self.play(*shuffle)
+        self.assertEqual("threefold repetition", self.game.status())
+
+    def test_fifty_move_rule(self):
+        self.game.board.halfmove_clock = 99
+        self.play("G1F3")
+        self.assertEqual("fifty move rule", self.game.status())
+
+    def test_checkmate(self):
+        self.play("F2F3", "E7E5", "G2G4", "D8H4")
+        self.assertEqual("checkmate", self.game.status())
+
+    def test_version(self):
+        version = self.game.version
+        self.play("E2E4")
+        self.assertEqual(version + 1, self.game.version)
+        self.assertEqual("E2E4", self.game.event()["move"])
+        self.game.reset()
+        self.assertEqual(version + 2, self.game.version)
+        self.assertIsNone(self.game.event()["move"])
+
+    def test_state_cached(self):
+        state, body = self.game.state()
+        self.assertIs(body, self.game.state()[1])
+        self.play("E2E4")
+        self.assertIsNot(body, self.game.state()[1])
+        self.assertEqual("black", self.game.state()[0]["current_player"])
+
+    def test_unmove(self):
+        state, body = self.game.state()
+        version = self.game.version
+        undo = self.game.move(Move.from_notation("E2E4"))
+        self.game.unmove(undo)
+        self.assertEqual(version, self.game.version)
+        self.assertEqual(body, self.game.state()[1])
+        self.assertEqual(1, len(self.game.keys))
+
+    def test_history(self):
+        self.play("E2E4", "E7E5", "G1F3")
+        self.assertEqual(3, len(self.game.history))
+        ply, timestamp, move, piece = self.game.history.read(1, 1)[0]
+        self.assertEqual((1, "E7E5", "P"), (ply, move.to_notation(), piece))
+        self.assertEqual(["G1F3"], [record[2].to_notation() for record in self.game.history.read(2)])
+        self.game.unmove(self.game.move(Move.from_notation("B8C6")))
+        self.assertEqual(3, len(self.game.history))
+
+    def test_moves_since(self):
+        etag = self.game.etag
+        self.play("E2E4", "E7E5")
+        self.assertEqual(["E2E4", "E7E5"], [move.to_notation() for move in self.game.moves_since(etag, 2)])
+        self.assertEqual([], self.game.moves_since(self.game.etag, 2))
+        self.assertIsNone(self.game.moves_since(etag, 1))
+        self.assertIsNone(self.game.moves_since("elsewhere-1", 2))
+        self.game.reset()
+        self.assertIsNone(self.game.moves_since(etag, 2))
+
+    def test_legal_moves_cached(self):
+        moves = self.game.legal_moves()
+        self.assertEqual(20, len(moves))
+        self.assertIs(moves, self.game.legal_moves())
+        body = self.game.moves_body(chess.Position.from_notation("G1"))
+        self.assertIs(body, self.game.moves_body(chess.Position.from_notation("G1")))
+        self.assertEqual(["G1F3", "G1H3"], sorted(json.loads(body)["moves"]))
+        # unmoving brings back the version number, but not the moves cached for it
+        self.game.unmove(self.game.move(Move.from_notation("E2E4")))
+        self.play("G1F3")
+        self.assertEqual(20, len(self.game.legal_moves()))
+        self.assertEqual([], json.loads(self.game.moves_body(chess.Position.from_notation("G1")))["moves"])
+        self.game.reset()
+        self.assertEqual(["G1F3", "G1H3"],
+                         sorted(json.loads(self.game.moves_body(chess.Position.from_notation("G1")))["moves"]))
+
+    def test_reset(self):
+        self.play("E2E4")
+        self.game.reset()
+        self.assertEqual(1, len(self.game.keys))
+        self.assertEqual(Color.white, self.game.cur_player)
+
+
+@unittest.skipIf(server is None, "flask is not installed")
+class GameRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.games = server.GameRegistry(idle_seconds=60)
+
+    def test_create(self):
+        first_id, first = self.games.create()
+        second_id, second = self.games.create()
+        self.assertNotEqual(first_id, second_id)
+        self.assertIs(first, self.games.get(first_id))
+        self.assertIs(second, self.games.get(second_id))
+        self.assertEqual(2, len(self.games))
+        self.assertIsNot(first.lock, second.lock)
+
+    def test_remove(self):
+        game_id, game = self.games.create()
+        self.assertIs(game, self.games.remove(game_id))
+        self.assertIsNone(self.games.get(game_id))
+        self.assertIsNone(self.games.remove(game_id))
+
+    def test_evict_idle(self):
+        pinned_id, pinned = self.games.create("pinned", pinned=True)
+        idle_id, idle = self.games.create()
+        active_id, active = self.games.create()
+        pinned.last_access -= 120
+        idle.last_access -= 120
+        self.assertListEqual([idle_id], self.games.evict_idle())
+        self.assertNotIn(idle_id, self.games)
+        self.assertIn(pinned_id, self.games)
+        self.assertIn(active_id, self.games)
+
+
+@unittest.skipIf(server is None, "flask is not installed")
+class RoutesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = server.app.test_client()
+        self.get("/reset")
+
+    def get(self, url):
+        return json.loads(self.client.get(url).data.decode("utf8"))
+
+    def post(self, url):
+        return json.loads(self.client.post(url).data.decode("utf8"))
+
+    def test_move(self):
+        resp = self.get("/move?begin=E2&end=E4")
+        self.assertNotIn("error", resp)
+        self.assertEqual("black", resp["current_player"])
+        self.assertEqual("WP", resp["board"][3][4])
+
+    def test_illegal_move(self):
+        self.assertIn("error", self.get("/move?begin=E2&end=E5"))
+        self.assertIn("error", self.get("/move?begin=E7&end=E5"))
+        self.assertIn("error", self.get("/move?begin=Z9&end=E5"))
+
+    def test_en_passant(self):
+        for begin, end in [("E2", "E4"), ("A7", "A6"), ("E4", "E5"), ("D7", "D5")]:
+            self.get("/move?begin=" + begin + "&end=" + end)
+        resp = self.get("/move?begin=E5&end=D6")
+        self.assertNotIn("error", resp)
+        self.assertEqual("", resp["board"][4][3])
+
+    def test_games(self):
+        game_id = self.post("/games")["id"]
+        self.assertIn(game_id, self.get("/games")["games"])
+        self.assertNotIn("error", self.get("/games/" + game_id + "/move?begin=E2&end=E4"))
+        self.assertEqual("black", self.get("/games/" + game_id + "/turn")["current_player"])
+        # the default game behind the single game routes is untouched
+        self.assertEqual("white", self.get("/turn")["current_player"])
+        self.client.delete("/games/" + game_id)
+        self.assertEqual(404, self.client.get("/games/" + game_id + "/board").status_code)
+
+    def post_json(self, url, body):
+        return json.loads(self.client.post(url, json=body).data.decode("utf8"))
+
+    def test_batch(self):
+        moves = [{"begin": "E2", "end": "E4"}, {"begin": "E7", "end": "E5"}, {"begin": "G1", "end": "F3"}]
+        resp = self.post_json("/batch", {"moves": moves})
+        self.assertEqual(3, resp["played"])
+        self.assertEqual(["E2E4", "E7E5", "G1F3"], [result["move"] for result in resp["results"]])
+        self.assertEqual("black", resp["games"]["default"]["current_player"])
+
+    def test_batch_stops_at_error(self):
+        moves = [{"begin": "E2", "end": "E4"}, {"begin": "E2", "end": "E4"}, {"begin": "E7", "end": "E5"}]
+        resp = self.post_json("/batch", {"moves": moves})
+        self.assertEqual(1, resp["played"])
+        self.assertIn("error", resp["results"][1])
+        self.assertIn("error", resp["results"][2])
+        self.assertEqual("black", self.get("/turn")["current_player"])
+
+    def test_batch_not_an_object(self):
+        for body in [[1, 2], "x", {"moves": "x"}]:
+            resp = self.client.post("/batch", data=json.dumps(body), content_type="application/json")
+            self.assertEqual(400, resp.status_code)
+            self.assertIn("error", json.loads(resp.data.decode("utf8")))
+
+    def test_batch_atomic(self):
+        version = server.games.get("default").version
+        other = self.post("/games")["id"]
+        moves = [{"begin": "E2", "end": "E4"}, {"game": other, "begin": "D2", "end": "D4"},
+                 {"game": other, "begin": "D2", "end": "D4"}]
+        resp = self.post_json("/batch", {"moves": moves, "atomic": True})
+        self.assertEqual(0, resp["played"])
+        self.assertTrue(all("error" in result for result in resp["results"]))
+        self.assertEqual("white", self.get("/turn")["current_player"])
+        self.assertEqual("white", self.get("/games/" + other + "/turn")["current_player"])
+        self.assertEqual(version, server.games.get("default").version)
+        self.assertListEqual(chess.STARTING_NOTATION, self.get("/games/" + other + "/board")["board"])
+
+    def test_batch_across_games(self):
+        other = self.post("/games")["id"]
+        moves = [{"begin": "E2", "end": "E4"}, {"game": other, "begin": "D2", "end": "D4"}]
+        resp = self.post_json("/batch", {"moves": moves, "atomic": True})
+        self.assertEqual(2, resp["played"])
+        self.assertEqual("WP", resp["games"][other]["board"][3][3])
+        self.assertEqual("WP", resp["games"]["default"]["board"][3][4])
+
+    def test_history(self):
+        for begin, end in [("E2", "E4"), ("E7", "E5"), ("G1", "F3")]:
+            self.get("/move?begin=" + begin + "&end=" + end)
+        resp = self.get("/history?since=1&limit=1")
+        self.assertEqual(2, resp["next"])
+        self.assertEqual(3, resp["total"])
+        move = resp["moves"][0]
+        self.assertEqual(("black", "pawn", "E7", "E5"), (move["player"], move["piece"], move["start"], move["end"]))
+        resp = self.get("/history?since=" + str(resp["next"]))
+        self.assertEqual(["G1F3"], [move["move"] for move in resp["moves"]])
+        self.assertEqual([], self.get("/history?since=3")["moves"])
+        self.assertEqual(400, self.client.get("/history?since=first").status_code)
+
+    def test_etag(self):
+        first = self.client.get("/board")
+        etag = first.headers["ETag"]
+        self.assertEqual(etag, self.client.get("/turn").headers["ETag"])
+        unchanged = self.client.get("/board", headers={"If-None-Match": etag})
+        self.assertEqual(304, unchanged.status_code)
+        self.assertEqual(b"", unchanged.data)
+
+        self.get("/move?begin=E2&end=E4")
+        changed = self.client.get("/board", headers={"If-None-Match": etag})
+        self.assertEqual(200, changed.status_code)
+        self.assertNotEqual(etag, changed.headers["ETag"])
+
+    def test_wire_formats(self):
+        self.get("/move?begin=E2&end=E4")
+        fen = self.client.get("/board", headers={"Accept": "application/x-chess-fen"})
+        self.assertEqual("application/x-chess-fen", fen.mimetype)
+        self.assertEqual("playing", fen.headers["X-Chess-Status"])
+        board = chess.Board.from_fen(fen.data.decode("ascii"))
+        self.assertEqual(Color.black, board.to_move)
+        self.assertEqual("WP", board.at(chess.Position.from_notation("E4")).to_notation())
+
+        packed = self.client.get("/board", headers={"Accept": "application/x-chess-packed"})
+        self.assertEqual(fen.data.decode("ascii"), chess.Board.from_packed(packed.data).to_fen())
+        self.assertNotEqual(fen.headers["ETag"], packed.headers["ETag"])
+        self.assertIn("Accept", packed.headers["Vary"])
+
+        illegal = self.client.get("/move?begin=E2&end=E4", headers={"Accept": "application/x-chess-packed"})
+        self.assertIn("X-Chess-Error", illegal.headers)
+        self.assertEqual(packed.data, illegal.data)
+
+    def test_changes(self):
+        version = self.get("/board")["version"]
+        self.get("/move?begin=E2&end=E4")
+        resp = self.get("/changes?since=" + version)
+        self.assertEqual(["E2E4"], resp["moves"])
+        self.assertEqual(self.get("/board")["version"], resp["version"])
+        resp = self.get("/changes?since=" + version + "&limit=0")
+        self.assertNotIn("moves", resp)
+        self.assertEqual(chess.Board.from_fen(resp["fen"]).to_notation(), self.get("/board")["board"])
+
+    def test_changes_etag(self):
+        version = self.get("/board")["version"]
+        unchanged = self.client.get("/changes?since=" + version, headers={"If-None-Match": version})
+        self.assertEqual((304, b""), (unchanged.status_code, unchanged.data))
+        self.get("/move?begin=E2&end=E4")
+        changed = self.client.get("/changes?since=" + version, headers={"If-None-Match": version})
+        self.assertEqual(200, changed.status_code)
+
+    def test_move_since(self):
+        version = self.get("/board")["version"]
+        resp = self.get("/move?begin=E2&end=E4&since=" + version)
+        self.assertNotIn("board", resp)
+        self.assertEqual(("black", self.get("/board")["version"]), (resp["current_player"], resp["version"]))
+        # an out of date client gets the whole board back
+        resp = self.get("/move?begin=E7&end=E5&since=" + version)
+        self.assertIn("board", resp)
+
+    def test_moves(self):
+        resp = self.client.get("/moves")
+        self.assertEqual(20, len(json.loads(resp.data.decode("utf8"))["moves"]))
+        self.assertEqual(304, self.client.get("/moves", headers={"If-None-Match": resp.headers["ETag"]}).status_code)
+        self.assertEqual(["E2E3", "E2E4"], sorted(self.get("/moves?from=e2")["moves"]))
+        self.assertEqual([], self.get("/moves?from=E7")["moves"])
+        self.assertEqual(400, self.client.get("/moves?from=Z9").status_code)
+        self.get("/move?begin=E2&end=E4")
+        resp = self.get("/moves?from=E7")
+        self.assertEqual(["E7E5", "E7E6"], sorted(resp["moves"]))
+        self.assertEqual("black", resp["current_player"])
+        self.get("/reset")
+        self.assertEqual([], self.get("/moves?from=E7")["moves"])
+
+    def test_promotion(self):
+        game = server.games.get(server.DEFAULT_GAME)
+        board = chess.Board.from_fen("1n2k3/P7/8/8/8/8/8/4K3 w - - 0 1")
+        game.restore(board.to_fen(), [board.key], b"")
+        for notation in ["K", "P", "X", ""]:
+            resp = self.get("/move?begin=A7&end=A8&promotion=" + notation)
+            self.assertEqual("you cannot promote to that!", resp["error"])
+        resp = self.get("/move?begin=A7&end=B8&promotion=N")
+        self.assertNotIn("error", resp)
+        self.assertEqual("WN", resp["board"][7][1])
+
+    def test_castling_through_check(self):
+        game = server.games.get(server.DEFAULT_GAME)
+        # the black rook covers the F file, so the king can neither castle across F1 nor step to F2
+        board = chess.Board.from_fen("4kr2/8/8/8/8/8/3P4/R3K2R w KQ - 0 1")
+        game.restore(board.to_fen(), [board.key], b"")
+        self.assertEqual("you cannot castle out of or through check!", self.get("/move?begin=E1&end=G1")["error"])
+        self.assertEqual("you cannot leave your king in check!", self.get("/move?begin=E1&end=F2")["error"])
+        self.assertNotIn("error", self.get("/move?begin=E1&end=C1"))
+
+    def test_legal_moves_generated_once(self):
+        self.get("/board")
+        with mock.patch.object(chess.Board, "legal_moves", autospec=True,
+                               side_effect=chess.Board.legal_moves) as legal_moves:
+            # the answer to a move includes the status of the new position, which is all that's generated
+            self.get("/move?begin=E2&end=E4")
+            self.assertEqual(1, legal_moves.call_count)
+            # and a bot retrying a bad move, or polling, only ever hits the cache
+            for retry in range(3):
+                self.assertIn("error", self.get("/move?begin=E2&end=E4"))
+            self.get("/turn")
+            self.get("/moves")
+            self.get("/board")
+            self.assertEqual(1, legal_moves.call_count)
+            self.get("/move?begin=E7&end=E5")
+            self.assertEqual(2, legal_moves.call_count)
+
+    def test_metrics(self):
+        self.get("/move?begin=E2&end=E4")
+        self.get("/move?begin=E2&end=E4")
+        self.get("/turn")
+        resp = self.client.get("/metrics")
+        self.assertTrue(resp.content_type.startswith("text/plain; version=0.0.4"))
+        self.assertGreaterEqual(server.stats.value("chess_requests_total", method="GET", route="/turn", status=200), 1)
+        self.assertGreaterEqual(server.stats.value("chess_rejected_moves_total", reason="no piece at position"), 1)
+        self.assertGreaterEqual(server.stats.value("chess_request_seconds", route="/move")[-1], 2)
+        text = resp.data.decode("utf8")
+        self.assertIn("# TYPE chess_move_check_seconds histogram", text)
+        self.assertIn("chess_games " + str(len(server.games)), text)
+
+    def test_profile(self):
+        self.assertEqual(403, self.client.post("/profile", json={"fraction": 1},
+                                               environ_base={"REMOTE_ADDR": "10.0.0.1"}).status_code)
+        self.assertEqual(400, self.client.post("/profile", json={"fraction": "all"}).status_code)
+        try:
+            self.assertEqual(200, self.client.post("/profile", json={"fraction": 1, "mode": "cprofile",
+                                                                     "movegen": True, "reset": True}).status_code)
+            self.get("/move?begin=E2&end=E4")
+            report = self.get("/profile")
+            self.assertEqual(1, report["routes"]["/move"]["requests"])
+            self.assertIn("Board.legal_moves", report["movegen"])
+        finally:
+            self.client.post("/profile", json={"fraction": 0, "mode": "stacks", "movegen": False, "reset": True})
+        self.assertEqual({}, self.get("/profile")["movegen"])
+        self.assertEqual("text/plain", self.client.get("/profile/stacks").mimetype)
+
+    def test_events(self):
+        self.get("/move?begin=E2&end=E4")
+        resp = self.client.get("/events?since=0", buffered=False)
+        self.assertEqual("text/event-stream", resp.mimetype)
+        stream = iter(resp.response)
+        header = next(stream).decode("utf8")
+        event = json.loads(next(stream).decode("utf8").strip()[len("data: "):])
+        resp.close()
+        self.assertIn("event: move", header)
+        self.assertEqual("E2E4", event["move"])
+        self.assertEqual("black", event["current_player"])
+        self.assertIn("id: " + str(event["version"]), header)
+
+    def test_game_over(self):
+        for begin, end in [("F2", "F3"), ("E7", "E5"), ("G2", "G4"), ("D8", "H4")]:
+            resp = self.get("/move?begin=" + begin + "&end=" + end)
+        self.assertEqual("checkmate", resp["status"])
+        self.assertIn("error", self.get("/move?begin=E2&end=E4"))
+        self.assertEqual([], self.get("/moves")["moves"])
+
+if __name__ == '__main__':
+    unittest.main()
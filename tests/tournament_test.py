@@ -0,0 +1,45 @@
+import unittest
+import os
+import tempfile
+import tournament
+
+def resigning_bot(board, color):
+    return "E2E5"
+
+class TournamentTest(unittest.TestCase):
+
+    def test_schedule(self):
+        self.assertEqual(6, len(tournament.schedule(["a", "b", "c"])))
+        gauntlet = tournament.schedule(["a", "b", "c"], "gauntlet", rounds=2)
+        self.assertEqual(8, len(gauntlet))
+        self.assertTrue(all("a" in (white, black) for number, white, black in gauntlet))
+        self.assertEqual(list(range(8)), [number for number, white, black in gauntlet])
+
+    def test_play_game(self):
+        record = tournament.play_game(0, "random_bot", "capture_bot", max_plies=40)
+        self.assertLessEqual(record["plies"], 40)
+        self.assertEqual(record["plies"], len(record["moves"]))
+        self.assertIn(record["result"], ["1-0", "0-1", "1/2-1/2"])
+        self.assertEqual(record, dict(tournament.play_game(0, "random_bot", "capture_bot", max_plies=40),
+                                      seconds=record["seconds"], thinking=record["thinking"]))
+
+    def test_illegal_move(self):
+        record = tournament.play_game(0, "random_bot", resigning_bot)
+        self.assertEqual(("1-0", 1), (record["result"], record["plies"]))
+        self.assertTrue(record["reason"].startswith("illegal move"))
+
+    def test_resume(self):
+        with tempfile.TemporaryDirectory() as path:
+            results = os.path.join(path, "results.jsonl")
+            bots = ["random_bot", "capture_bot"]
+            first = list(tournament.run_tournament(bots, processes=2, results_path=results, max_plies=20))
+            self.assertEqual(2, len(first))
+            more = list(tournament.run_tournament(bots, rounds=2, processes=2, results_path=results, max_plies=20))
+            self.assertEqual(2, len([record for record in more if record.get("resumed")]))
+            self.assertEqual([0, 1, 2, 3], sorted(record["game"] for record in more))
+            rows = tournament.standings(more)
+            self.assertEqual(4, sum(row[1] for row in rows))
+            self.assertEqual({"tournament:random_bot", "tournament:capture_bot"}, {row[0] for row in rows})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+import chess
+import perft
+from chess import Board, Color, Position, Move
+from bitboard import BitBoard
+
+class ZobristTest(unittest.TestCase):
+
+    def assertKeysConsistent(self, board, depth):
+        self.assertEqual(board.compute_key(), board.key)
+        if depth == 0:
+            return
+        for move in board.legal_moves():
+            key = board.key
+            undo = board.make(move)
+            self.assertNotEqual(key, board.key)
+            self.assertKeysConsistent(board, depth - 1)
+            board.unmake(undo)
+            self.assertEqual(key, board.key)
+
+    def test_incremental(self):
+        for name in ["kiwipete", "position4", "position5"]:
+            fen, expected = perft.POSITIONS[name]
+            self.assertKeysConsistent(Board.from_fen(fen), 2)
+
+    def test_bitboard(self):
+        fen, expected = perft.POSITIONS["kiwipete"]
+        self.assertEqual(Board.from_fen(fen).key, BitBoard.from_fen(fen).key)
+        self.assertKeysConsistent(BitBoard.from_fen(fen), 1)
+
+    def test_from_notation(self):
+        self.assertEqual(Board.from_fen(chess.STARTING_FEN).key, Board.from_notation(chess.STARTING_NOTATION).key)
+
+    def test_transposition(self):
+        first = Board.from_fen(chess.STARTING_FEN)
+        for notation in ["G1F3", "G8F6", "B1C3"]:
+            first.make(Move.from_notation(notation))
+        second = Board.from_fen(chess.STARTING_FEN)
+        for notation in ["B1C3", "G8F6", "G1F3"]:
+            second.make(Move.from_notation(notation))
+        self.assertEqual(first.key, second.key)
+
+    def test_side_to_move(self):
+        board = Board.from_fen(chess.STARTING_FEN)
+        key = board.key
+        board.to_move = Color.black
+        self.assertNotEqual(key, board.key)
+
+    def test_castling_rights(self):
+        board = Board.from_fen(chess.STARTING_FEN)
+        key = board.key
+        board.castling = "Qkq"
+        self.assertNotEqual(key, board.key)
+
+    def test_en_passant(self):
+        # e2e4 leaves an en passant square nobody can capture on, so it isn't part of the key
+        board = Board.from_fen(chess.STARTING_FEN)
+        board.make(Move.from_notation("E2E4"))
+        self.assertEqual(Board.from_fen(board.to_fen().replace(" e3 ", " - ")).key, board.key)
+
+        board = Board.from_fen("4k3/8/8/8/3p4/8/4P3/4K3 w - - 0 1")
+        board.make(Move.from_notation("E2E4"))
+        self.assertNotEqual(Board.from_fen(board.to_fen().replace(" e3 ", " - ")).key, board.key)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,194 @@
+import argparse
+import importlib
+import json
+import os
+import random
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import chess
+from chess import Board, Move
+
+# games still going after this many plies are scored as draws
+MAX_PLIES = 300
+
+
+def random_bot(board, color):
+    """plays a random legal move, the baseline every other bot ought to beat"""
+    return random.choice(board.legal_moves(color))
+
+def capture_bot(board, color):
+    """takes the most valuable piece it can, otherwise plays randomly"""
+    moves = board.legal_moves(color)
+    captures = [move for move in moves if board.at(move.end) is not None]
+    if captures:
+        return max(captures, key=lambda move: "PNBRQK".index(board.at(move.end).NOTATION))
+    return random.choice(moves)
+
+
+def bot_name(bot):
+    """how a bot is named in results, "module:function" """
+    if isinstance(bot, str):
+        return bot if ":" in bot else "tournament:" + bot
+    return bot.__module__ + ":" + bot.__qualname__
+
+def load_bot(bot):
+    """the bot callable for a "module:function" name, or the bot itself if it already is one.
+    bots take a copy of the board and the color to play, and return a Move or its notation"""
+    if not isinstance(bot, str):
+        return bot
+    module_name, _, function_name = bot_name(bot).partition(":")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def schedule(names, mode="roundrobin", rounds=1):
+    """the pairings to play, as (game number, white, black). round robin plays every bot against
+    every other with both colors, a gauntlet plays the first bot against each of the rest"""
+    if mode == "roundrobin":
+        pairs = [(white, black) for white in names for black in names if white != black]
+    elif mode == "gauntlet":
+        challenger = names[0]
+        pairs = [pair for opponent in names[1:] for pair in [(challenger, opponent), (opponent, challenger)]]
+    else:
+        raise ValueError("unknown tournament mode: " + str(mode))
+    return [(number, white, black) for number, (white, black) in enumerate(pairs * rounds)]
+
+
+def play_game(number, white, black, max_plies=MAX_PLIES, seed=None):
+    """plays one game between two bots, returning the result record. a bot that raises or makes
+    an illegal move loses on the spot"""
+    random.seed(number if seed is None else seed)
+    bots = {chess.Color.white: load_bot(white), chess.Color.black: load_bot(black)}
+    board = Board.from_fen(chess.STARTING_FEN)
+    repetitions = Counter([board.key])
+    thinking = {chess.Color.white: 0.0, chess.Color.black: 0.0}
+    moves = []
+    start = time.perf_counter()
+    result, reason = "1/2-1/2", "move limit"
+    while len(moves) < max_plies:
+        color = board.to_move
+        status = board.status(color)
+        if status == "checkmate":
+            result, reason = ("0-1" if color is chess.Color.white else "1-0"), status
+            break
+        if status in chess.DRAWS or repetitions[board.key] >= 3 or board.halfmove_clock >= 100:
+            reason = status if status in chess.DRAWS else ("threefold repetition" if repetitions[board.key] >= 3
+                                                             else "fifty move rule")
+            break
+        move_start = time.perf_counter()
+        try:
+            move = bots[color](Board.from_fen(board.to_fen()), color)
+            move = Move.from_notation(move) if isinstance(move, str) else move
+            legal = move in board.legal_moves(color)
+        except Exception as e:
+            legal, move = False, e
+        thinking[color] += time.perf_counter() - move_start
+        if not legal:
+            result, reason = ("0-1" if color is chess.Color.white else "1-0"), "illegal move: " + str(move)
+            break
+        board.make(move)
+        repetitions[board.key] += 1
+        moves.append(move.to_notation())
+    return {"game": number, "white": white, "black": black, "result": result, "reason": reason,
+            "plies": len(moves), "seconds": time.perf_counter() - start, "moves": moves,
+            "thinking": {"white": thinking[chess.Color.white], "black": thinking[chess.Color.black]}}
+
+def _play(args):
+    return play_game(*args)
+
+
+def load_results(path):
+    """the games already recorded in a results file, by game number"""
+    results = {}
+    if path and os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # a line cut short when the last run was interrupted
+                    continue
+                results[record["game"]] = record
+    return results
+
+def run_tournament(bots, mode="roundrobin", rounds=1, processes=None, results_path=None, max_plies=MAX_PLIES):
+    """plays every pairing across a process pool, yielding each result as it finishes. results
+    are appended to results_path as json lines, and games already there aren't played again,
+    so an interrupted tournament picks up where it left off"""
+    names = [bot_name(bot) for bot in bots]
+    recorded = load_results(results_path)
+    games = []
+    for number, white, black in schedule(names, mode, rounds):
+        record = recorded.get(number)
+        if record and (record["white"], record["black"]) == (white, black):
+            yield dict(record, resumed=True)
+        else:
+            games.append((number, white, black, max_plies))
+    if not games:
+        return
+    out = open(results_path, "a") if results_path else None
+    try:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            for future in as_completed([pool.submit(_play, game) for game in games]):
+                record = future.result()
+                if out:
+                    out.write(json.dumps(record) + "\n")
+                    out.flush()
+                yield record
+    finally:
+        if out:
+            out.close()
+
+
+def standings(records):
+    """score table rows of (name, points, wins, draws, losses, average seconds per move), best first"""
+    table = {}
+    for record in records:
+        for color in ["white", "black"]:
+            row = table.setdefault(record[color], {"points": 0.0, "wins": 0, "draws": 0, "losses": 0,
+                                                   "thinking": 0.0, "moves": 0})
+            if record["result"] == "1/2-1/2":
+                row["points"] += 0.5
+                row["draws"] += 1
+            elif record["result"] == ("1-0" if color == "white" else "0-1"):
+                row["points"] += 1
+                row["wins"] += 1
+            else:
+                row["losses"] += 1
+            row["thinking"] += record["thinking"][color]
+            # white makes the odd plies and black the even ones
+            row["moves"] += (record["plies"] + (color == "white")) // 2
+    return sorted([(name, row["points"], row["wins"], row["draws"], row["losses"],
+                    row["thinking"] / max(row["moves"], 1)) for name, row in table.items()],
+                  key=lambda row: -row[1])
+
+def report(records, elapsed):
+    records = list(records)
+    played = len([record for record in records if not record.get("resumed")])
+    print("{} games played in {:.1f}s, {:.1f} games/sec, {} more from earlier runs".format(
+        played, elapsed, played / max(elapsed, 1e-9), len(records) - played))
+    print("{:40s} {:>7s} {:>5s} {:>5s} {:>5s} {:>12s}".format("bot", "points", "won", "drawn", "lost", "ms/move"))
+    for name, points, wins, draws, losses, latency in standings(records):
+        print("{:40s} {:7.1f} {:5d} {:5d} {:5d} {:12.3f}".format(name, points, wins, draws, losses, latency * 1000))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="plays bots against each other across every core")
+    parser.add_argument("bots", nargs="+", help="bots as module:function, e.g. tournament:random_bot")
+    parser.add_argument("--mode", choices=["roundrobin", "gauntlet"], default="roundrobin",
+                        help="everyone against everyone, or the first bot against each of the rest")
+    parser.add_argument("--rounds", type=int, default=1, help="how many times to play each pairing")
+    parser.add_argument("--processes", type=int, default=None, help="worker processes, every core by default")
+    parser.add_argument("--max-plies", type=int, default=MAX_PLIES, help="score longer games as draws")
+    parser.add_argument("--results", help="json lines file to record games in, and to resume from")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    records = []
+    for record in run_tournament(args.bots, args.mode, args.rounds, args.processes, args.results, args.max_plies):
+        records.append(record)
+        if record.get("resumed"):
+            continue
+        print("game {:4d}: {} vs {}: {} ({}, {} plies)".format(record["game"], record["white"], record["black"],
+                                                             record["result"], record["reason"], record["plies"]))
+    report(records, time.perf_counter() - start)